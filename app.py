@@ -1,32 +1,38 @@
-from flask import Flask, render_template, Response, jsonify, request, redirect, url_for, flash, send_file
-import cv2
+from flask import Flask, Blueprint, render_template, Response, jsonify, request, redirect, url_for, flash, send_file, current_app
 import numpy as np
 from datetime import datetime
 import os
+import time
+import uuid
 import atexit
+import threading
+from functools import partial
+import importlib.util
 from werkzeug.utils import secure_filename
-from models import db, Student, Course, Attendance
+from werkzeug.formparser import parse_form_data
+from models import db, Student, Course, Attendance, GalleryVersion, UploadSession
+from sqlalchemy.exc import DBAPIError, IntegrityError
 import csv
 from io import StringIO
 DEMO_MODE = os.getenv('DEMO_MODE', '0') == '1'
 
-# Optional imports for demo-friendly deployment (e.g., Railway). If face_recognition
-# stack is unavailable, fall back to a lightweight no-op implementation.
-FaceRecognitionService = None
-try:
-    if not DEMO_MODE:
-        from face_recognition_service import FaceRecognitionService  # heavy deps (dlib)
-except Exception:
-    FaceRecognitionService = None
-
-from background_jobs import BackgroundJobManager
-from email_service import EmailService
+# Optional face recognition stack for demo-friendly deployment (e.g., Railway).
+# It is only looked up here; dlib and OpenCV are imported on first use, and
+# without them a lightweight no-op implementation is used instead.
+FACE_RECOGNITION_AVAILABLE = not DEMO_MODE and importlib.util.find_spec('face_recognition') is not None
+
 import zipfile
 from io import BytesIO
 from flask_mail import Mail
 from config import config
-from database_manager import DatabaseManager, register_cli_commands
-from apscheduler.schedulers.background import BackgroundScheduler
+from database_manager import DatabaseManager
+from camera import CameraStream, UploadedFrameStream, FrameBroadcaster
+from capture_sessions import CaptureSession, CaptureSessionRegistry, UploadLimiter, DEFAULT_ROOM
+from face_tracking import PreviewFaceDetector, detect_frame_faces, haar_faces
+from continuous_attendance import ContinuousAttendance
+from recognition_jobs import RecognitionJobQueue, JobQueueFull
+from recognition_pool import RecognitionPool, RecognitionPoolBusy
+from capture_store import CaptureWriter
 
 # Import CLI commands
 import cli_monitor
@@ -35,124 +41,318 @@ import cli_commands
 # Get the absolute path of the current directory
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Get the environment setting
-env = os.getenv('FLASK_ENV', 'development')
-
-# Application configuration
-app = Flask(__name__)
-app.config.from_object(config[env])
-app.secret_key = 'your-secret-key-here'  # Required for flash messages
-
-# Email configuration (read from environment for deployments)
-app.config.update(
-    MAIL_SERVER=os.getenv('MAIL_SERVER', 'smtp.gmail.com'),
-    MAIL_PORT=int(os.getenv('MAIL_PORT', '465')),
-    MAIL_USE_SSL=os.getenv('MAIL_USE_SSL', 'true').lower() == 'true',
-    MAIL_USE_TLS=os.getenv('MAIL_USE_TLS', 'false').lower() == 'true',
-    MAIL_USERNAME=os.getenv('MAIL_USERNAME', ''),
-    MAIL_PASSWORD=os.getenv('MAIL_PASSWORD', ''),
-    MAIL_DEFAULT_SENDER=os.getenv('MAIL_DEFAULT_SENDER', os.getenv('MAIL_USERNAME', ''))
-)
-
-# Initialize Flask-Mail
-mail = Mail(app)
-
-# Print email configuration status
-if (app.config['MAIL_USERNAME'] == 'your-email@gmail.com' or 
-    app.config['MAIL_PASSWORD'] == 'your-app-password'):
-    print("\nEMAIL CONFIGURATION REQUIRED:")
-    print("1. Go to your Google Account settings")
-    print("2. Enable 2-Step Verification if not already enabled")
-    print("3. Generate an App Password:")
-    print("   - Go to Security > App passwords")
-    print("   - Select 'Mail' and 'Windows Computer'")
-    print("   - Click 'Generate'")
-    print("\nThen update these lines in app.py:")
-    print("    MAIL_USERNAME='your-email@gmail.com'")
-    print("    MAIL_PASSWORD='your-app-password'")
-    print("    MAIL_DEFAULT_SENDER='your-email@gmail.com'\n")
+# Services create_app() can start: the face recognition service, the background
+# job scheduler (pending attendance, cleanup, backups) and the email service
+ALL_SERVICES = ('face', 'jobs', 'email')
 
 # Create necessary directories
 UPLOAD_FOLDER = 'static/uploads/students'
 CAPTURES_FOLDER = 'static/captures'  # New folder for captured images
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(CAPTURES_FOLDER, exist_ok=True)  # Create captures directory
-
-# Database configuration
-# Respect DATABASE_URL if provided via environment (e.g., Railway),
-# otherwise default to local SQLite.
-if not os.getenv('DATABASE_URL'):
-    DB_PATH = os.path.join(basedir, 'database', 'attendance.db')
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-
-# Initialize database manager
-db_manager = DatabaseManager(app)
-
-# Register CLI commands
-from cli_monitor import register_cli_commands
-register_cli_commands(app)
-
-# Global variables for video capture
-video_capture = None
-process_frames = False
-current_course_id = None
-current_frame = None  # Store the current frame for capture
-
-# Load the face detection cascade classifier
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-
-# Initialize services
-face_service = None
-job_manager = None
-email_service = None
+
+# Routes are registered on the app by create_app()
+bp = Blueprint('main', __name__, cli_group=None)
+
+def create_app(config_name=None, services=ALL_SERVICES, test_config=None):
+    """Create and configure the application.
+    
+    ``services`` lists the services (see ALL_SERVICES) to start before the
+    first request; nothing is started while the app is only imported or used
+    from the CLI. Scripts pass ``services=()`` and tests can use
+    ``create_app('testing', services=())`` for an in-memory database;
+    ``test_config`` overrides settings of the chosen config.
+    """
+    config_name = config_name or os.getenv('FLASK_ENV', 'development')
+    
+    # Application configuration
+    app = Flask(__name__)
+    app.config.from_object(config[config_name])
+    if test_config:
+        app.config.update(test_config)
+    app.secret_key = 'your-secret-key-here'  # Required for flash messages
+    
+    # Email configuration (read from environment for deployments)
+    app.config.update(
+        MAIL_SERVER=os.getenv('MAIL_SERVER', 'smtp.gmail.com'),
+        MAIL_PORT=int(os.getenv('MAIL_PORT', '465')),
+        MAIL_USE_SSL=os.getenv('MAIL_USE_SSL', 'true').lower() == 'true',
+        MAIL_USE_TLS=os.getenv('MAIL_USE_TLS', 'false').lower() == 'true',
+        MAIL_USERNAME=os.getenv('MAIL_USERNAME', ''),
+        MAIL_PASSWORD=os.getenv('MAIL_PASSWORD', ''),
+        MAIL_DEFAULT_SENDER=os.getenv('MAIL_DEFAULT_SENDER', os.getenv('MAIL_USERNAME', ''))
+    )
+    
+    # Initialize Flask-Mail
+    Mail(app)
+    
+    # Print email configuration status
+    if 'email' in services and (app.config['MAIL_USERNAME'] == 'your-email@gmail.com' or 
+            app.config['MAIL_PASSWORD'] == 'your-app-password'):
+        print("\nEMAIL CONFIGURATION REQUIRED:")
+        print("1. Go to your Google Account settings")
+        print("2. Enable 2-Step Verification if not already enabled")
+        print("3. Generate an App Password:")
+        print("   - Go to Security > App passwords")
+        print("   - Select 'Mail' and 'Windows Computer'")
+        print("   - Click 'Generate'")
+        print("\nThen update these lines in app.py:")
+        print("    MAIL_USERNAME='your-email@gmail.com'")
+        print("    MAIL_PASSWORD='your-app-password'")
+        print("    MAIL_DEFAULT_SENDER='your-email@gmail.com'\n")
+    
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(CAPTURES_FOLDER, exist_ok=True)  # Create captures directory
+    
+    # Database configuration
+    # The config respects DATABASE_URL if provided via environment (e.g., Railway),
+    # otherwise it defaults to local SQLite.
+    os.makedirs(os.path.join(basedir, 'database'), exist_ok=True)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    
+    # Initialize database manager
+    app.extensions['db_manager'] = DatabaseManager(app)
+    
+    # Register CLI commands
+    cli_monitor.register_cli_commands(app)
+    cli_commands.register_commands(app)
+    
+    app.register_blueprint(bp)
+    
+    # Initialize database on startup (only if tables don't exist)
+    init_db(app)
+    
+    # Services start before the first request, after the schema is up to
+    # date since the face service reads encodings from Student rows
+    app.extensions['services'] = AppServices(services)
+    atexit.register(app.extensions['services'].stop)
+    if services:
+        @app.before_request
+        def ensure_services_started():
+            if not app.extensions['services'].started:
+                initialize_services(app)
+    
+    return app
+
+def load_face_cascade():
+    """Load a face detection cascade classifier; each capture session gets its own"""
+    import cv2
+    return cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+def request_room():
+    """Room ID of a capture request: JSON body, query string or the default room"""
+    data = request.get_json(silent=True) or {}
+    return str(data.get('room') or request.args.get('room') or DEFAULT_ROOM)
+
+class AppServices:
+    """The services of one app, kept in ``app.extensions['services']``.
+    
+    Services are created on first use (see initialize_services). Each app
+    gets its own set, so a second create_app() never reuses services bound
+    to the first app.
+    """
+    
+    def __init__(self, enabled):
+        self.enabled = tuple(enabled)
+        self.lock = threading.RLock()
+        self.started = False
+        self.face_service = None
+        self.recognition_pool = None
+        self.recognition_jobs = None
+        self.capture_writer = None
+        self.job_manager = None
+        self.email_service = None
+        # Capture sessions (camera, stream, course, hands-free recognition) per room
+        self.capture_sessions = CaptureSessionRegistry()
+    
+    def stop(self):
+        """Stop whatever the app started; registered with atexit"""
+        self.capture_sessions.close_all()
+        if self.recognition_jobs:
+            self.recognition_jobs.stop()
+        if self.recognition_pool:
+            self.recognition_pool.shutdown()
+        if self.capture_writer:
+            self.capture_writer.stop()
+        if self.job_manager:
+            self.job_manager.stop()
+
+def app_services(app=None):
+    """Return the AppServices of ``app``, or of the current app"""
+    app = app or current_app._get_current_object()
+    return app.extensions['services']
+
+def get_capture_sessions():
+    return app_services().capture_sessions
+
+def service_disabled(name):
+    """Return a 503 response if the app was created without service ``name``, else None"""
+    if name in app_services().enabled:
+        return None
+    return jsonify({
+        "status": "disabled",
+        "message": f"The {name} service is disabled in this app"
+    }), 503
 
 class DummyFaceRecognitionService:
     def __init__(self, app):
         self.app = app
-        self.known_face_encodings = {}
-        self.known_face_names = {}
-        self.encoding_timestamp = {}
-    def _add_student_encoding(self, student):
+    def _add_student_encoding(self, student, save_cache=True, encoding=None):
         return True
-    def _match_faces(self, image_path):
+    def bulk_encode_students(self, students, workers=None, save_cache=True, progress=None):
+        return {'total': len(students), 'encoded': len(students), 'failed': [], 'seconds': 0.0}
+    def match_image(self, image, face_locations=None, candidate_ids=None, course_id=None):
         return []
+    def identify_faces(self, image, face_locations, candidate_ids=None, course_id=None):
+        return [None] * len(face_locations or [])
+    def invalidate_course_gallery(self, course_id=None):
+        return None
+    def remove_student_encoding(self, student_id):
+        return False
     def process_pending_attendance(self):
         return None
     def verify_photo(self, photo_path):
         return {"is_valid": True, "message": "Demo mode: photo accepted", "face_count": 1}
+    def verify_and_encode(self, photo_path, encode=True):
+        return {"is_valid": True, "message": "Demo mode: photo accepted", "face_count": 1, "encoding": None}
+    def load_status(self):
+        return {'ready': True, 'state': 'ready', 'failures': 0, 'loaded': 0, 'total': 0,
+                'elapsed_seconds': 0.0, 'error': None}
+
+def get_face_service(app=None, warm_up=False, load=True):
+    """Return the app's face recognition service, creating it on first use.
+    
+    With ``warm_up`` the gallery loads in a background thread; see load_status().
+    With ``load=False`` a newly created service starts with an empty gallery.
+    Apps created without the 'face' and 'jobs' services get the no-op service,
+    so student records can still be edited; missing encodings are computed
+    when a face-enabled app loads the gallery.
+    """
+    app = app or current_app._get_current_object()
+    services = app_services(app)
+    with services.lock:
+        if services.face_service is None:
+            if FACE_RECOGNITION_AVAILABLE and {'face', 'jobs'} & set(services.enabled):
+                try:
+                    from face_recognition_service import FaceRecognitionService
+                    with app.app_context():
+                        services.face_service = FaceRecognitionService(
+                            app, warm_up=warm_up, pool=get_recognition_pool(app), load=load)
+                except Exception as e:
+                    app.logger.error(f"Face recognition unavailable, using demo service: {str(e)}")
+            if services.face_service is None:
+                services.face_service = DummyFaceRecognitionService(app)
+            # Face encodings for existing students are loaded (from the on-disk
+            # cache where possible) by FaceRecognitionService itself
+        return services.face_service
+
+def get_recognition_pool(app=None):
+    """Return the process pool that runs face detection, encoding and photo checks"""
+    app = app or current_app._get_current_object()
+    services = app_services(app)
+    with services.lock:
+        if services.recognition_pool is None:
+            config = app.config
+            services.recognition_pool = RecognitionPool(
+                processes=config['RECOGNITION_PROCESSES'] or os.cpu_count() or 1,
+                max_queued=config['RECOGNITION_POOL_QUEUE'],
+                wait=config['RECOGNITION_POOL_WAIT']
+            )
+        return services.recognition_pool
+
+def get_recognition_jobs(app=None):
+    """Return the recognition job queue, starting it on first use"""
+    app = app or current_app._get_current_object()
+    services = app_services(app)
+    with services.lock:
+        if services.recognition_jobs is None:
+            config = app.config
+            services.recognition_jobs = RecognitionJobQueue(
+                app,
+                workers=config['RECOGNITION_JOB_WORKERS'],
+                max_pending=config['RECOGNITION_MAX_PENDING'],
+                result_ttl=config['RECOGNITION_RESULT_TTL']
+            )
+            services.recognition_jobs.start()
+        return services.recognition_jobs
 
-def initialize_services():
-    global face_service, job_manager, email_service
-    if face_service is None:
-        if FaceRecognitionService is not None:
-            face_service = FaceRecognitionService(app)
-        else:
-            face_service = DummyFaceRecognitionService(app)
-        # Load face encodings for existing students
-        with app.app_context():
-            students = Student.query.all()
-            for student in students:
-                if student.photo_path:
-                    face_service._add_student_encoding(student)
-    
-    if job_manager is None:
-        job_manager = BackgroundJobManager(app, face_service)
-        job_manager.start()
+def initialize_services(app):
+    """Start the services the app was created with.
+    
+    Runs once, before the first request, so CLI commands that only create the
+    app never load the face gallery, connect to SMTP or start schedulers.
+    """
+    services = app_services(app)
+    with services.lock:
+        if services.started:
+            return
+        enabled = services.enabled
         
-    if email_service is None:
-        email_service = EmailService(app)
+        if 'face' in enabled or 'jobs' in enabled:
+            get_face_service(app, warm_up=True)
+        
+        if 'face' in enabled:
+            get_recognition_jobs(app)
+        
+        if 'jobs' in enabled and services.job_manager is None:
+            from background_jobs import BackgroundJobManager
+            services.job_manager = BackgroundJobManager(app, services.face_service, app.extensions['db_manager'])
+            services.job_manager.start()
+            
+        if 'email' in enabled and services.email_service is None:
+            from email_service import EmailService
+            with app.app_context():
+                services.email_service = EmailService(app)
+        
+        services.started = True
 
-# Replace before_first_request with new pattern
-with app.app_context():
-    initialize_services()
+def face_load_status():
+    """Gallery load status of the app's face service (warming up until it exists)"""
+    face_service = app_services().face_service
+    if face_service is None:
+        return {'ready': False, 'state': 'warming_up', 'failures': 0, 'loaded': 0, 'total': 0,
+                'elapsed_seconds': 0.0, 'error': None}
+    return face_service.load_status()
+
+def gallery_warming_up():
+    """Return a 503 response while the face gallery loads (or face recognition is disabled), else None"""
+    disabled = service_disabled('face')
+    if disabled:
+        return disabled
+    status = face_load_status()
+    if status['ready']:
+        return None
+    if status['state'] == 'failed':
+        return jsonify({
+            "status": "failed",
+            "message": f"Face recognition could not load the student gallery: {status['error']}",
+            "progress": status
+        }), 503
+    response = jsonify({
+        "status": "warming_up",
+        "message": f"Face recognition is warming up ({status['loaded']}/{status['total']} students loaded). "
+                   "Please try again shortly.",
+        "progress": status
+    })
+    return response, 503, {'Retry-After': '5'}
+
+@bp.route('/healthz')
+def healthz():
+    """Liveness: the worker is up and serving requests"""
+    return jsonify({"status": "ok"})
+
+@bp.route('/readyz')
+def readyz():
+    """Readiness: the face gallery has finished loading"""
+    if 'face' not in app_services().enabled:
+        # Nothing to warm up: the app serves everything but face recognition
+        return jsonify({"status": "disabled", "message": "The face service is disabled in this app"})
+    status = face_load_status()
+    return jsonify({"status": status['state'], "progress": status}), 200 if status['ready'] else 503
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg'}
 
-@app.route('/')
+@bp.route('/')
 def dashboard():
     total_students = Student.query.count()
     total_courses = Course.query.count()
@@ -170,12 +370,14 @@ def dashboard():
                          present_today=present_today,
                          attendance_rate=f"{attendance_rate:.1f}%")
 
-@app.route('/take-attendance')
+@bp.route('/take-attendance')
 def take_attendance():
     courses = Course.query.all()
-    return render_template('take_attendance.html', courses=courses)
+    rooms = list(current_app.config.get('CAMERA_SOURCES') or {}) or [DEFAULT_ROOM]
+    room = request.args.get('room', rooms[0])
+    return render_template('take_attendance.html', courses=courses, rooms=rooms, room=room)
 
-@app.route('/register-student', methods=['GET', 'POST'])
+@bp.route('/register-student', methods=['GET', 'POST'])
 def register_student():
     if request.method == 'POST':
         # Get form data
@@ -187,17 +389,17 @@ def register_student():
         # Check if student ID already exists
         if Student.query.filter_by(student_id=student_id).first():
             flash('Student ID already exists!', 'error')
-            return redirect(url_for('register_student'))
+            return redirect(url_for('main.register_student'))
         
         # Handle photo upload
         if 'photo' not in request.files:
             flash('No photo uploaded!', 'error')
-            return redirect(url_for('register_student'))
+            return redirect(url_for('main.register_student'))
             
         photo = request.files['photo']
         if photo.filename == '':
             flash('No photo selected!', 'error')
-            return redirect(url_for('register_student'))
+            return redirect(url_for('main.register_student'))
             
         if photo and allowed_file(photo.filename):
             try:
@@ -212,13 +414,13 @@ def register_student():
                 # Save the file
                 photo.save(full_path)
                 
-                # Verify the photo using face recognition service
-                verification_result = face_service.verify_photo(full_path)
+                # Verify the photo and encode its face in one pass
+                verification_result = get_face_service().verify_and_encode(full_path)
                 
                 if not verification_result['is_valid']:
                     os.remove(full_path)
                     flash(verification_result['message'], 'error')
-                    return redirect(url_for('register_student'))
+                    return redirect(url_for('main.register_student'))
                 
                 # Create new student
                 student = Student(
@@ -239,16 +441,17 @@ def register_student():
                 db.session.commit()
                 
                 # Add face encoding for the new student
-                if face_service._add_student_encoding(student):
+                if get_face_service()._add_student_encoding(student, encoding=verification_result['encoding']):
+                    db.session.commit()
                     flash('Student registered successfully!', 'success')
                 else:
                     db.session.delete(student)
                     db.session.commit()
                     os.remove(full_path)
                     flash('Error processing student photo. Please try with a different photo.', 'error')
-                    return redirect(url_for('register_student'))
+                    return redirect(url_for('main.register_student'))
                 
-                return redirect(url_for('dashboard'))
+                return redirect(url_for('main.dashboard'))
                 
             except Exception as e:
                 db.session.rollback()
@@ -256,61 +459,404 @@ def register_student():
                 if os.path.exists(full_path):
                     os.remove(full_path)
                 flash(f'Error registering student: {str(e)}', 'error')
-                return redirect(url_for('register_student'))
+                return redirect(url_for('main.register_student'))
         else:
             flash('Invalid file type! Please upload a PNG or JPEG image.', 'error')
-            return redirect(url_for('register_student'))
+            return redirect(url_for('main.register_student'))
     
     # GET request - show the registration form
     courses = Course.query.all()
     return render_template('register_student.html', courses=courses)
 
-@app.route('/start_capture', methods=['POST'])
+@bp.route('/start_capture', methods=['POST'])
 def start_capture():
-    global video_capture, process_frames, current_course_id
-    
     data = request.get_json()
-    current_course_id = int(data.get('course_id'))  # Convert to integer
-    print(f"Debug - Setting current_course_id to: {current_course_id}")
-    print(f"Debug - Course name: {Course.query.get(current_course_id).name}")
+    room = request_room()
+    course = Course.query.get(int(data.get('course_id')))  # Convert to integer
+    if not course:
+        return jsonify({"status": "error", "message": "Invalid course"})
+    
+    config = current_app.config
+    sources = config.get('CAMERA_SOURCES') or {}
+    if room not in sources and room != DEFAULT_ROOM:
+        return jsonify({"status": "error", "message": f"Unknown room: {room}"})
+    
+    # Frames come from the room's camera, or are posted to /upload_frames by
+    # a browser or edge device when the room's source (or the request) says 'upload'
+    source = sources.get(room, 0)
+    upload = data.get('source') == 'upload' or source == 'upload'
+    existing = get_capture_session(room)
+    if existing is not None and (existing.uploads is not None) != upload:
+        close_capture_session(room)
+    
+    if not upload:
+        get_capture_sessions().open(room, course.id, partial(create_capture_session, room, course.id, source))
+    else:
+        # Upload sessions are recorded in the database so every worker serves them
+        record = db.session.get(UploadSession, room)
+        if record is None:
+            record = UploadSession(room=room, token=uuid.uuid4().hex, course_id=course.id)
+            db.session.add(record)
+        record.course_id = course.id
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker started this room first; join its session
+            db.session.rollback()
+            db.session.get(UploadSession, room).course_id = course.id
+            db.session.commit()
+        get_capture_session(room)
+    current_app.logger.info(f"Capturing attendance for {course.name} in room {room}")
+    return jsonify({"status": "success", "room": room, "upload": upload})
+
+def live_frames_dir(token):
+    return os.path.join(current_app.config['LIVE_FRAMES_DIR'], token)
+
+def create_capture_session(room, course_id, source, token=None):
+    """Open a room's camera, or its shared upload stream when ``token`` is given"""
+    config = current_app.config
+    if token is None:
+        camera = CameraStream(source, config.get('CAMERA_BUFFER_SIZE', 4))
+    else:
+        camera = UploadedFrameStream(live_frames_dir(token))
+    camera.start()
+    cascade = load_face_cascade()
+    preview = None
+    if config.get('PREVIEW_TARGET_FPS'):
+        preview = PreviewFaceDetector(
+            cascade,
+            scale=config['PREVIEW_DETECTION_SCALE'],
+            target_fps=config['PREVIEW_TARGET_FPS'],
+            max_interval=config['PREVIEW_MAX_DETECTION_INTERVAL']
+        )
+    broadcaster = FrameBroadcaster(camera, partial(render_frame, cascade=cascade, preview=preview))
+    if token is None:
+        return CaptureSession(room, course_id, camera, broadcaster)
+    return CaptureSession(room, course_id, camera, broadcaster,
+                          uploads=UploadLimiter(config['UPLOAD_MAX_FPS']),
+                          detect=partial(detect_faces, cascade=cascade, preview=preview))
+
+def get_capture_session(room):
+    """Return the room's capture session on this worker, or None.
+    
+    Camera sessions belong to the worker that opened the device. Upload
+    sessions follow their UploadSession row: a worker joins one started
+    elsewhere and closes its copy once the row is gone or replaced.
+    """
+    sessions = get_capture_sessions()
+    session = sessions.get(room)
+    if session is not None and session.uploads is None:
+        return session
+    
+    record = db.session.get(UploadSession, room)
+    if record is None:
+        if session is not None:
+            sessions.close(room)
+        return None
+    if session is not None and session.camera.directory != live_frames_dir(record.token):
+        sessions.close(room)
+    return sessions.open(room, record.course_id,
+                         partial(create_capture_session, room, record.course_id, 'upload', record.token))
+
+def close_capture_session(room):
+    """Stop a room's session; an upload session is ended on every worker"""
+    record = db.session.get(UploadSession, room)
+    if record is not None:
+        db.session.delete(record)
+        db.session.commit()
+        UploadedFrameStream(live_frames_dir(record.token)).discard()
+    get_capture_sessions().close(room)
+
+def decode_frame(data):
+    """Decode JPEG (or PNG) bytes to a BGR image in memory; None if they are not an image"""
+    import cv2
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+@bp.route('/upload_frames', methods=['POST'])
+def upload_frames():
+    """Accept frames for an upload-fed capture session.
+    
+    The body is a single image (Content-Type: image/jpeg) or a multipart
+    batch of 'frame' files. Frames are decoded in memory, run through face
+    detection and added to the session's buffer, where capture and
+    hands-free attendance pick them up like camera frames.
+    """
+    config = current_app.config
+    session = get_capture_session(request_room())
+    if session is None or not session.running or session.uploads is None:
+        return jsonify({"status": "error", "message": "No upload capture session in this room"}), 404
+    
+    max_batch = config['UPLOAD_MAX_BATCH']
+    max_bytes = config['UPLOAD_MAX_FRAME_BYTES']
+    if request.content_length is None or request.content_length > max_batch * max_bytes:
+        return jsonify({"status": "error", "message": "Upload too large"}), 413
+    
+    # One upload per session at a time; a client flooding frames is told to back off
+    if not session.uploads.try_begin():
+        return jsonify({"status": "busy", "message": "Previous upload still processing"}), 429, {'Retry-After': '1'}
+    try:
+        if request.mimetype == 'multipart/form-data':
+            # Parse with in-memory buffers so no part is spooled to a temp file
+            _, _, files = parse_form_data(
+                request.environ,
+                stream_factory=lambda *args, **kwargs: BytesIO(),
+                max_content_length=max_batch * max_bytes
+            )
+            payloads = [file.read() for file in files.getlist('frame')]
+        else:
+            payloads = [request.get_data(cache=False)]
+        
+        if len(payloads) > max_batch or any(len(payload) > max_bytes for payload in payloads):
+            return jsonify({"status": "error", "message": f"At most {max_batch} frames of {max_bytes} bytes each"}), 413
+        
+        # Over the session's frame rate only the newest frames are kept
+        granted = session.uploads.take(len(payloads))
+        if granted == 0:
+            retry_after = max(1, round(session.uploads.retry_after()))
+            return jsonify({"status": "busy", "message": "Frame rate limit reached"}), 429, {'Retry-After': str(retry_after)}
+        
+        accepted = invalid = 0
+        for payload in payloads[len(payloads) - granted:]:
+            image = decode_frame(payload)
+            if image is None:
+                invalid += 1
+                continue
+            if session.camera.push(image, session.detect) is not None:
+                accepted += 1
+        
+        return jsonify({
+            "status": "success" if accepted else "error",
+            "accepted": accepted,
+            "dropped": len(payloads) - granted,
+            "invalid": invalid
+        }), 400 if invalid == granted else 200
+    except Exception as e:
+        current_app.logger.error(f"Error ingesting uploaded frames: {str(e)}")
+        return jsonify({"status": "error", "message": f"Error ingesting frames: {str(e)}"}), 400
+    finally:
+        session.uploads.end()
+
+@bp.route('/recognition_pool')
+def recognition_pool_status():
+    """Load on the recognition process pool: tasks in flight, completed and turned away"""
+    disabled = service_disabled('face')
+    if disabled:
+        return disabled
+    pool = app_services().recognition_pool
+    if pool is None:
+        return jsonify({"status": "stopped"})
+    return jsonify({"status": "running", "pool": pool.status()})
+
+@bp.route('/capture_sessions')
+def list_capture_sessions():
+    """Running capture sessions on this worker, one per room"""
+    for record in UploadSession.query.all():
+        get_capture_session(record.room)
+    return jsonify({"sessions": [session.status() for session in get_capture_sessions().sessions()]})
+
+def get_capture_writer(app=None):
+    """Return the background writer that saves captured frames, creating it on first use"""
+    app = app or current_app._get_current_object()
+    services = app_services(app)
+    with services.lock:
+        if services.capture_writer is None:
+            services.capture_writer = CaptureWriter(app, os.path.join(app.static_folder, 'captures'),
+                                                    max_pending=app.config['CAPTURE_WRITER_QUEUE'],
+                                                    attempts=app.config['CAPTURE_WRITE_ATTEMPTS'],
+                                                    retry_delay=app.config['CAPTURE_RETRY_DELAY'])
+            services.capture_writer.start()
+        return services.capture_writer
+
+def save_capture(image, records):
+    """Queue a BGR frame to be saved for committed Attendance records.
+    
+    The records' capture_path is filled in once the file is safely on disk.
+    """
+    if records:
+        get_capture_writer().save(image, [record.id for record in records])
+
+def mark_present(student, course, confidence, current_date, current_time):
+    """Add a 'present' record and notify the student; the caller commits.
+    
+    Returns the new Attendance, or None if the student already has attendance
+    for the course that day.
+    """
+    # Check if attendance already marked for this student today
+    existing_attendance = Attendance.query.filter_by(
+        student_id=student.id,
+        course_id=course.id,
+        date=current_date
+    ).first()
+    if existing_attendance:
+        return None
+    
+    # Create attendance record for the recognized student
+    attendance = Attendance(
+        student_id=student.id,
+        course_id=course.id,
+        date=current_date,
+        time=current_time,
+        status='present',
+        confidence=confidence
+    )
+    db.session.add(attendance)
+    
+    # Send email notification for present student
+    email_service = app_services().email_service
+    if student.email and email_service is not None:
+        email_service.send_attendance_notification(
+            student_email=student.email,
+            student_name=student.name,
+            course_name=course.name,
+            status='present',
+            date=current_date.strftime('%B %d, %Y'),
+            time=current_time.strftime('%I:%M %p')
+        )
+    return attendance
+
+def mark_continuous_present(course_id, student_id, confidence, frame):
+    """Record a student recognized by continuous attendance (called from its thread)"""
+    student = Student.query.filter_by(student_id=student_id).first()
+    course = Course.query.get(course_id)
+    if not student or not course:
+        return
+    
+    now = datetime.now()
+    try:
+        attendance = mark_present(student, course, confidence, now.date(), now.time())
+        if attendance is not None:
+            db.session.commit()
+            save_capture(frame.image, [attendance])
+            current_app.logger.info(f"Continuous attendance: marked {student.name} present in {course.name}")
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error marking {student_id} present: {str(e)}")
+
+@bp.route('/continuous_attendance/start', methods=['POST'])
+def start_continuous_attendance():
+    warming_up = gallery_warming_up()
+    if warming_up:
+        return warming_up
     
-    if video_capture is None:
-        video_capture = cv2.VideoCapture(0)
+    session = get_capture_session(request_room())
+    course = Course.query.get(session.course_id) if session is not None and session.running else None
+    if not course:
+        return jsonify({
+            "status": "error",
+            "message": "Start the camera for a course first"
+        })
     
-    process_frames = True
+    if session.continuous is None or not session.continuous.running:
+        session.stop_continuous()
+        config = current_app.config
+        session.continuous = ContinuousAttendance(
+            current_app._get_current_object(), session.camera, get_face_service(), course.id,
+            [student.student_id for student in course.students],
+            on_present=partial(mark_continuous_present, course.id),
+            # Full-resolution detection runs on the recognition pool, off this worker
+            detect=partial(get_recognition_pool().run, detect_frame_faces),
+            interval=config['CONTINUOUS_INTERVAL'],
+            stable_matches=config['CONTINUOUS_STABLE_MATCHES'],
+            max_attempts=config['CONTINUOUS_MAX_ATTEMPTS']
+        )
+        session.continuous.start()
+    
+    return jsonify({"status": "success", "message": f"Hands-free attendance running for {course.name}"})
+
+@bp.route('/continuous_attendance/stop', methods=['POST'])
+def stop_continuous_attendance():
+    session = get_capture_session(request_room())
+    if session is not None:
+        session.stop_continuous()
     return jsonify({"status": "success"})
 
-@app.route('/capture_attendance', methods=['POST'])
+@bp.route('/continuous_attendance/status')
+def continuous_attendance_status():
+    session = get_capture_session(request_room())
+    if session is None or session.continuous is None:
+        return jsonify({"status": "stopped"})
+    
+    report = session.continuous.status()
+    students = Student.query.filter(Student.student_id.in_(list(report['marked']))).all() if report['marked'] else []
+    report['marked_names'] = sorted(student.name for student in students)
+    return jsonify({"status": "running" if report['running'] else "stopped", "report": report})
+
+@bp.route('/capture_attendance', methods=['POST'])
 def capture_attendance():
-    global current_frame, current_course_id
+    """Queue recognition of the room's newest frame and return the job ID.
+    
+    Poll /capture_attendance/jobs/<job_id> for the outcome.
+    """
+    warming_up = gallery_warming_up()
+    if warming_up:
+        return warming_up
     
-    if current_frame is None:
+    session = get_capture_session(request_room())
+    frame = session.camera.latest() if session is not None else None
+    if frame is None:
         return jsonify({
             "status": "error",
             "message": "No frame available to capture"
         })
     
+    course = Course.query.get(session.course_id)
+    if not course:
+        return jsonify({
+            "status": "error",
+            "message": "Invalid course"
+        })
+    
+    # Newest buffered frame and the Haar boxes the live stream found on it. Boxes
+    # tracked from an earlier detection may drift, so the job runs HOG detection
+    # itself unless they were detected on this frame.
+    faces = frame.faces if frame.faces_exact else None
     try:
-        # Create a directory for today's captures
-        today = datetime.now().strftime('%Y-%m-%d')
-        course = Course.query.get(current_course_id)
+        job_id = get_recognition_jobs().submit('capture_attendance', run_capture_job,
+                                               course.id, frame.image, faces)
+    except JobQueueFull:
+        return jsonify({
+            "status": "busy",
+            "message": "Too many captures are waiting to be processed. Please try again shortly."
+        }), 503, {'Retry-After': '5'}
+    
+    return jsonify({"status": "queued", "job_id": job_id}), 202
+
+@bp.route('/capture_attendance/jobs/<job_id>')
+def capture_attendance_job(job_id):
+    """Progress of a queued capture; once done, the response carries the attendance outcome"""
+    disabled = service_disabled('face')
+    if disabled:
+        return disabled
+    job = get_recognition_jobs().get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown or expired job"}), 404
+    
+    response = {"job_id": job_id, "job_status": job['status'], "position": job['position']}
+    if job['status'] == 'done':
+        response.update(job['result'])
+    elif job['status'] == 'failed':
+        response.update(status="error", message=f"Error capturing attendance: {job['error']}")
+    else:
+        response['status'] = job['status']
+    return jsonify(response)
+
+def run_capture_job(course_id, image, faces):
+    """Record attendance from a captured BGR frame (runs on a recognition job worker).
+    
+    ``faces`` are exact (x, y, w, h) boxes the live stream found on the frame,
+    or None to run HOG detection. Returns the status/message dict shown to the user.
+    """
+    import cv2
+    
+    try:
+        course = Course.query.get(course_id)
         if not course:
-            return jsonify({
+            return {
                 "status": "error",
                 "message": "Invalid course"
-            })
-            
-        capture_dir = os.path.join(CAPTURES_FOLDER, today)
-        os.makedirs(capture_dir, exist_ok=True)
-        
-        # Save the current frame
-        timestamp = datetime.now().strftime('%H-%M-%S')
-        filename = f"capture_{course.identifier}_{timestamp}.jpg"
-        filepath = os.path.join(capture_dir, filename)
-        relative_path = os.path.join('captures', today, filename)
-        
-        # Save the frame
-        cv2.imwrite(filepath, current_frame)
+            }
         
         # Get current date and time
         current_date = datetime.now().date()
@@ -319,13 +865,23 @@ def capture_attendance():
         # Get all students in the course
         course_students = course.students
         
-        # Process the capture immediately
-        matches = face_service._match_faces(filepath)
+        # Process the in-memory frame immediately, matching only against the
+        # course roster. Reuse the stream's face boxes, converted from
+        # (x, y, w, h) to (top, right, bottom, left); HOG runs only if there are none.
+        face_locations = None
+        if faces is not None:
+            face_locations = [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in faces]
+        matches = get_face_service().match_image(
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB),
+            face_locations=face_locations,
+            candidate_ids=[student.student_id for student in course_students],
+            course_id=course.id
+        )
         
         if matches:
             recognized_students = []
+            captured = []  # new records that reference this capture
             already_marked_students = []
-            not_in_course_students = []
             
             for student_id, confidence in matches:
                 student = Student.query.filter_by(student_id=student_id).first()
@@ -333,46 +889,13 @@ def capture_attendance():
                 if not student:
                     continue
                 
-                # Check if student is enrolled in this course
-                if current_course_id not in [c.id for c in student.courses]:
-                    not_in_course_students.append(student.name)
-                    continue
-                
-                # Check if attendance already marked for this student today
-                existing_attendance = Attendance.query.filter_by(
-                    student_id=student.id,
-                    course_id=current_course_id,
-                    date=current_date
-                ).first()
-                
-                if existing_attendance:
+                # Mark the student present unless already marked today
+                attendance = mark_present(student, course, confidence, current_date, current_time)
+                if attendance is None:
                     already_marked_students.append(student.name)
                     continue
-                
-                # Create attendance record for the recognized student
-                attendance = Attendance(
-                    student_id=student.id,
-                    course_id=current_course_id,
-                    date=current_date,
-                    time=current_time,
-                    status='present',
-                    capture_path=relative_path.replace('\\', '/'),
-                    confidence=confidence
-                )
-                
-                db.session.add(attendance)
                 recognized_students.append(student)
-                
-                # Send email notification for present student
-                if student.email:
-                    email_service.send_attendance_notification(
-                        student_email=student.email,
-                        student_name=student.name,
-                        course_name=course.name,
-                        status='present',
-                        date=current_date.strftime('%B %d, %Y'),
-                        time=current_time.strftime('%I:%M %p')
-                    )
+                captured.append(attendance)
             
             # Prepare response message
             messages = []
@@ -383,26 +906,23 @@ def capture_attendance():
             if already_marked_students:
                 messages.append(f"Already marked present today: {', '.join(already_marked_students)}")
             
-            if not_in_course_students:
-                messages.append(f"Not registered in this course: {', '.join(not_in_course_students)}")
-            
-            if not recognized_students and not already_marked_students and not not_in_course_students:
+            if not recognized_students and not already_marked_students:
                 # No valid students were recognized
                 attendance = Attendance(
-                    course_id=current_course_id,
+                    course_id=course.id,
                     date=current_date,
                     time=current_time,
                     status='unknown',
-                    capture_path=relative_path.replace('\\', '/'),
                     confidence=0.0
                 )
                 db.session.add(attendance)
                 db.session.commit()
+                save_capture(image, [attendance])
                 
-                return jsonify({
+                return {
                     "status": "warning",
                     "message": "No matching students found in the capture"
-                })
+                }
             
             # Mark other students as absent if they don't have attendance yet
             absent_notifications = []
@@ -411,7 +931,7 @@ def capture_attendance():
                     # Check if this student already has attendance for today
                     existing = Attendance.query.filter_by(
                         student_id=course_student.id,
-                        course_id=current_course_id,
+                        course_id=course.id,
                         date=current_date
                     ).first()
                     
@@ -419,7 +939,7 @@ def capture_attendance():
                         # Create absent record
                         absent_record = Attendance(
                             student_id=course_student.id,
-                            course_id=current_course_id,
+                            course_id=course.id,
                             date=current_date,
                             time=current_time,
                             status='absent',
@@ -439,97 +959,113 @@ def capture_attendance():
                             })
             
             db.session.commit()
+            save_capture(image, captured)
             
             # Send absent notifications in bulk
-            if absent_notifications:
+            email_service = app_services().email_service
+            if absent_notifications and email_service is not None:
                 email_service.send_bulk_attendance_notifications(absent_notifications)
             
-            return jsonify({
+            return {
                 "status": "info" if already_marked_students else "success",
                 "message": "\n".join(messages),
                 "confidence": f"{min([conf for _, conf in matches]) * 100:.1f}% - {max([conf for _, conf in matches]) * 100:.1f}%"
-            })
+            }
         else:
             # Create a pending record for manual review
             attendance = Attendance(
-                course_id=current_course_id,
+                course_id=course.id,
                 date=current_date,
                 time=current_time,
                 status='unknown',
-                capture_path=relative_path.replace('\\', '/'),
                 confidence=0.0
             )
             
             db.session.add(attendance)
             db.session.commit()
+            save_capture(image, [attendance])
             
-            return jsonify({
+            return {
                 "status": "warning",
                 "message": "No matching students found. The capture has been saved for review."
-            })
+            }
             
+    except RecognitionPoolBusy:
+        db.session.rollback()
+        return {
+            "status": "busy",
+            "message": "The server is busy recognizing other captures. Please try again shortly."
+        }
     except Exception as e:
-        return jsonify({
+        db.session.rollback()
+        return {
             "status": "error",
             "message": f"Error capturing attendance: {str(e)}"
-        })
+        }
 
-@app.route('/stop_capture', methods=['POST'])
+@bp.route('/stop_capture', methods=['POST'])
 def stop_capture():
-    global video_capture, process_frames, current_course_id, current_frame
+    close_capture_session(request_room())
+    return jsonify({"status": "success"})
+
+def detect_faces(buffered, cascade, preview=None, timed=True):
+    """Find the face boxes on a buffered frame and keep them with it for capture.
     
-    process_frames = False
-    current_course_id = None
-    current_frame = None
+    With a PreviewFaceDetector, detection is downscaled and spread over frames.
+    """
+    started = time.perf_counter()
     
-    if video_capture is not None:
-        video_capture.release()
-        video_capture = None
+    if preview is not None:
+        faces = preview.update(buffered.image)
+    else:
+        faces = haar_faces(buffered.image, cascade)
     
-    return jsonify({"status": "success"})
-
-def generate_frames():
-    global video_capture, process_frames, current_frame
+    # Keep the face boxes with the buffered frame; capture only reuses boxes
+    # detected on this very frame, not ones tracked from an earlier detection
+    buffered.faces = [tuple(face) for face in faces]
+    buffered.faces_exact = preview is None or preview.last_detected
+    if preview is not None and timed:
+        preview.frame_finished(time.perf_counter() - started)
+    return buffered.faces
+
+def render_frame(buffered, cascade, preview=None):
+    """Detect faces on a buffered frame, draw them and encode it as JPEG.
     
-    while True:
-        if not process_frames:
-            continue
-            
-        success, frame = video_capture.read()
-        if not success:
-            break
-        
-        # Store the current frame for capture
-        current_frame = frame.copy()
-        
-        # Convert to grayscale for face detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # Detect faces
-        faces = face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
-        
-        # Draw rectangles around faces
-        for (x, y, w, h) in faces:
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-        
-        # Convert frame to jpg
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
-        
+    Runs once per camera frame for all viewers (see FrameBroadcaster).
+    Uploaded frames already carry their boxes and are only drawn.
+    """
+    import cv2
+    started = time.perf_counter()
+    frame = buffered.image.copy()
+    
+    detected = buffered.faces is None
+    faces = detect_faces(buffered, cascade, preview, timed=False) if detected else buffered.faces
+    
+    # Draw rectangles around faces
+    for (x, y, w, h) in faces:
+        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+    
+    # Convert frame to jpg
+    ret, buffer = cv2.imencode('.jpg', frame)
+    if preview is not None and detected:
+        preview.frame_finished(time.perf_counter() - started)
+    return buffer.tobytes()
+
+def generate_frames(session):
+    # Frames are rendered once per room and shared; a slow client just misses some
+    for frame in session.broadcaster.subscribe():
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
 
-@app.route('/video_feed')
+@bp.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(),
+    session = get_capture_session(request_room())
+    if session is None:
+        return jsonify({"status": "error", "message": "No capture session in this room"}), 404
+    return Response(generate_frames(session),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/records')
+@bp.route('/records')
 def records():
     # Get filter parameters
     start_date = request.args.get('start_date')
@@ -577,17 +1113,17 @@ def records():
                              'status': status
                          })
 
-@app.route('/students')
+@bp.route('/students')
 def students_list():
     students = Student.query.all()
     return render_template('students.html', students=students)
 
-@app.route('/students/<int:student_id>/view')
+@bp.route('/students/<int:student_id>/view')
 def view_student(student_id):
     student = Student.query.get_or_404(student_id)
     return render_template('view_student.html', student=student)
 
-@app.route('/students/<int:student_id>/edit', methods=['GET', 'POST'])
+@bp.route('/students/<int:student_id>/edit', methods=['GET', 'POST'])
 def edit_student(student_id):
     student = Student.query.get_or_404(student_id)
     
@@ -599,9 +1135,11 @@ def edit_student(student_id):
             # Check if the new student_id already exists (excluding current student)
             if new_student_id != student.student_id and Student.query.filter_by(student_id=new_student_id).first():
                 flash('Student ID already exists!', 'error')
-                return redirect(url_for('edit_student', student_id=student_id))
+                return redirect(url_for('main.edit_student', student_id=student_id))
             
             # Update student information
+            old_student_id = student.student_id
+            photo_updated = False
             student.student_id = new_student_id
             student.name = request.form.get('name')
             student.email = request.form.get('email')
@@ -625,14 +1163,14 @@ def edit_student(student_id):
                     photo_path = f"uploads/students/{filename}"
                     full_path = os.path.join(basedir, 'static', 'uploads', 'students', filename)
                     
-                    # Verify the new photo
+                    # Verify the new photo and encode its face in one pass
                     photo.save(full_path)
-                    verification_result = face_service.verify_photo(full_path)
+                    verification_result = get_face_service().verify_and_encode(full_path)
                     
                     if not verification_result['is_valid']:
                         os.remove(full_path)
                         flash(verification_result['message'], 'error')
-                        return redirect(url_for('edit_student', student_id=student_id))
+                        return redirect(url_for('main.edit_student', student_id=student_id))
                     
                     # Remove old photo if it exists
                     if student.photo_path:
@@ -644,27 +1182,35 @@ def edit_student(student_id):
                     student.photo_path = photo_path
                     
                     # Update face encoding
-                    if not face_service._add_student_encoding(student):
+                    if not get_face_service()._add_student_encoding(student, encoding=verification_result['encoding']):
                         os.remove(full_path)
                         flash('Error processing student photo. Please try with a different photo.', 'error')
-                        return redirect(url_for('edit_student', student_id=student_id))
+                        return redirect(url_for('main.edit_student', student_id=student_id))
+                    photo_updated = True
                 else:
                     flash('Invalid file type! Please upload a PNG or JPEG image.', 'error')
-                    return redirect(url_for('edit_student', student_id=student_id))
+                    return redirect(url_for('main.edit_student', student_id=student_id))
+            
+            # Re-key the gallery entry if the student ID changed
+            if old_student_id != student.student_id:
+                get_face_service().remove_student_encoding(old_student_id)
+                if not photo_updated and student.get_face_encoding() is not None:
+                    get_face_service()._add_student_encoding(student, encoding=student.get_face_encoding())
             
             db.session.commit()
+            get_face_service().invalidate_course_gallery()
             flash('Student updated successfully!', 'success')
-            return redirect(url_for('students_list'))
+            return redirect(url_for('main.students_list'))
             
         except Exception as e:
             db.session.rollback()
             flash(f'Error updating student: {str(e)}', 'error')
-            return redirect(url_for('edit_student', student_id=student_id))
+            return redirect(url_for('main.edit_student', student_id=student_id))
     
     courses = Course.query.all()
     return render_template('edit_student.html', student=student, courses=courses)
 
-@app.route('/students/<int:student_id>/delete', methods=['POST'])
+@bp.route('/students/<int:student_id>/delete', methods=['POST'])
 def delete_student(student_id):
     student = Student.query.get_or_404(student_id)
     try:
@@ -675,10 +1221,7 @@ def delete_student(student_id):
                 os.remove(photo_path)
         
         # Remove face encoding from the service
-        if student.student_id in face_service.known_face_encodings:
-            del face_service.known_face_encodings[student.student_id]
-            del face_service.known_face_names[student.student_id]
-            del face_service.encoding_timestamp[student.student_id]
+        get_face_service().remove_student_encoding(student.student_id)
         
         # Delete attendance records
         Attendance.query.filter_by(student_id=student.id).delete()
@@ -695,9 +1238,9 @@ def delete_student(student_id):
         db.session.rollback()
         flash(f'Error deleting student: {str(e)}', 'error')
     
-    return redirect(url_for('students_list'))
+    return redirect(url_for('main.students_list'))
 
-@app.route('/courses')
+@bp.route('/courses')
 def courses():
     courses = Course.query.all()
     
@@ -722,23 +1265,23 @@ def courses():
     
     return render_template('courses.html', courses=courses, stats=stats)
 
-@app.route('/courses/add', methods=['POST'])
+@bp.route('/courses/add', methods=['POST'])
 def add_course():
     name = request.form.get('name')
     course_id = request.form.get('course_id')
     
     if not name or not course_id:
         flash('Course name and ID are required!', 'error')
-        return redirect(url_for('courses'))
+        return redirect(url_for('main.courses'))
     
     # Check if course already exists
     if Course.query.filter_by(name=name).first():
         flash('A course with this name already exists!', 'error')
-        return redirect(url_for('courses'))
+        return redirect(url_for('main.courses'))
         
     if Course.query.filter_by(identifier=course_id).first():
         flash('A course with this ID already exists!', 'error')
-        return redirect(url_for('courses'))
+        return redirect(url_for('main.courses'))
     
     course = Course(name=name, identifier=course_id)
     try:
@@ -749,9 +1292,9 @@ def add_course():
         db.session.rollback()
         flash('Error adding course. Please try again.', 'error')
     
-    return redirect(url_for('courses'))
+    return redirect(url_for('main.courses'))
 
-@app.route('/courses/<int:course_id>/view')
+@bp.route('/courses/<int:course_id>/view')
 def view_course(course_id):
     course = Course.query.get_or_404(course_id)
     
@@ -797,7 +1340,7 @@ def view_course(course_id):
                          stats=stats, 
                          student_stats=student_stats)
 
-@app.route('/courses/<int:course_id>/edit', methods=['POST'])
+@bp.route('/courses/<int:course_id>/edit', methods=['POST'])
 def edit_course(course_id):
     course = Course.query.get_or_404(course_id)
     name = request.form.get('name')
@@ -805,19 +1348,19 @@ def edit_course(course_id):
     
     if not name or not new_course_id:
         flash('Course name and ID are required!', 'error')
-        return redirect(url_for('view_course', course_id=course_id))
+        return redirect(url_for('main.view_course', course_id=course_id))
     
     # Check if another course with this name exists
     existing_course = Course.query.filter_by(name=name).first()
     if existing_course and existing_course.id != course_id:
         flash('A course with this name already exists!', 'error')
-        return redirect(url_for('view_course', course_id=course_id))
+        return redirect(url_for('main.view_course', course_id=course_id))
         
     # Check if another course with this ID exists
     existing_course = Course.query.filter_by(identifier=new_course_id).first()
     if existing_course and existing_course.id != course_id:
         flash('A course with this ID already exists!', 'error')
-        return redirect(url_for('view_course', course_id=course_id))
+        return redirect(url_for('main.view_course', course_id=course_id))
     
     try:
         course.name = name
@@ -828,9 +1371,9 @@ def edit_course(course_id):
         db.session.rollback()
         flash('Error updating course. Please try again.', 'error')
     
-    return redirect(url_for('view_course', course_id=course_id))
+    return redirect(url_for('main.view_course', course_id=course_id))
 
-@app.route('/courses/<int:course_id>/delete', methods=['POST'])
+@bp.route('/courses/<int:course_id>/delete', methods=['POST'])
 def delete_course(course_id):
     course = Course.query.get_or_404(course_id)
     
@@ -844,14 +1387,15 @@ def delete_course(course_id):
         # Delete the course
         db.session.delete(course)
         db.session.commit()
+        get_face_service().invalidate_course_gallery(course_id)
         flash('Course deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
         flash('Error deleting course. Please try again.', 'error')
     
-    return redirect(url_for('courses'))
+    return redirect(url_for('main.courses'))
 
-@app.route('/export/students')
+@bp.route('/export/students')
 def export_students():
     output = StringIO()
     writer = csv.writer(output)
@@ -886,7 +1430,7 @@ def export_students():
         download_name=f'students_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
     )
 
-@app.route('/export/courses')
+@bp.route('/export/courses')
 def export_courses():
     output = StringIO()
     writer = csv.writer(output)
@@ -917,7 +1461,7 @@ def export_courses():
         download_name=f'courses_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
     )
 
-@app.route('/export/attendance')
+@bp.route('/export/attendance')
 def export_attendance():
     output = StringIO()
     writer = csv.writer(output)
@@ -952,7 +1496,7 @@ def export_attendance():
         download_name=f'attendance_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
     )
 
-@app.route('/export/all')
+@bp.route('/export/all')
 def export_all():
     # Create a zip file in memory
     memory_file = BytesIO()
@@ -1020,13 +1564,18 @@ def export_all():
     )
 
 # Add new route for processing pending attendance
-@app.route('/process-pending', methods=['POST'])
+@bp.route('/process-pending', methods=['POST'])
 def process_pending_attendance():
+    warming_up = gallery_warming_up()
+    if warming_up:
+        return warming_up
+    
     try:
-        face_service.process_pending_attendance()
+        report = get_face_service().process_pending_attendance() or {}
         return jsonify({
             "status": "success",
-            "message": "Processed pending attendance records"
+            "message": f"Processed {report.get('processed', 0)} pending attendance records",
+            "report": report
         })
     except Exception as e:
         return jsonify({
@@ -1035,7 +1584,7 @@ def process_pending_attendance():
         })
 
 # Initialize database tables and default data
-def init_db():
+def init_db(app):
     with app.app_context():
         print('Starting database initialization...')
         
@@ -1073,6 +1622,20 @@ def init_db():
         db.create_all()
         print('Created new tables with updated schema.')
         
+        # Add face encoding columns to existing student tables
+        student_columns = [column['name'] for column in db.inspect(db.engine).get_columns('student')]
+        for column_name in ('face_encoding', 'encoding_model', 'encoding_version', 'encoding_updated_at'):
+            if column_name not in student_columns and add_column(Student.__table__.c[column_name]):
+                print(f'Added student.{column_name} column.')
+        
+        # Gallery changes are numbered by the GalleryVersion counter row
+        if db.session.get(GalleryVersion, 1) is None:
+            try:
+                db.session.add(GalleryVersion(id=1, version=0))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()  # seeded by another worker starting at the same time
+        
         # Restore data if we migrated
         if need_migration and students_data:
             print('Restoring student data...')
@@ -1115,16 +1678,30 @@ def init_db():
             print(f'Found existing tables: {existing_tables}')
             print('Database already initialized.')
 
-@app.cli.command("init-db")
+def add_column(column):
+    """Add a model column missing from an existing table, returning False if it already exists.
+    
+    The type is rendered for the connected database. Workers starting at the
+    same time may race to add the same column; the loser finds it in place.
+    """
+    table = column.table.name
+    column_type = column.type.compile(dialect=db.engine.dialect)
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {column.name} {column_type}'))
+        return True
+    except DBAPIError:
+        if column.name in [existing['name'] for existing in db.inspect(db.engine).get_columns(table)]:
+            return False
+        raise
+
+@bp.cli.command("init-db")
 def init_db_command():
     """Initialize the database tables and add default data."""
-    init_db()
+    init_db(current_app._get_current_object())
     print('Database initialization completed.')
 
-# Initialize database on startup (only if tables don't exist)
-init_db()
-
-@app.route('/attendance/review')
+@bp.route('/attendance/review')
 def attendance_review():
     # Get filter parameters
     start_date = request.args.get('start_date')
@@ -1177,7 +1754,7 @@ def attendance_review():
                          courses=courses,
                          students=students)
 
-@app.route('/attendance/<int:record_id>/update', methods=['POST'])
+@bp.route('/attendance/<int:record_id>/update', methods=['POST'])
 def update_attendance(record_id):
     record = Attendance.query.get_or_404(record_id)
     
@@ -1205,28 +1782,19 @@ def update_attendance(record_id):
         db.session.rollback()
         flash(f'Error updating attendance record: {str(e)}', 'error')
     
-    return redirect(url_for('attendance_review',
+    return redirect(url_for('main.attendance_review',
                           start_date=request.args.get('start_date'),
                           end_date=request.args.get('end_date'),
                           course=request.args.get('course'),
                           status=request.args.get('status')))
 
-# Register cleanup function
-@atexit.register
-def cleanup():
-    global video_capture, job_manager
-    if video_capture:
-        video_capture.release()
-    if job_manager:
-        job_manager.stop()
-
-@app.route('/clear_records', methods=['POST'])
+@bp.route('/clear_records', methods=['POST'])
 def clear_records():
     if request.method == 'POST':
         confirmation = request.form.get('confirmation')
         if confirmation != 'DELETE':
             flash('Please type DELETE to confirm record deletion.', 'error')
-            return redirect(url_for('records'))
+            return redirect(url_for('main.records'))
 
         clear_option = request.form.get('clear_option')
         
@@ -1242,7 +1810,7 @@ def clear_records():
                 
                 if not start_date or not end_date:
                     flash('Please provide both start and end dates.', 'error')
-                    return redirect(url_for('records'))
+                    return redirect(url_for('main.records'))
                 
                 # Convert string dates to datetime objects
                 start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
@@ -1260,13 +1828,13 @@ def clear_records():
                 course_id = request.form.get('course_id')
                 if not course_id:
                     flash('Please select a course.', 'error')
-                    return redirect(url_for('records'))
+                    return redirect(url_for('main.records'))
                 
                 # Get course name for the message
                 course = Course.query.get(course_id)
                 if not course:
                     flash('Invalid course selected.', 'error')
-                    return redirect(url_for('records'))
+                    return redirect(url_for('main.records'))
                 
                 # Delete records for specific course
                 db.session.query(Attendance).filter_by(course_id=course_id).delete()
@@ -1279,25 +1847,7 @@ def clear_records():
             db.session.rollback()
             flash(f'Error clearing records: {str(e)}', 'error')
         
-        return redirect(url_for('records'))
-
-# Scheduled tasks for database maintenance
-scheduler = BackgroundScheduler()
-
-@scheduler.scheduled_job('cron', hour=0)  # Run at midnight
-def scheduled_backup():
-    with app.app_context():
-        db_manager.create_backup()
-
-@scheduler.scheduled_job('cron', day_of_week='sun')  # Run weekly on Sunday
-def scheduled_optimization():
-    with app.app_context():
-        db_manager.optimize_database()
-
-scheduler.start()
-
-# Register cleanup on app shutdown
-atexit.register(lambda: scheduler.shutdown())
+        return redirect(url_for('main.records'))
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    create_app().run(debug=True)
@@ -6,9 +6,10 @@ import logging
 logger = logging.getLogger(__name__)
 
 class BackgroundJobManager:
-    def __init__(self, app, face_service):
+    def __init__(self, app, face_service, db_manager=None):
         self.app = app
         self.face_service = face_service
+        self.db_manager = db_manager
         self.scheduler = BackgroundScheduler()
         self.setup_jobs()
     
@@ -33,6 +34,25 @@ class BackgroundJobManager:
             name='Clean up old capture files',
             replace_existing=True
         )
+        
+        if self.db_manager is not None:
+            # Database maintenance: nightly backup and weekly optimization
+            self.scheduler.add_job(
+                func=self._backup_database,
+                trigger='cron',
+                hour=0,
+                id='backup_database',
+                name='Back up the database',
+                replace_existing=True
+            )
+            self.scheduler.add_job(
+                func=self._optimize_database,
+                trigger='cron',
+                day_of_week='sun',
+                id='optimize_database',
+                name='Optimize the database',
+                replace_existing=True
+            )
     
     def start(self):
         """Start the scheduler"""
@@ -48,11 +68,23 @@ class BackgroundJobManager:
         """Process pending attendance records in background"""
         with self.app.app_context():
             try:
-                self.face_service.process_pending_attendance()
-                logger.info("Successfully processed pending attendance records")
+                report = self.face_service.process_pending_attendance()
+                if report and report['processed']:
+                    logger.info(f"Processed {report['processed']} pending attendance records "
+                                f"({report['per_second']:.1f}/s), {report['remaining']} still pending")
             except Exception as e:
                 logger.error(f"Error processing pending attendance: {str(e)}")
     
+    def _backup_database(self):
+        """Create a database backup"""
+        with self.app.app_context():
+            self.db_manager.create_backup()
+    
+    def _optimize_database(self):
+        """Run database maintenance"""
+        with self.app.app_context():
+            self.db_manager.optimize_database()
+    
     def _cleanup_old_captures(self):
         """Clean up capture files older than 30 days"""
         import os
@@ -66,18 +98,22 @@ class BackgroundJobManager:
                 # Get the captures directory
                 captures_dir = os.path.join(self.app.static_folder, 'captures')
                 
-                # Walk through all course directories
-                for course_dir in os.listdir(captures_dir):
-                    course_path = os.path.join(captures_dir, course_dir)
-                    if not os.path.isdir(course_path):
-                        continue
+                # Captures live in date directories, either directly under
+                # captures/ or (older layout) under a directory per course
+                parents = [captures_dir] + [
+                    os.path.join(captures_dir, name) for name in os.listdir(captures_dir)
+                    if os.path.isdir(os.path.join(captures_dir, name))
+                ]
+                for parent in parents:
+                    if not os.path.isdir(parent):
+                        continue  # a date directory removed earlier in this pass
                     
                     # Walk through date directories
-                    for date_dir in os.listdir(course_path):
+                    for date_dir in os.listdir(parent):
                         try:
                             # Parse the date from directory name
                             dir_date = datetime.strptime(date_dir, '%Y-%m-%d').date()
-                            dir_path = os.path.join(course_path, date_dir)
+                            dir_path = os.path.join(parent, date_dir)
                             
                             # If directory is older than cutoff, delete it
                             if dir_date < cutoff_date.date():
@@ -0,0 +1,340 @@
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines run a single process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class Frame:
+    """A captured camera frame.
+
+    ``faces`` holds the (x, y, w, h) Haar boxes once the live stream (or the
+    upload that delivered the frame) has run detection on it, or None if it
+    has not been looked at yet.
+    ``faces_exact`` is True when the boxes were detected on this very frame
+    rather than tracked from an earlier detection in the live preview.
+    """
+
+    __slots__ = ('seq', 'timestamp', 'image', 'faces', 'faces_exact')
+
+    def __init__(self, seq: int, timestamp: float, image):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.image = image
+        self.faces: Optional[List[Tuple[int, int, int, int]]] = None
+        self.faces_exact = False
+
+class FrameBuffer:
+    """A small ring buffer of frames shared between one producer and many readers.
+
+    Readers either take the newest frame with ``latest()`` or block in
+    ``wait_for_frame()`` until the producer publishes a newer one, so
+    nothing spins while waiting for frames.
+    """
+
+    def __init__(self, buffer_size: int = 4):
+        self._frames = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._running = False
+        self._seq = 0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def latest(self) -> Optional[Frame]:
+        """Return the most recent frame, or None before the first one"""
+        with self._condition:
+            return self._frames[-1] if self._frames else None
+
+    def wait_for_frame(self, after_seq: int = 0, timeout: Optional[float] = None) -> Optional[Frame]:
+        """Block until a frame newer than ``after_seq`` is available.
+
+        Returns None on timeout or once the stream has stopped.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: not self._running or (self._frames and self._frames[-1].seq > after_seq),
+                timeout
+            )
+            if self._frames and self._frames[-1].seq > after_seq:
+                return self._frames[-1]
+            return None
+
+    def _publish(self, image, prepare=None) -> Frame:
+        """Append a new frame and wake readers; ``prepare(frame)`` runs first, e.g. detection"""
+        with self._condition:
+            self._seq += 1
+            frame = Frame(self._seq, time.time(), image)
+        if prepare is not None:
+            prepare(frame)
+        with self._condition:
+            self._frames.append(frame)
+            self._condition.notify_all()
+        return frame
+
+class CameraStream(FrameBuffer):
+    """Reads a camera on its own thread into a small ring buffer of frames.
+
+    The capture thread owns the ``cv2.VideoCapture``; readers never touch
+    the device.
+    """
+
+    def __init__(self, source=0, buffer_size: int = 4):
+        super().__init__(buffer_size)
+        self.source = source
+        self._thread = None
+
+    def start(self):
+        """Open the camera and start the capture thread"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, name=f'camera-{self.source}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the capture thread and release the camera"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _capture_loop(self):
+        import cv2
+
+        capture = cv2.VideoCapture(self.source)
+        try:
+            if not capture.isOpened():
+                logger.error(f"Could not open camera {self.source}")
+                return
+            logger.info(f"Camera {self.source} capture started")
+
+            while self._running:
+                success, image = capture.read()
+                if not success:
+                    logger.warning(f"Camera {self.source} stopped returning frames")
+                    break
+                self._publish(image)
+        except Exception as e:
+            logger.error(f"Error reading camera {self.source}: {str(e)}")
+        finally:
+            capture.release()
+            with self._condition:
+                self._running = False
+                self._condition.notify_all()
+            logger.info(f"Camera {self.source} capture stopped")
+
+class UploadedFrameStream:
+    """Frames posted by clients (browser camera or edge device), shared by every worker.
+
+    Whichever worker receives an upload decodes the image in memory, runs
+    ``prepare(frame)`` (face detection) and ``push()``es it into
+    ``directory``, which holds only the newest frame. Workers reading the
+    same directory see the same frames through the ``CameraStream`` reader
+    interface, so uploads, captures and viewers may land on any worker.
+    ``stop()`` only stops reading on this worker; ``discard()`` removes the
+    directory, which ends the stream everywhere.
+    """
+
+    source = 'upload'
+    POLL_INTERVAL = 0.02
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._frame_path = os.path.join(directory, 'frame')
+        self._running = False
+        self._lock = threading.Lock()
+        self._cached = (None, None)  # (file stat key, Frame)
+
+    @property
+    def running(self) -> bool:
+        return self._running and os.path.isdir(self.directory)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._running = True
+
+    def stop(self, timeout: float = 2.0):
+        self._running = False
+
+    def discard(self):
+        """End the stream for every worker and delete its frames"""
+        self._running = False
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize writers across threads and processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.directory, 'lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def push(self, image, prepare=None) -> Optional[Frame]:
+        """Publish a decoded BGR image; ignored once the stream has stopped"""
+        if not self.running:
+            return None
+        frame = Frame(0, time.time(), np.ascontiguousarray(image))
+        if prepare is not None:
+            prepare(frame)
+        try:
+            with self._file_lock():
+                latest = self.latest()
+                frame.seq = (latest.seq if latest is not None else 0) + 1
+                self._write(frame)
+        except OSError as e:
+            # The session was stopped on another worker meanwhile
+            logger.warning(f"Could not store uploaded frame in {self.directory}: {str(e)}")
+            return None
+        return frame
+
+    def _write(self, frame: Frame):
+        header = {
+            'seq': frame.seq,
+            'timestamp': frame.timestamp,
+            'shape': frame.image.shape,
+            'faces': [[int(v) for v in box] for box in frame.faces] if frame.faces is not None else None,
+            'faces_exact': frame.faces_exact
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.frame')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(header).encode() + b'\n')
+                f.write(frame.image.astype(np.uint8, copy=False).tobytes())
+            os.replace(tmp_path, self._frame_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def latest(self) -> Optional[Frame]:
+        """Return the most recent frame, or None before the first one"""
+        try:
+            stat = os.stat(self._frame_path)
+        except OSError:
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached_key, cached = self._cached
+        if key == cached_key:
+            return cached
+
+        try:
+            with open(self._frame_path, 'rb') as f:
+                header = json.loads(f.readline())
+                data = f.read()
+        except (OSError, ValueError):
+            return cached
+        frame = Frame(header['seq'], header['timestamp'],
+                      np.frombuffer(data, dtype=np.uint8).reshape(header['shape']))
+        if header['faces'] is not None:
+            frame.faces = [tuple(box) for box in header['faces']]
+        frame.faces_exact = header['faces_exact']
+        self._cached = (key, frame)
+        return frame
+
+    def wait_for_frame(self, after_seq: int = 0, timeout: Optional[float] = None) -> Optional[Frame]:
+        """Poll until a frame newer than ``after_seq`` is available.
+
+        Returns None on timeout or once the stream has stopped.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.running:
+            frame = self.latest()
+            if frame is not None and frame.seq > after_seq:
+                return frame
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.POLL_INTERVAL)
+        return None
+
+class FrameBroadcaster:
+    """Renders each camera frame once and shares the result with every viewer.
+
+    A single producer thread turns new frames into bytes with ``render``
+    (detection, annotation and JPEG encoding) and publishes only the latest
+    result. Each subscriber waits for a newer result than the one it last
+    sent, so a slow client simply skips frames and never holds up the
+    producer or the other viewers. The producer runs only while someone is
+    subscribed.
+    """
+
+    def __init__(self, camera, render):
+        self.camera = camera
+        self.render = render
+        self._condition = threading.Condition()
+        self._latest = (0, None)  # (frame seq, rendered bytes)
+        self._subscribers = 0
+        self._thread = None
+
+    @property
+    def subscribers(self) -> int:
+        return self._subscribers
+
+    def subscribe(self):
+        """Yield rendered frames as they are produced, dropping any missed ones"""
+        with self._condition:
+            self._subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._produce, name='frame-broadcaster', daemon=True)
+                self._thread.start()
+        try:
+            last_seq = 0
+            while True:
+                with self._condition:
+                    self._condition.wait_for(
+                        lambda: self._latest[0] > last_seq or not self.camera.running,
+                        timeout=1.0
+                    )
+                    seq, data = self._latest
+                if seq > last_seq:
+                    last_seq = seq
+                    yield data
+                elif not self.camera.running:
+                    return
+        finally:
+            with self._condition:
+                self._subscribers -= 1
+
+    def _produce(self):
+        last_seq = 0
+        while True:
+            with self._condition:
+                # Decide to exit under the lock so a new subscriber starts a fresh producer
+                if self._subscribers == 0 or not self.camera.running:
+                    self._thread = None
+                    self._condition.notify_all()
+                    return
+            frame = self.camera.wait_for_frame(last_seq, timeout=1.0)
+            if frame is None:
+                continue
+            last_seq = frame.seq
+            try:
+                data = self.render(frame)
+            except Exception as e:
+                logger.error(f"Error rendering camera frame: {str(e)}")
+                continue
+            with self._condition:
+                self._latest = (frame.seq, data)
+                self._condition.notify_all()
@@ -0,0 +1,170 @@
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOM = 'default'
+
+class UploadLimiter:
+    """Bounds the frames a capture session accepts from clients.
+
+    A token bucket refilled at ``max_fps`` caps the sustained frame rate
+    (with bursts up to one second's worth), and only one upload request per
+    session is decoded at a time; anything beyond that is turned away
+    immediately instead of queueing on a worker.
+    """
+
+    def __init__(self, max_fps: float):
+        self.max_fps = max_fps
+        self._tokens = max(1.0, max_fps)
+        self._refilled_at = time.monotonic()
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def try_begin(self) -> bool:
+        """Claim the session's upload slot; False if another upload is in progress"""
+        if self._busy.acquire(blocking=False):
+            return True
+        with self._lock:
+            self.rejected += 1
+        return False
+
+    def end(self):
+        self._busy.release()
+
+    def take(self, count: int) -> int:
+        """Grant up to ``count`` frames from the bucket; the rest are counted as dropped"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(max(1.0, self.max_fps), self._tokens + (now - self._refilled_at) * self.max_fps)
+            self._refilled_at = now
+            granted = min(count, int(self._tokens))
+            self._tokens -= granted
+            self.accepted += granted
+            self.dropped += count - granted
+            return granted
+
+    def retry_after(self) -> float:
+        """Seconds until the bucket holds a frame again"""
+        with self._lock:
+            return max(0.0, (1.0 - self._tokens) / self.max_fps)
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {'max_fps': self.max_fps, 'accepted': self.accepted,
+                    'dropped': self.dropped, 'rejected': self.rejected}
+
+class CaptureSession:
+    """Everything one classroom needs while attendance is being taken.
+
+    A session owns its camera thread and frame buffer, the broadcaster
+    feeding its viewers, its course and any hands-free recognition running
+    on its stream. Sessions share nothing, so rooms never wait on each other.
+
+    Sessions fed by client uploads carry an ``UploadLimiter`` and a
+    ``detect(frame)`` callable that finds faces on each frame as it arrives.
+    Their frames live in shared storage, so every worker holds its own copy
+    of such a session; hands-free recognition runs only on the worker that
+    started it.
+    """
+
+    def __init__(self, room_id: str, course_id: int, camera, broadcaster, uploads=None, detect=None):
+        self.room_id = room_id
+        self.course_id = course_id
+        self.camera = camera
+        self.broadcaster = broadcaster
+        self.uploads = uploads
+        self.detect = detect
+        self.continuous = None
+        self.started_at = time.time()
+
+    @property
+    def running(self) -> bool:
+        return self.camera.running
+
+    def stop_continuous(self):
+        if self.continuous is not None:
+            self.continuous.stop()
+            self.continuous = None
+
+    def stop(self):
+        """Stop recognition and release the camera"""
+        self.stop_continuous()
+        self.camera.stop()
+
+    def status(self) -> Dict:
+        return {
+            'room': self.room_id,
+            'course_id': self.course_id,
+            'running': self.running,
+            'viewers': self.broadcaster.subscribers,
+            'hands_free': self.continuous is not None and self.continuous.running,
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'uploads': self.uploads.status() if self.uploads is not None else None
+        }
+
+class CaptureSessionRegistry:
+    """Capture sessions keyed by room ID.
+
+    The lock only guards the mapping itself; requests for a room look up its
+    session and then work on that session's own state.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, room_id: str) -> Optional[CaptureSession]:
+        with self._lock:
+            return self._sessions.get(room_id)
+
+    def open(self, room_id: str, course_id: int, create) -> CaptureSession:
+        """Return the room's running session, switched to ``course_id``, or start one with ``create()``"""
+        with self._lock:
+            session = self._running(room_id)
+        if session is None:
+            # Opening a camera can take seconds, so the lock is not held meanwhile
+            created = create()
+            with self._lock:
+                session = self._running(room_id)
+                if session is None:
+                    self._sessions[room_id] = created
+            if session is None:
+                logger.info(f"Capture session started in room {room_id} for course {course_id}")
+                return created
+            # Another request started this room first; keep its session
+            created.stop()
+
+        if session.course_id != course_id:
+            session.stop_continuous()
+            session.course_id = course_id
+        return session
+
+    def _running(self, room_id: str) -> Optional[CaptureSession]:
+        # Called with the lock held
+        session = self._sessions.get(room_id)
+        return session if session is not None and session.running else None
+
+    def close(self, room_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(room_id, None)
+        if session is None:
+            return False
+        session.stop()
+        logger.info(f"Capture session in room {room_id} stopped")
+        return True
+
+    def close_all(self):
+        with self._lock:
+            room_ids = list(self._sessions)
+        for room_id in room_ids:
+            self.close(room_id)
+
+    def sessions(self) -> List[CaptureSession]:
+        with self._lock:
+            return list(self._sessions.values())
@@ -0,0 +1,139 @@
+import os
+import time
+import queue
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, List
+from models import db, Attendance
+
+logger = logging.getLogger(__name__)
+
+class CaptureWriter:
+    """Saves captured frames on a background thread, named by content hash.
+
+    ``save()`` only queues the in-memory frame with the Attendance rows that
+    should point at it, so recognition never waits on the disk. The writer
+    thread encodes the frame as JPEG and stores it as
+    ``captures/<date>/<sha256>.jpg``; a frame identical to one already saved
+    that day is not written again. The file is written to a temporary name,
+    fsynced and renamed into place, and only then are the rows'
+    ``capture_path`` set, so a path in the database always names a complete
+    file. A frame whose write or row update fails is retried up to
+    ``attempts`` times with a growing delay before it is counted as failed.
+    """
+
+    def __init__(self, app, root: str, max_pending: int = 64, attempts: int = 3,
+                 retry_delay: float = 0.5):
+        self.app = app
+        self.root = root
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self.written = 0
+        self.deduplicated = 0
+        self.failed = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='capture-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """Write out everything queued, then stop the thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def save(self, image, attendance_ids: List[int]):
+        """Queue a BGR frame to be saved for the given (committed) Attendance rows.
+
+        Blocks only if the writer has fallen ``max_pending`` frames behind.
+        """
+        self.start()
+        self._queue.put((image, list(attendance_ids), datetime.now().strftime('%Y-%m-%d')))
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def status(self) -> Dict:
+        return {'pending': self.pending(), 'written': self.written,
+                'deduplicated': self.deduplicated, 'failed': self.failed}
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            image, attendance_ids, day = item
+            self._save(image, attendance_ids, day)
+
+    def _save(self, image, attendance_ids: List[int], day: str):
+        relative_path = None
+        for attempt in range(1, self.attempts + 1):
+            try:
+                if relative_path is None:
+                    relative_path = self._write(image, day)
+                if attendance_ids:
+                    with self.app.app_context():
+                        Attendance.query.filter(Attendance.id.in_(attendance_ids)).update(
+                            {Attendance.capture_path: relative_path}, synchronize_session=False
+                        )
+                        db.session.commit()
+                return
+            except Exception as e:
+                if attempt == self.attempts:
+                    self.failed += 1
+                    logger.error(f"Error saving capture for attendance {attendance_ids}: {str(e)}")
+                    return
+                logger.warning(f"Saving capture for attendance {attendance_ids} failed "
+                               f"(attempt {attempt}/{self.attempts}): {str(e)}")
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    def _write(self, image, day: str) -> str:
+        import cv2
+
+        success, buffer = cv2.imencode('.jpg', image)
+        if not success:
+            raise ValueError("Could not encode capture as JPEG")
+        data = buffer.tobytes()
+        filename = f"{hashlib.sha256(data).hexdigest()}.jpg"
+        capture_dir = os.path.join(self.root, day)
+        path = os.path.join(capture_dir, filename)
+        relative_path = f"captures/{day}/{filename}"
+
+        if os.path.exists(path):
+            self.deduplicated += 1
+            return relative_path
+
+        os.makedirs(capture_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=capture_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        self._fsync_dir(capture_dir)
+        self.written += 1
+        return relative_path
+
+    @staticmethod
+    def _fsync_dir(path: str):
+        # Make the rename itself durable; not every platform can open a directory
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -1,7 +1,10 @@
-from app import app, db
+from app import create_app, db
 from models import Attendance
 import os
 
+# Only the database is needed; no face gallery, schedulers or email
+app = create_app(services=())
+
 def clear_attendance():
     try:
         with app.app_context():
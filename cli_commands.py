@@ -55,4 +55,271 @@ def register_commands(app):
             
         click.echo("\nAvailable Courses:")
         for course in courses:
-            click.echo(f"- {course.name}") 
\ No newline at end of file
+            click.echo(f"- {course.name}") 
+
+    # Command to profile application startup
+    @app.cli.command('import-profile')
+    @click.option('--module', default='app', help='Module to import')
+    @click.option('--limit', default=20, help='Number of modules to show')
+    def import_profile(module, limit):
+        """Show the slowest modules to import, in milliseconds"""
+        import os
+        import subprocess
+        import sys
+
+        # Modules are already loaded in this process, so time a fresh interpreter
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if result.returncode != 0:
+            errors = result.stderr.strip().splitlines()
+            reason = errors[-1] if errors else f"exit status {result.returncode}"
+            click.echo(f"Importing {module} failed:\n{reason}")
+            return
+
+        timings = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            timings.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+
+        total_ms = max((cumulative for name, _, cumulative in timings if name == module), default=0.0)
+        click.echo(f"\nImporting {module} took {total_ms:.1f} ms ({len(timings)} modules)")
+        click.echo(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for name, self_ms, cumulative_ms in sorted(timings, key=lambda t: t[2], reverse=True)[:limit]:
+            click.echo(f"{cumulative_ms:14.1f} {self_ms:9.1f}  {name}")
+
+    # Command group for face recognition tooling
+    @app.cli.group()
+    def face():
+        """Face recognition commands"""
+        pass
+
+    @face.command('rebuild-encodings')
+    @click.option('--workers', default=0, help='Worker processes (default: one per CPU)')
+    @with_appcontext
+    def rebuild_encodings(workers):
+        """Re-encode every student photo and store the results"""
+        from app import db, get_face_service
+
+        # Skip the gallery load: it would encode students missing an encoding
+        # only for the rebuild below to encode them again
+        face_service = get_face_service(load=False)
+        students = Student.query.filter(Student.photo_path.isnot(None)).all()
+        if not students:
+            click.echo("No students to encode")
+            return
+
+        click.echo(f"Encoding {len(students)} student photos...")
+        report = face_service.bulk_encode_students(students, workers=workers or None)
+        db.session.commit()
+
+        click.echo(f"Encoded: {report['encoded']}/{report['total']} in {report['seconds']:.1f}s")
+        if report['failed']:
+            click.echo("\nFailed photos:")
+            for student_id, error in report['failed']:
+                click.echo(f"- {student_id}: {error}")
+
+    @face.command('benchmark-detection')
+    @click.option('--scales', default='1.0,0.75,0.5,0.25', help='Comma-separated detection scales')
+    @click.option('--upsample', default=1, help='HOG upsampling passes')
+    @click.option('--limit', default=20, help='Maximum number of sample captures')
+    @with_appcontext
+    def benchmark_detection(scales, upsample, limit):
+        """Report detection latency and recall at each scale on saved captures"""
+        import os
+        from face_recognition_service import benchmark_detection as run_benchmark
+
+        captures_dir = os.path.join(current_app.static_folder, 'captures')
+        image_paths = []
+        for root, _, files in os.walk(captures_dir):
+            image_paths.extend(os.path.join(root, name) for name in sorted(files) if name.endswith('.jpg'))
+        image_paths = image_paths[:limit]
+
+        if not image_paths:
+            click.echo("No sample captures found")
+            return
+
+        results = run_benchmark(image_paths, [float(scale) for scale in scales.split(',')], upsample)
+        click.echo(f"\nDetection benchmark on {len(image_paths)} captures (upsample={upsample}):")
+        for result in results:
+            click.echo(f"- scale {result['scale']:.2f}: {result['ms_per_image']:.1f} ms/image, "
+                       f"{result['faces']} faces, recall {result['recall'] * 100:.1f}%")
+
+    @face.command('benchmark-index')
+    @click.option('--synthetic', default=0, help='Benchmark a random gallery of this size instead of stored encodings')
+    @click.option('--clusters', default=256, help='Clusters in the synthetic gallery (0 = unclustered noise)')
+    @click.option('--queries', default=200, help='Number of query faces')
+    @click.option('--k', default=1, help='Neighbours per query')
+    @click.option('--lists', default=64, help='IVF partitions')
+    @click.option('--probes', default=8, help='IVF partitions scanned per query')
+    @with_appcontext
+    def benchmark_index(synthetic, clusters, queries, k, lists, probes):
+        """Compare recall and latency of the IVF index against exact search"""
+        import numpy as np
+        from face_index import FaceGallery, IVFIndex, compare_indexes
+
+        rng = np.random.default_rng(0)
+        if synthetic:
+            student_ids = [f"SYN{i}" for i in range(synthetic)]
+            if clusters:
+                # Real encodings are not uniform noise; group them around cluster
+                # centres so the partitions have structure to exploit
+                centres = rng.normal(0, 0.1, (clusters, 128))
+                labels = rng.integers(0, clusters, synthetic)
+                encodings = (centres[labels] + rng.normal(0, 0.03, (synthetic, 128))).astype(np.float32)
+            else:
+                encodings = rng.normal(0, 0.1, (synthetic, 128)).astype(np.float32)
+        else:
+            gallery = Student.load_encoded_gallery()
+            student_ids = [student_id for student_id, _ in gallery]
+            encodings = np.array([encoding for _, encoding in gallery], dtype=np.float32)
+
+        if not student_ids:
+            click.echo("No encodings to benchmark")
+            return
+
+        exact = FaceGallery()
+        approx = IVFIndex(n_lists=lists, n_probe=probes, min_train_size=len(student_ids) + 1)
+        for student_id, encoding in zip(student_ids, encodings):
+            exact.add(student_id, encoding)
+            approx.add(student_id, encoding)
+        approx.train()
+
+        # Queries are perturbed copies of enrolled faces, like a fresh capture
+        picks = rng.integers(0, len(student_ids), queries)
+        query_faces = encodings[picks] + rng.normal(0, 0.02, (queries, 128)).astype(np.float32)
+        result = compare_indexes(exact, approx, query_faces, k=k)
+
+        click.echo(f"\nGallery size: {len(student_ids)}")
+        click.echo(f"Queries: {result['queries']} (k={result['k']}, lists={lists}, probes={probes})")
+        click.echo(f"Recall@{k}: {result['recall'] * 100:.1f}%")
+        click.echo(f"Exact search: {result['exact_ms_per_query']:.3f} ms/query")
+        click.echo(f"IVF search: {result['approx_ms_per_query']:.3f} ms/query")
+
+    @face.command('benchmark-latency')
+    @click.option('--url', default='http://127.0.0.1:8080', help='Base URL of the running app')
+    @click.option('--pages', default='/,/students,/courses,/records', help='Comma-separated pages to time')
+    @click.option('--requests', 'total', default=200, help='Page requests per run')
+    @click.option('--concurrency', default=4, help='Concurrent page clients')
+    @click.option('--captures', default=2, help='Concurrent capture clients during the loaded run')
+    @click.option('--course-id', type=int, help='Course to capture for (default: first course)')
+    @click.option('--room', default='default', help='Room whose capture session is used')
+    @click.option('--image', type=click.Path(exists=True, dir_okay=False), help='JPEG frame to capture (default: newest saved capture)')
+    @click.option('--yes', is_flag=True, help='Do not ask before recording attendance')
+    @with_appcontext
+    def benchmark_latency(url, pages, total, concurrency, captures, course_id, room, image, yes):
+        """Compare page latency percentiles with and without concurrent captures.
+
+        Runs against a live server (e.g. gunicorn with gevent workers). The
+        loaded run uploads a frame and keeps capturing it, which records
+        attendance for the course, so point it at a test deployment.
+        """
+        import glob
+        import json
+        import os
+        import threading
+        import time
+        import urllib.error
+        import urllib.request
+        from concurrent.futures import ThreadPoolExecutor
+        import numpy as np
+
+        url = url.rstrip('/')
+        pages = [page.strip() for page in pages.split(',') if page.strip()]
+        course = Course.query.get(course_id) if course_id else Course.query.first()
+        if course is None:
+            click.echo("No course to capture for")
+            return
+        if image is None:
+            saved = glob.glob(os.path.join(current_app.static_folder, 'captures', '*', '*.jpg'))
+            image = max(saved, key=os.path.getmtime) if saved else None
+        if image is None:
+            click.echo("No frame to capture; pass --image")
+            return
+        if captures and not yes:
+            click.confirm(f"The loaded run records attendance for {course.name}. Continue?", abort=True)
+
+        def call(path, body=None, content_type='application/json'):
+            data = json.dumps(body).encode() if isinstance(body, dict) else body
+            request = urllib.request.Request(url + path, data=data, headers={'Content-Type': content_type})
+            try:
+                with urllib.request.urlopen(request, timeout=120) as response:
+                    payload = response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                payload, status = e.read(), e.code
+            try:
+                return status, json.loads(payload)
+            except ValueError:
+                return status, None
+
+        def time_pages():
+            def fetch(number):
+                started = time.perf_counter()
+                status, _ = call(pages[number % len(pages)])
+                return time.perf_counter() - started, status
+            with ThreadPoolExecutor(max_workers=concurrency) as clients:
+                results = list(clients.map(fetch, range(total)))
+            return [seconds for seconds, _ in results], sum(1 for _, status in results if status >= 400)
+
+        def report(label, samples, errors):
+            ms = np.array(samples) * 1000
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            click.echo(f"{label:<22} {p50:8.1f} {p95:8.1f} {p99:8.1f} {ms.max():8.1f} {errors:7d}")
+
+        click.echo(f"\nTiming {total} requests to {', '.join(pages)} with {concurrency} clients")
+        click.echo(f"{'run':<22} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7}")
+        report('idle', *time_pages())
+        if not captures:
+            return
+
+        status, body = call('/start_capture', {'course_id': course.id, 'room': room, 'source': 'upload'})
+        if not body or body.get('status') != 'success':
+            click.echo(f"Could not start an upload capture session: {body}")
+            return
+        with open(image, 'rb') as f:
+            frame = f.read()
+        call(f'/upload_frames?room={room}', frame, 'image/jpeg')
+
+        stop = threading.Event()
+        capture_seconds = []
+        capture_outcomes = {}
+
+        def capture_client():
+            while not stop.is_set():
+                started = time.perf_counter()
+                status, body = call('/capture_attendance', {'room': room})
+                while status == 202 and body and not stop.is_set():
+                    time.sleep(0.2)
+                    status, body = call(f"/capture_attendance/jobs/{body['job_id']}")
+                    if body and body.get('job_status') in ('queued', 'running'):
+                        status = 202
+                outcome = (body or {}).get('status', status)
+                capture_outcomes[outcome] = capture_outcomes.get(outcome, 0) + 1
+                capture_seconds.append(time.perf_counter() - started)
+                if outcome in ('busy', 'warming_up'):
+                    time.sleep(1)
+
+        threads = [threading.Thread(target=capture_client, daemon=True) for _ in range(captures)]
+        try:
+            for thread in threads:
+                thread.start()
+            time.sleep(1)  # let the captures get going
+            report(f'{captures} capture clients', *time_pages())
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join(timeout=130)
+            call('/stop_capture', {'room': room})
+
+        if capture_seconds:
+            ms = np.array(capture_seconds) * 1000
+            click.echo(f"\nCaptures: {len(capture_seconds)}, p50 {np.percentile(ms, 50):.0f} ms, "
+                       f"p95 {np.percentile(ms, 95):.0f} ms "
+                       f"({', '.join(f'{key}: {count}' for key, count in sorted(capture_outcomes.items(), key=str))})")
+        _, status_body = call('/recognition_pool')
+        if status_body:
+            click.echo(f"Recognition pool: {status_body}")
@@ -1,5 +1,16 @@
 import os
+import tempfile
 from datetime import timedelta
+from typing import Dict
+
+def parse_camera_sources(value: str) -> Dict:
+    """Parse 'room=source,room=source' into {room: source}; numeric sources are device indexes"""
+    sources = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        room, _, source = item.partition('=')
+        source = source.strip()
+        sources[room.strip()] = int(source) if source.isdigit() else source
+    return sources
 
 class Config:
     # Base directory of the application
@@ -22,6 +33,94 @@ class Config:
     # Query timeout settings
     SQLALCHEMY_RECORD_QUERIES = True
     DATABASE_QUERY_TIMEOUT = 0.5  # Slow query threshold in seconds
+    
+    # Face encoding cache (single .npz file, loaded once at startup)
+    ENCODING_CACHE_PATH = os.getenv('ENCODING_CACHE_PATH', os.path.join(BASE_DIR, 'database', 'face_encodings.npz'))
+    
+    # Face gallery index: 'exact' brute-force search or 'ivf' partitioned
+    # approximate search for very large galleries
+    FACE_INDEX = os.getenv('FACE_INDEX', 'exact')
+    FACE_INDEX_LISTS = int(os.getenv('FACE_INDEX_LISTS', '64'))
+    FACE_INDEX_PROBES = int(os.getenv('FACE_INDEX_PROBES', '8'))
+    FACE_INDEX_MIN_TRAIN_SIZE = 2048
+    
+    # Memory-mapped gallery file shared by all workers on a host (empty = per-process gallery)
+    SHARED_GALLERY_PATH = os.getenv('SHARED_GALLERY_PATH', '')
+    
+    # A failed gallery load is retried after GALLERY_RETRY_DELAY seconds,
+    # doubling up to GALLERY_RETRY_MAX_DELAY; after GALLERY_LOAD_ATTEMPTS
+    # failures /readyz reports 'failed' (retries continue at the longest delay)
+    GALLERY_LOAD_ATTEMPTS = 5
+    GALLERY_RETRY_DELAY = 2.0
+    GALLERY_RETRY_MAX_DELAY = 60.0
+    
+    # Worker processes for bulk photo encoding (0 = one per CPU)
+    ENCODING_WORKERS = int(os.getenv('ENCODING_WORKERS', '0'))
+    
+    # Pending attendance captures recognized and committed per chunk
+    PENDING_BATCH_SIZE = 32
+    
+    # HOG detection runs on an image scaled by DETECTION_SCALE (boxes are mapped
+    # back and encoded at full resolution). DETECTION_UPSAMPLE > 1 finds smaller faces.
+    DETECTION_SCALE = float(os.getenv('DETECTION_SCALE', '1.0'))
+    DETECTION_UPSAMPLE = int(os.getenv('DETECTION_UPSAMPLE', '1'))
+    
+    # Recent camera frames kept by the capture thread for streaming and capture
+    CAMERA_BUFFER_SIZE = 4
+    
+    # Classroom cameras as 'room=source,...' (device index, stream URL, or 'upload'
+    # for frames posted by a browser or edge device);
+    # empty means a single 'default' room using camera 0
+    CAMERA_SOURCES = parse_camera_sources(os.getenv('CAMERA_SOURCES', ''))
+    
+    # Live preview: Haar detection on a downscaled frame every N frames with
+    # tracking in between; N adapts to keep PREVIEW_TARGET_FPS (0 = detect
+    # every frame at full resolution). Capture reuses the live boxes of frames
+    # where detection ran; boxes only tracked since then get a fresh HOG pass
+    PREVIEW_TARGET_FPS = float(os.getenv('PREVIEW_TARGET_FPS', '15'))
+    PREVIEW_DETECTION_SCALE = 0.5
+    PREVIEW_MAX_DETECTION_INTERVAL = 10
+    
+    # Hands-free attendance: seconds between stream samples, consecutive
+    # agreeing matches needed to mark a track's student present, and samples
+    # after which an unresolved track is given up
+    CONTINUOUS_INTERVAL = 1.0
+    CONTINUOUS_STABLE_MATCHES = 3
+    CONTINUOUS_MAX_ATTEMPTS = 6
+    
+    # Frames posted by browsers or edge devices to /upload_frames: sustained
+    # frames per second accepted per session, frames per request and bytes
+    # per frame (larger requests get 413, faster clients 429)
+    # The rate limit is kept by each worker, so with several workers a
+    # client spreading its uploads across them can reach N x UPLOAD_MAX_FPS
+    UPLOAD_MAX_FPS = float(os.getenv('UPLOAD_MAX_FPS', '5'))
+    UPLOAD_MAX_BATCH = 8
+    UPLOAD_MAX_FRAME_BYTES = 512 * 1024
+    # Latest uploaded frame of each session, read by every worker (servers
+    # behind one load balancer need this on a shared mount)
+    LIVE_FRAMES_DIR = os.getenv('LIVE_FRAMES_DIR', os.path.join(tempfile.gettempdir(), 'attendance-live-frames'))
+    
+    # Captures are recognized by background jobs: worker threads running them,
+    # jobs allowed to wait before new captures are refused, and seconds a
+    # finished job's result is kept
+    RECOGNITION_JOB_WORKERS = 2
+    RECOGNITION_MAX_PENDING = 32
+    RECOGNITION_RESULT_TTL = 600
+    
+    # Face detection, encoding and photo checks run in a dedicated process pool
+    # so they never block gevent workers: processes (0 = one per CPU), tasks
+    # allowed to queue behind them, and seconds a caller waits for a free slot
+    # before being told the server is busy
+    RECOGNITION_PROCESSES = int(os.getenv('RECOGNITION_PROCESSES', '2'))
+    RECOGNITION_POOL_QUEUE = 8
+    RECOGNITION_POOL_WAIT = 5.0
+    
+    # Captured frames waiting for the background writer before capture
+    # requests start to wait for it, and how often (with a doubling delay from
+    # CAPTURE_RETRY_DELAY seconds) a failed write is retried before giving up
+    CAPTURE_WRITER_QUEUE = 64
+    CAPTURE_WRITE_ATTEMPTS = 3
+    CAPTURE_RETRY_DELAY = 0.5
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -31,6 +130,9 @@ class ProductionConfig(Config):
     DEBUG = False
     SQLALCHEMY_ECHO = False
     
+    # Gunicorn workers share one memory-mapped face gallery
+    SHARED_GALLERY_PATH = os.getenv('SHARED_GALLERY_PATH', os.path.join(Config.BASE_DIR, 'database', 'face_gallery.bin'))
+    
     # Stricter pool settings for production
     SQLALCHEMY_POOL_SIZE = 20
     SQLALCHEMY_POOL_TIMEOUT = 60
@@ -0,0 +1,161 @@
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+from recognition_pool import RecognitionPoolBusy
+from face_tracking import box_iou
+
+logger = logging.getLogger(__name__)
+
+class ContinuousAttendance:
+    """Hands-free attendance from the live camera stream.
+
+    A background thread samples the newest frame every ``interval`` seconds
+    and runs its own full-resolution ``detect(image)`` on it, so it works
+    whether or not anyone watches the preview. Each box continues the track
+    whose last box it overlaps best (IoU at least ``min_iou``) or starts a
+    new one. Only faces whose track has not been resolved yet are
+    identified, so a person is encoded a handful of times when they appear
+    and never again while their track lasts. A track is resolved once
+    ``stable_matches`` consecutive samples agree on the same student, and
+    ``on_present(student_id, confidence, frame)`` is then called once per
+    student; a track that keeps failing is given up after ``max_attempts``.
+    """
+
+    def __init__(self, app, camera, face_service, course_id: int, candidate_ids: List[str],
+                 on_present, detect, interval: float = 1.0, stable_matches: int = 3,
+                 max_attempts: int = 6, track_timeout: float = 30.0, min_iou: float = 0.3):
+        self.app = app
+        self.camera = camera
+        self.face_service = face_service
+        self.detect = detect
+        self.course_id = course_id
+        self.candidate_ids = candidate_ids
+        self.on_present = on_present
+        self.interval = interval
+        self.stable_matches = stable_matches
+        self.max_attempts = max_attempts
+        self.track_timeout = track_timeout
+        self.min_iou = min_iou
+
+        self._tracks = {}        # track_id: {'box', 'votes', 'attempts', 'done', 'last_seen'}
+        self._next_track_id = 1
+        self._marked = {}        # student_id: confidence
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.frames_sampled = 0
+        self.faces_encoded = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start sampling the stream in a background thread"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f'continuous-attendance-{self.course_id}',
+                                        daemon=True)
+        self._thread.start()
+        logger.info(f"Continuous attendance started for course {self.course_id}")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop sampling; students already marked stay marked"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def status(self) -> Dict:
+        """Summary of the session: marked students and how much recognition work it took"""
+        with self._lock:
+            return {
+                'running': self.running,
+                'course_id': self.course_id,
+                'marked': dict(self._marked),
+                'active_tracks': sum(1 for track in self._tracks.values() if not track['done']),
+                'frames_sampled': self.frames_sampled,
+                'faces_encoded': self.faces_encoded
+            }
+
+    def _run(self):
+        last_seq = 0
+        while not self._stop.wait(self.interval):
+            if not self.camera.running:
+                break
+            frame = self.camera.latest()
+            if frame is None or frame.seq == last_seq:
+                continue
+            last_seq = frame.seq
+            try:
+                with self.app.app_context():
+                    self._process(frame)
+            except RecognitionPoolBusy:
+                logger.debug(f"Recognition pool busy; skipped a sample for course {self.course_id}")
+            except Exception as e:
+                logger.error(f"Error in continuous attendance: {str(e)}")
+        logger.info(f"Continuous attendance stopped for course {self.course_id}")
+
+    def _process(self, frame):
+        import cv2
+
+        now = time.time()
+        boxes = [tuple(int(v) for v in box) for box in self.detect(frame.image)]
+        pending = []
+        with self._lock:
+            self.frames_sampled += 1
+            unmatched = dict(self._tracks)
+            for box in boxes:
+                track = self._associate(box, unmatched)
+                track['box'] = box
+                track['last_seen'] = now
+                if not track['done']:
+                    pending.append((track, box))
+
+            # Forget tracks that left the frame a while ago
+            for track_id in [tid for tid, track in self._tracks.items()
+                             if now - track['last_seen'] > self.track_timeout]:
+                del self._tracks[track_id]
+
+        if not pending:
+            return
+
+        # Encode only the unresolved faces, converted from (x, y, w, h) to (top, right, bottom, left)
+        face_locations = [(int(y), int(x + w), int(y + h), int(x)) for _, (x, y, w, h) in pending]
+        matches = self.face_service.identify_faces(
+            cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB),
+            face_locations,
+            candidate_ids=self.candidate_ids,
+            course_id=self.course_id
+        )
+
+        resolved = []
+        with self._lock:
+            self.faces_encoded += len(pending)
+            for (track, _), match in zip(pending, matches):
+                track['attempts'] += 1
+                track['votes'] = (track['votes'] + [match[0] if match else None])[-self.stable_matches:]
+                student_id = track['votes'][-1]
+                if (student_id is not None and len(track['votes']) == self.stable_matches
+                        and all(vote == student_id for vote in track['votes'])):
+                    track['done'] = True
+                    if student_id not in self._marked:
+                        self._marked[student_id] = match[1]
+                        resolved.append((student_id, match[1]))
+                elif track['attempts'] >= self.max_attempts:
+                    track['done'] = True  # unknown or unstable; don't keep paying for it
+
+        for student_id, confidence in resolved:
+            self.on_present(student_id, confidence, frame)
+
+    def _associate(self, box, unmatched: Dict) -> Dict:
+        """Continue the unmatched track overlapping ``box`` best, or start a new one"""
+        best_id = max(unmatched, key=lambda track_id: box_iou(unmatched[track_id]['box'], box), default=None)
+        if best_id is not None and box_iou(unmatched[best_id]['box'], box) >= self.min_iou:
+            return unmatched.pop(best_id)
+        track = {'box': box, 'votes': [], 'attempts': 0, 'done': False, 'last_seen': None}
+        self._tracks[self._next_track_id] = track
+        self._next_track_id += 1
+        return track
@@ -0,0 +1,202 @@
+import os
+import hashlib
+import logging
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines run a single process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class EncodingCache:
+    """On-disk store of student face encodings keyed by photo fingerprint.
+
+    All entries live in a single ``.npz`` file so the whole cache is loaded
+    with one read at startup. An entry is reused only while the student's
+    photo is unchanged (same path and size/mtime, or same content hash) and
+    it was produced by the same encoding ``model`` and ``version``.
+
+    Several workers share the file. ``save()`` merges this worker's changes
+    into the file on disk under a lock, so a worker that never loaded the
+    cache, or saves at the same time as another, keeps everyone's entries.
+    """
+
+    def __init__(self, cache_path: str, model: str, version: int):
+        self.cache_path = cache_path
+        self.model = model
+        self.version = version
+        self.entries = {}  # student_id: (photo_path, mtime_ns, size, sha1, encoding, model, version)
+        self._changed = {}  # entries added or refreshed since the last save
+        self._removed = set()
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._changed or self._removed)
+
+    def load(self) -> int:
+        """Load all cached entries from disk, returning the number loaded"""
+        self.entries = self._read()
+        self.entries.update(self._changed)
+        for student_id in self._removed:
+            self.entries.pop(student_id, None)
+        if self.entries:
+            logger.info(f"Loaded {len(self.entries)} cached face encodings from {self.cache_path}")
+        return len(self.entries)
+
+    def _read(self) -> Dict:
+        entries = {}
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return entries
+
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                student_ids = data['student_ids']
+                photo_paths = data['photo_paths']
+                mtimes = data['mtimes']
+                sizes = data['sizes']
+                hashes = data['hashes']
+                encodings = data['encodings']
+                # Files written before entries were stamped match no model
+                models = data['models'] if 'models' in data else [''] * len(student_ids)
+                versions = data['versions'] if 'versions' in data else [0] * len(student_ids)
+
+            for i, student_id in enumerate(student_ids):
+                entries[str(student_id)] = (
+                    str(photo_paths[i]),
+                    int(mtimes[i]),
+                    int(sizes[i]),
+                    str(hashes[i]),
+                    encodings[i],
+                    str(models[i]),
+                    int(versions[i])
+                )
+        except Exception as e:
+            logger.error(f"Error loading face encoding cache: {str(e)}")
+            return {}
+        return entries
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold an exclusive lock on the cache file across processes"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.cache_path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self) -> bool:
+        """Merge changes into the file on disk and atomically replace it"""
+        if not self.dirty or not self.cache_path:
+            return True
+
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            with self._file_lock():
+                # Start from what other workers have saved, then apply this worker's changes
+                merged = self._read()
+                merged.update(self._changed)
+                for student_id in self._removed:
+                    merged.pop(student_id, None)
+                self._write(merged)
+            self.entries = merged
+            self._changed = {}
+            self._removed = set()
+            return True
+
+        except Exception as e:
+            logger.error(f"Error saving face encoding cache: {str(e)}")
+            return False
+
+    def _write(self, entries: Dict):
+        student_ids = list(entries.keys())
+        rows = [entries[sid] for sid in student_ids]
+        if rows:
+            encodings = np.stack([row[4] for row in rows]).astype(np.float32)
+        else:
+            encodings = np.empty((0, 128), dtype=np.float32)
+
+        # Write to a temp file in the same directory, then swap it in
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.cache_path) or '.', suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(
+                    f,
+                    student_ids=np.array(student_ids, dtype=str),
+                    photo_paths=np.array([row[0] for row in rows], dtype=str),
+                    mtimes=np.array([row[1] for row in rows], dtype=np.int64),
+                    sizes=np.array([row[2] for row in rows], dtype=np.int64),
+                    hashes=np.array([row[3] for row in rows], dtype=str),
+                    encodings=encodings,
+                    models=np.array([row[5] for row in rows], dtype=str),
+                    versions=np.array([row[6] for row in rows], dtype=np.int64)
+                )
+            os.replace(tmp_path, self.cache_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    @staticmethod
+    def _file_hash(path: str) -> str:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def fingerprint(self, full_path: str) -> Tuple[int, int, str]:
+        """Return (mtime_ns, size, sha1) for a photo file"""
+        stat = os.stat(full_path)
+        return stat.st_mtime_ns, stat.st_size, self._file_hash(full_path)
+
+    def _set(self, student_id: str, entry: Tuple):
+        self.entries[student_id] = entry
+        self._changed[student_id] = entry
+        self._removed.discard(student_id)
+
+    def get(self, student_id: str, photo_path: str, full_path: str) -> Optional[np.ndarray]:
+        """Return the cached encoding if the student's photo and the encoding model are unchanged"""
+        entry = self.entries.get(student_id)
+        if entry is None or entry[0] != photo_path or entry[5:] != (self.model, self.version):
+            return None
+
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            return None
+
+        cached_path, mtime_ns, size, sha1, encoding = entry[:5]
+        if stat.st_mtime_ns == mtime_ns and stat.st_size == size:
+            return encoding
+
+        # Metadata changed (e.g. file copied); fall back to the content hash
+        if stat.st_size == size and self._file_hash(full_path) == sha1:
+            self._set(student_id, (cached_path, stat.st_mtime_ns, size, sha1, encoding) + entry[5:])
+            return encoding
+
+        return None
+
+    def put(self, student_id: str, photo_path: str, full_path: str, encoding: np.ndarray):
+        """Record a freshly computed encoding for a student's photo"""
+        try:
+            mtime_ns, size, sha1 = self.fingerprint(full_path)
+        except OSError as e:
+            logger.warning(f"Could not fingerprint photo for student {student_id}: {str(e)}")
+            return
+        self._set(student_id, (photo_path, mtime_ns, size, sha1, np.asarray(encoding, dtype=np.float32),
+                               self.model, self.version))
+
+    def remove(self, student_id: str):
+        """Forget a student's cached encoding"""
+        self.entries.pop(student_id, None)
+        self._changed.pop(student_id, None)
+        self._removed.add(student_id)
@@ -0,0 +1,286 @@
+import time
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENCODING_SIZE = 128
+
+def pairwise_distances(faces: np.ndarray, gallery: np.ndarray) -> np.ndarray:
+    """Euclidean distances between every face and every gallery row (faces x rows)"""
+    faces = np.asarray(faces, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    if len(gallery) == 0:
+        return np.empty((len(faces), 0), dtype=np.float32)
+    squared = (
+        np.einsum('ij,ij->i', faces, faces)[:, None]
+        + np.einsum('ij,ij->i', gallery, gallery)[None, :]
+        - 2.0 * faces @ gallery.T
+    )
+    return np.sqrt(np.maximum(squared, 0.0))
+
+def top_k_rows(distances: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k smallest distances per row, nearest first"""
+    n = distances.shape[1]
+    k = max(1, min(k, n))
+    if k < n:
+        candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(n), (distances.shape[0], 1))
+    order = np.argsort(np.take_along_axis(distances, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+class FaceIndex(ABC):
+    """Nearest-neighbour index over student face encodings.
+
+    Implementations support incremental add/remove so the index can follow
+    student registration, edits and deletion without a rebuild.
+    """
+
+    @abstractmethod
+    def add(self, student_id: str, encoding: np.ndarray):
+        """Insert or replace the encoding for a student"""
+
+    @abstractmethod
+    def remove(self, student_id: str) -> bool:
+        """Remove a student, returning False if it was not indexed"""
+
+    @abstractmethod
+    def get(self, student_id: str) -> Optional[np.ndarray]:
+        """Return the stored encoding for a student"""
+
+    @abstractmethod
+    def search(self, faces, k: int = 1) -> List[List[Tuple[str, float]]]:
+        """Return up to k (student_id, distance) pairs per face, nearest first"""
+
+    @abstractmethod
+    def __len__(self):
+        """Number of indexed students"""
+
+    @property
+    def version(self) -> int:
+        """Version of externally published changes (0 for in-process indexes)"""
+        return 0
+
+    @contextmanager
+    def batch(self, reset: bool = False):
+        """Group a run of adds/removes; in-process indexes apply them immediately"""
+        yield
+
+class FaceGallery(FaceIndex):
+    """Exact-search gallery packed into parallel arrays.
+
+    Row i holds a student's float32 encoding in ``matrix[i]`` and their ID
+    in ``ids[i]``; ``rows`` maps student IDs back to rows. Removal moves the
+    last row into the freed slot, so add, update and remove are all O(1) and
+    matching runs on the matrix directly.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._matrix = np.empty((capacity, ENCODING_SIZE), dtype=np.float32)
+        self._ids = []      # row -> student_id
+        self._rows = {}     # student_id -> row
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[:len(self._ids)]
+
+    @property
+    def ids(self) -> List[str]:
+        return self._ids
+
+    def add(self, student_id: str, encoding: np.ndarray):
+        row = self._rows.get(student_id)
+        if row is None:
+            row = len(self._ids)
+            if row == len(self._matrix):
+                capacity = max(64, 2 * len(self._matrix))
+                grown = np.empty((capacity, ENCODING_SIZE), dtype=np.float32)
+                grown[:row] = self._matrix[:row]
+                self._matrix = grown
+            self._ids.append(student_id)
+            self._rows[student_id] = row
+        self._matrix[row] = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+
+    def remove(self, student_id: str) -> bool:
+        row = self._rows.pop(student_id, None)
+        if row is None:
+            return False
+        last = len(self._ids) - 1
+        if row != last:
+            moved_id = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+        self._ids.pop()
+        return True
+
+    def get(self, student_id: str) -> Optional[np.ndarray]:
+        row = self._rows.get(student_id)
+        return None if row is None else self._matrix[row]
+
+    def search(self, faces, k: int = 1) -> List[List[Tuple[str, float]]]:
+        faces = np.asarray(faces, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if len(self._ids) == 0:
+            return [[] for _ in range(len(faces))]
+        distances = pairwise_distances(faces, self.matrix)
+        nearest = top_k_rows(distances, k)
+        return [
+            [(self._ids[col], float(distances[i, col])) for col in cols]
+            for i, cols in enumerate(nearest)
+        ]
+
+class IVFIndex(FaceIndex):
+    """Approximate search with an inverted-file (IVF) partition of the gallery.
+
+    Encodings are clustered into ``n_lists`` partitions with k-means; a query
+    only scans the ``n_probe`` partitions whose centroids are nearest. Until
+    the gallery reaches ``min_train_size`` it behaves like exact search.
+    """
+
+    def __init__(self, n_lists: int = 64, n_probe: int = 8, min_train_size: int = 2048,
+                 kmeans_iterations: int = 10, seed: int = 0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+        self.centroids = None
+        self._lists = [FaceGallery()]       # single list until trained
+        self._assignment = {}               # student_id -> list number
+        self._trained_size = 0
+
+    def __len__(self):
+        return len(self._assignment)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _nearest_list(self, encoding: np.ndarray) -> int:
+        if not self.is_trained:
+            return 0
+        return int(np.argmin(pairwise_distances(encoding, self.centroids)[0]))
+
+    def add(self, student_id: str, encoding: np.ndarray):
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        target = self._nearest_list(encoding)
+        current = self._assignment.get(student_id)
+        if current is not None and current != target:
+            self._lists[current].remove(student_id)
+        self._lists[target].add(student_id, encoding)
+        self._assignment[student_id] = target
+
+        # Train once the gallery is large enough, and retrain as it doubles
+        if len(self) >= self.min_train_size and len(self) >= 2 * self._trained_size:
+            self.train()
+
+    def remove(self, student_id: str) -> bool:
+        current = self._assignment.pop(student_id, None)
+        if current is None:
+            return False
+        return self._lists[current].remove(student_id)
+
+    def get(self, student_id: str) -> Optional[np.ndarray]:
+        current = self._assignment.get(student_id)
+        return None if current is None else self._lists[current].get(student_id)
+
+    def train(self):
+        """Cluster the current encodings and redistribute them into partitions"""
+        student_ids = [sid for lst in self._lists for sid in lst.ids]
+        if not student_ids:
+            return
+        data = np.concatenate([lst.matrix for lst in self._lists])
+        n_lists = min(self.n_lists, len(data))
+
+        rng = np.random.default_rng(self.seed)
+        centroids = data[rng.choice(len(data), n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            labels = np.argmin(pairwise_distances(data, centroids), axis=1)
+            counts = np.bincount(labels, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            occupied = counts > 0
+            centroids[occupied] = sums[occupied] / counts[occupied, None]
+        labels = np.argmin(pairwise_distances(data, centroids), axis=1)
+
+        self.centroids = centroids
+        self._lists = [FaceGallery() for _ in range(n_lists)]
+        self._assignment = {}
+        for sid, encoding, label in zip(student_ids, data, labels):
+            self._lists[label].add(sid, encoding)
+            self._assignment[sid] = int(label)
+        self._trained_size = len(student_ids)
+        logger.info(f"Trained IVF face index: {len(student_ids)} encodings in {n_lists} partitions")
+
+    def search(self, faces, k: int = 1) -> List[List[Tuple[str, float]]]:
+        faces = np.asarray(faces, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if not self.is_trained:
+            return self._lists[0].search(faces, k)
+
+        probes = top_k_rows(pairwise_distances(faces, self.centroids), self.n_probe)
+
+        # Scan each probed partition once for all faces that selected it
+        merged = [[] for _ in range(len(faces))]
+        for list_no in np.unique(probes):
+            face_rows = np.nonzero((probes == list_no).any(axis=1))[0]
+            for face_row, matches in zip(face_rows, self._lists[list_no].search(faces[face_rows], k)):
+                merged[face_row].extend(matches)
+
+        results = []
+        for matches in merged:
+            matches.sort(key=lambda match: match[1])
+            results.append(matches[:k])
+        return results
+
+def create_face_index(config) -> FaceIndex:
+    """Build the face index selected by the FACE_INDEX config setting"""
+    kind = config.get('FACE_INDEX', 'exact')
+    shared_path = config.get('SHARED_GALLERY_PATH')
+    if shared_path:
+        from shared_gallery import SharedGalleryIndex
+        if kind != 'exact':
+            logger.warning("Shared gallery only supports exact search, ignoring FACE_INDEX")
+        return SharedGalleryIndex(shared_path)
+    if kind == 'ivf':
+        return IVFIndex(
+            n_lists=config.get('FACE_INDEX_LISTS', 64),
+            n_probe=config.get('FACE_INDEX_PROBES', 8),
+            min_train_size=config.get('FACE_INDEX_MIN_TRAIN_SIZE', 2048)
+        )
+    if kind != 'exact':
+        logger.warning(f"Unknown FACE_INDEX '{kind}', using exact search")
+    return FaceGallery()
+
+def compare_indexes(exact: FaceIndex, approx: FaceIndex, queries: np.ndarray, k: int = 1) -> Dict:
+    """Measure recall@k and per-query latency of an approximate index against exact search"""
+    queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+
+    # Queries run one at a time, as a capture only holds a handful of faces
+    start = time.perf_counter()
+    exact_results = [exact.search(query, k)[0] for query in queries]
+    exact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    approx_results = [approx.search(query, k)[0] for query in queries]
+    approx_seconds = time.perf_counter() - start
+
+    hits = 0
+    total = 0
+    for truth, found in zip(exact_results, approx_results):
+        truth_ids = {sid for sid, _ in truth}
+        hits += len(truth_ids & {sid for sid, _ in found})
+        total += len(truth_ids)
+
+    return {
+        'queries': len(queries),
+        'k': k,
+        'recall': hits / total if total else 1.0,
+        'exact_ms_per_query': exact_seconds * 1000 / max(1, len(queries)),
+        'approx_ms_per_query': approx_seconds * 1000 / max(1, len(queries))
+    }
@@ -1,63 +1,448 @@
-import face_recognition
-import cv2
 import numpy as np
 import os
-from datetime import datetime
-from models import db, Student, Attendance
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from models import (db, Student, Attendance, GalleryChange, GalleryVersion,
+                    FACE_ENCODING_MODEL, FACE_ENCODING_VERSION)
+from encoding_cache import EncodingCache
+from face_index import create_face_index, pairwise_distances, top_k_rows
+from shared_gallery import SharedGalleryIndex
+from recognition_pool import RecognitionPoolBusy, process_context
 from typing import List, Tuple, Optional, Dict
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# face_recognition (which loads the dlib models on import) and cv2 are imported
+# on first use, so importing this module stays cheap for CLI commands and
+# workers that never run recognition.
+
+def _face_recognition():
+    """Return the face_recognition module, importing it on first use"""
+    import face_recognition
+    return face_recognition
+
+def encode_face_image(photo_path: str) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """Encode the largest face in a photo, returning (encoding, error message).
+    
+    Module-level so it can run in worker processes for bulk encoding.
+    """
+    try:
+        image = _face_recognition().load_image_file(photo_path)
+        
+        # First detect face locations
+        face_locations = _face_recognition().face_locations(image, model="hog")
+        if not face_locations:
+            return None, "No face found in photo"
+        
+        if len(face_locations) > 1:
+            # Get the largest face by area
+            face_locations = [max(face_locations, key=lambda rect: (rect[2] - rect[0]) * (rect[1] - rect[3]))]
+        
+        # Get encodings for the detected face
+        encodings = _face_recognition().face_encodings(image, face_locations)
+        if not encodings:
+            return None, "Could not generate encoding"
+        
+        return encodings[0], None
+        
+    except Exception as e:
+        return None, str(e)
+
+def detect_faces(image: np.ndarray, scale: float = 1.0, upsample: int = 1) -> List[Tuple[int, int, int, int]]:
+    """Run HOG face detection, optionally on a downscaled copy of the image.
+    
+    Boxes are returned as (top, right, bottom, left) in full-resolution
+    coordinates so encodings can be computed from the original image.
+    """
+    if scale >= 1.0:
+        return _face_recognition().face_locations(image, number_of_times_to_upsample=upsample, model="hog")
+    
+    import cv2
+    
+    small = cv2.resize(image, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    height, width = image.shape[:2]
+    locations = []
+    for top, right, bottom, left in _face_recognition().face_locations(
+            small, number_of_times_to_upsample=upsample, model="hog"):
+        locations.append((
+            max(0, int(round(top / scale))),
+            min(width, int(round(right / scale))),
+            min(height, int(round(bottom / scale))),
+            max(0, int(round(left / scale)))
+        ))
+    return locations
+
+def encode_image_faces(image: np.ndarray, face_locations=None, scale: float = 1.0,
+                       upsample: int = 1) -> List[np.ndarray]:
+    """Encode the faces in an RGB image, detecting them first unless locations are given"""
+    if face_locations is None:
+        face_locations = detect_faces(image, scale, upsample)
+    if not face_locations:
+        return []
+    
+    # Get encodings for all detected faces from the full-resolution image
+    return _face_recognition().face_encodings(image, face_locations)
+
+def encode_capture_faces(image_path: str, scale: float = 1.0,
+                         upsample: int = 1) -> Tuple[List[np.ndarray], Optional[str]]:
+    """Detect and encode every face in a capture, returning (encodings, error message)"""
+    try:
+        image = _face_recognition().load_image_file(image_path)
+        return encode_image_faces(image, scale=scale, upsample=upsample), None
+        
+    except Exception as e:
+        return [], str(e)
+
+def verify_face_photo(photo_path: str, scale: float = 1.0, upsample: int = 1,
+                      encode: bool = True) -> Dict:
+    """Validate a student photo and encode its face in a single pass.
+    
+    The image is decoded and run through detection once. When the photo
+    is valid, the result's ``encoding`` holds the face encoding.
+    Module-level so it can run on the recognition pool.
+    """
+    try:
+        image = _face_recognition().load_image_file(photo_path)
+        face_locations = detect_faces(image, scale, upsample)
+        
+        result = {
+            "is_valid": False,
+            "message": "",
+            "face_count": len(face_locations),
+            "encoding": None
+        }
+        
+        if len(face_locations) == 0:
+            result["message"] = "No face detected in the photo"
+        elif len(face_locations) > 1:
+            result["message"] = "Multiple faces detected in the photo"
+        else:
+            # Check if face is large enough
+            top, right, bottom, left = face_locations[0]
+            face_height = bottom - top
+            face_width = right - left
+            image_height, image_width = image.shape[:2]
+            
+            min_face_size_ratio = 0.2  # Face should be at least 20% of image height
+            if face_height < image_height * min_face_size_ratio:
+                result["message"] = "Face is too small in the photo"
+            elif encode:
+                encodings = _face_recognition().face_encodings(image, face_locations)
+                if encodings:
+                    result["is_valid"] = True
+                    result["message"] = "Photo is suitable for face recognition"
+                    result["encoding"] = encodings[0]
+                else:
+                    result["message"] = "Could not generate a face encoding from the photo"
+            else:
+                result["is_valid"] = True
+                result["message"] = "Photo is suitable for face recognition"
+        
+        return result
+    
+    except Exception as e:
+        logger.error(f"Error verifying photo: {str(e)}")
+        return {
+            "is_valid": False,
+            "message": f"Error processing photo: {str(e)}",
+            "face_count": 0,
+            "encoding": None
+        }
+
+def _box_iou(a, b) -> float:
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    if bottom <= top or right <= left:
+        return 0.0
+    intersection = (bottom - top) * (right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return intersection / float(area_a + area_b - intersection)
+
+def benchmark_detection(image_paths: List[str], scales: List[float], upsample: int = 1) -> List[Dict]:
+    """Measure HOG detection latency and recall at each scale.
+    
+    Recall is relative to full-resolution detection: a reference face counts as
+    found when a box at the given scale overlaps it with IoU >= 0.5.
+    """
+    images = [_face_recognition().load_image_file(path) for path in image_paths]
+    references = [detect_faces(image, 1.0, upsample) for image in images]
+    reference_count = sum(len(boxes) for boxes in references)
+    
+    results = []
+    for scale in scales:
+        found = 0
+        started = time.perf_counter()
+        detections = [detect_faces(image, scale, upsample) for image in images]
+        seconds = time.perf_counter() - started
+        for reference, boxes in zip(references, detections):
+            found += sum(1 for ref in reference if any(_box_iou(ref, box) >= 0.5 for box in boxes))
+        results.append({
+            'scale': scale,
+            'ms_per_image': seconds * 1000 / max(1, len(images)),
+            'faces': sum(len(boxes) for boxes in detections),
+            'recall': found / reference_count if reference_count else 1.0
+        })
+    return results
+
 class FaceRecognitionService:
-    def __init__(self, app):
+    def __init__(self, app, warm_up: bool = False, pool=None, load: bool = True):
         self.app = app
-        self.known_face_encodings = {}  # student_id: encoding
-        self.known_face_names = {}      # student_id: name
-        self.encoding_timestamp = {}    # student_id: last_update_time
+        
+        # CPU-bound detection and encoding run on this RecognitionPool when set
+        self.pool = pool
         self.min_confidence_threshold = 0.6
-        self.load_known_faces()
+        
+        # Gallery of known faces: encodings live in the index (a packed
+        # FaceGallery by default, see FACE_INDEX)
+        self.face_index = create_face_index(app.config)
+        self.shared_gallery = isinstance(self.face_index, SharedGalleryIndex)
+        self._gallery_generation = 0
+        self._gallery_lock = threading.RLock()
+        self._gallery_version = 0  # last GalleryVersion applied by this worker
+        self.encoding_workers = app.config.get('ENCODING_WORKERS') or os.cpu_count() or 1
+        
+        # Detection runs on a downscaled copy; upsampling helps with small, distant faces
+        self.detection_scale = app.config.get('DETECTION_SCALE', 1.0)
+        self.detection_upsample = app.config.get('DETECTION_UPSAMPLE', 1)
+        
+        # Per-course slices of the gallery: course_id -> (roster, generation, matrix, ids)
+        self._course_galleries = {}
+        
+        # Persistent encoding cache so unchanged photos are not re-encoded on startup
+        self.encoding_cache = EncodingCache(app.config.get('ENCODING_CACHE_PATH'),
+                                            FACE_ENCODING_MODEL, FACE_ENCODING_VERSION)
+        
+        # Gallery load progress; recognition waits for gallery_ready
+        self.gallery_ready = threading.Event()
+        self.load_progress = {'loaded': 0, 'total': 0, 'started_at': None, 'finished_at': None,
+                              'error': None, 'failures': 0}
+        self.load_attempts = app.config.get('GALLERY_LOAD_ATTEMPTS', 5)
+        self.retry_delay = app.config.get('GALLERY_RETRY_DELAY', 2.0)
+        self.retry_max_delay = app.config.get('GALLERY_RETRY_MAX_DELAY', 60.0)
+        # Without ``load`` the caller fills the gallery itself (e.g. a forced rebuild)
+        if not load:
+            return
+        if warm_up:
+            self.start_warm_up()
+        else:
+            self.load_known_faces()
+    
+    def start_warm_up(self):
+        """Load the gallery in a background thread so the web UI can serve meanwhile"""
+        threading.Thread(target=self._warm_up, name='gallery-warm-up', daemon=True).start()
+    
+    def _warm_up(self):
+        """Load the gallery, retrying with exponential backoff until it succeeds"""
+        delay = self.retry_delay
+        while True:
+            try:
+                self.load_known_faces()
+                self.load_progress.update(error=None, failures=0)
+                return
+            except Exception as e:
+                # The last error stays visible in load_status() while retrying
+                self.load_progress['failures'] += 1
+                self.load_progress['error'] = str(e)
+                logger.error(f"Error loading face gallery (failure {self.load_progress['failures']}), "
+                             f"retrying in {delay:g}s: {str(e)}")
+            time.sleep(delay)
+            delay = min(delay * 2, self.retry_max_delay)
+    
+    def load_status(self) -> Dict:
+        """Report gallery load progress: state, students loaded/total and elapsed seconds.
+        
+        ``state`` is 'ready', 'warming_up', or 'failed' once GALLERY_LOAD_ATTEMPTS
+        loads in a row have failed (the load keeps being retried).
+        """
+        progress = self.load_progress
+        started, finished = progress['started_at'], progress['finished_at']
+        elapsed = (finished or time.time()) - started if started else 0.0
+        ready = self.gallery_ready.is_set()
+        if ready:
+            state = 'ready'
+        elif progress['failures'] >= self.load_attempts:
+            state = 'failed'
+        else:
+            state = 'warming_up'
+        return {
+            'ready': ready,
+            'state': state,
+            'failures': progress['failures'],
+            'loaded': progress['loaded'],
+            'total': progress['total'],
+            'elapsed_seconds': round(elapsed, 2),
+            'error': progress['error']
+        }
     
     def load_known_faces(self):
-        """Load face encodings for all registered students"""
+        """Load face encodings for all registered students.
+        
+        Encodings stored on Student rows are loaded with one bulk SELECT; only
+        students without a current stored encoding fall back to the on-disk
+        cache or, failing that, to decoding and encoding their photo.
+        """
+        self.load_progress.update(loaded=0, started_at=time.time(), finished_at=None)
         with self.app.app_context():
-            students = Student.query.all()
-            for student in students:
-                self._add_student_encoding(student)
+            self.load_progress['total'] = Student.query.count()
+            if not self.shared_gallery:
+                self._load_gallery()
+            else:
+                # Only the first worker of a server builds and publishes the shared gallery
+                with self.face_index.file_lock():
+                    if self.face_index.published_by_sibling():
+                        self._gallery_version = GalleryVersion.current()
+                        self.load_progress['loaded'] = len(self.face_index)
+                        logger.info(f"Using shared face gallery with {len(self.face_index)} encodings")
+                    else:
+                        self._load_gallery()
+        
+        self.load_progress['finished_at'] = time.time()
+        self.gallery_ready.set()
     
-    def _add_student_encoding(self, student: Student) -> bool:
-        """Generate and store face encoding for a single student"""
-        try:
-            # Get full path to student photo
-            photo_path = os.path.join(self.app.static_folder, student.photo_path)
-            
-            # Load and encode face
-            image = face_recognition.load_image_file(photo_path)
+    def _load_gallery(self):
+        """Rebuild the gallery from the database, the file cache and the photos"""
+        # Changes logged from here on are replayed by the next sync_gallery()
+        self._gallery_version = GalleryVersion.current()
+        
+        with self.face_index.batch(reset=True):
+            stored = Student.load_encoded_gallery()
+            for student_id, encoding in stored:
+                self._store_encoding(student_id, encoding)
+            db_count = len(stored)
+            self.load_progress['loaded'] = db_count
             
-            # First detect face locations
-            face_locations = face_recognition.face_locations(image, model="hog")
+            missing = Student.query.filter(db.not_(Student.encoding_is_current())).all()
+            if missing:
+                self.encoding_cache.load()
             
-            if not face_locations:
-                logger.warning(f"No face found in photo for student {student.name}")
-                return False
+            cached_count = 0
+            to_encode = []
+            for student in missing:
+                if not student.photo_path:
+                    continue
+                photo_path = os.path.join(self.app.static_folder, student.photo_path)
+                encoding = self.encoding_cache.get(student.student_id, student.photo_path, photo_path)
+                if encoding is not None:
+                    self._store_encoding(student.student_id, encoding)
+                    student.set_face_encoding(encoding)
+                    cached_count += 1
+                    self.load_progress['loaded'] += 1
+                else:
+                    to_encode.append(student)
             
-            if len(face_locations) > 1:
-                logger.warning(f"Multiple faces found in photo for student {student.name}. Using the largest face.")
-                # Get the largest face by area
-                face_locations = [max(face_locations, key=lambda rect: (rect[2] - rect[0]) * (rect[1] - rect[3]))]
+            if to_encode:
+                loaded = self.load_progress['loaded']
+                self.bulk_encode_students(
+                    to_encode, save_cache=False,
+                    progress=lambda done: self.load_progress.update(loaded=loaded + done)
+                )
             
-            # Get encodings for the detected face
-            encodings = face_recognition.face_encodings(image, face_locations)
+            if missing:
+                # Persist the backfilled encodings so other workers can skip this work
+                try:
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error saving face encodings to database: {str(e)}")
+                self.encoding_cache.save()
+        
+        logger.info(f"Loaded {len(self.face_index)} face encodings "
+                    f"({db_count} from database, {cached_count} from cache)")
+    
+    def _offload(self, fn, *args, timeout: Optional[float] = None):
+        """Run ``fn(*args)`` on the recognition pool, or inline without one"""
+        if self.pool is None:
+            return fn(*args)
+        return self.pool.run(fn, *args, timeout=timeout)
+    
+    def _store_encoding(self, student_id: str, encoding: np.ndarray):
+        """Store an encoding in the gallery"""
+        with self._gallery_lock:
+            self.face_index.add(student_id, encoding)
+            self._gallery_generation += 1
+    
+    def bulk_encode_students(self, students: List[Student], workers: Optional[int] = None,
+                             save_cache: bool = True, progress=None) -> Dict:
+        """Encode many student photos over a process pool.
+        
+        Results come back in input order and are merged into the gallery in one
+        step once every photo has been processed. The caller commits the
+        Student rows. ``progress`` is called with the number of photos done so
+        far. Returns a report with per-photo failures.
+        """
+        started = time.perf_counter()
+        workers = workers or self.encoding_workers
+        photo_paths = [os.path.join(self.app.static_folder, student.photo_path) for student in students]
+        
+        results = []
+        if workers > 1 and len(photo_paths) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(photo_paths)),
+                                     mp_context=process_context()) as pool:
+                for result in pool.map(encode_face_image, photo_paths, chunksize=4):
+                    results.append(result)
+                    if progress:
+                        progress(len(results))
+        else:
+            for path in photo_paths:
+                results.append(encode_face_image(path))
+                if progress:
+                    progress(len(results))
+        
+        encoded = []
+        failed = []
+        for student, photo_path, (encoding, error) in zip(students, photo_paths, results):
+            if encoding is None:
+                logger.warning(f"Could not encode photo for student {student.name}: {error}")
+                failed.append((student.student_id, error))
+            else:
+                encoded.append((student, photo_path, encoding))
+        
+        # Merge all new encodings at once so matching never sees a half-updated gallery
+        with self._gallery_lock, self.face_index.batch():
+            for student, photo_path, encoding in encoded:
+                self._store_encoding(student.student_id, encoding)
+                self._record_change(student.student_id, 'upsert')
+                student.set_face_encoding(encoding)
+                self.encoding_cache.put(student.student_id, student.photo_path, photo_path, encoding)
+        if save_cache:
+            self.encoding_cache.save()
+        
+        seconds = time.perf_counter() - started
+        logger.info(f"Bulk encoded {len(encoded)}/{len(students)} student photos "
+                    f"with {workers} workers in {seconds:.1f}s")
+        return {
+            'total': len(students),
+            'encoded': len(encoded),
+            'failed': failed,
+            'seconds': seconds
+        }
+    
+    def _add_student_encoding(self, student: Student, save_cache: bool = True,
+                              encoding: Optional[np.ndarray] = None) -> bool:
+        """Store face encoding for a single student, generating it unless one is given"""
+        try:
+            # Get full path to student photo
+            photo_path = os.path.join(self.app.static_folder, student.photo_path)
             
-            if not encodings:
-                logger.warning(f"Could not generate encoding for student {student.name}")
-                return False
+            # Load and encode face
+            if encoding is None:
+                encoding, error = self._offload(encode_face_image, photo_path)
+                if encoding is None:
+                    logger.warning(f"Could not encode photo for student {student.name}: {error}")
+                    return False
             
-            # Store encoding and metadata
-            self.known_face_encodings[student.student_id] = encodings[0]
-            self.known_face_names[student.student_id] = student.name
-            self.encoding_timestamp[student.student_id] = datetime.now()
+            # Store encoding and metadata; the caller commits the Student row
+            self._store_encoding(student.student_id, encoding)
+            self._record_change(student.student_id, 'upsert')
+            student.set_face_encoding(encoding)
+            self.encoding_cache.put(student.student_id, student.photo_path, photo_path, encoding)
+            if save_cache:
+                self.encoding_cache.save()
             
             logger.info(f"Successfully added face encoding for student {student.name}")
             return True
@@ -66,78 +451,296 @@ class FaceRecognitionService:
             logger.error(f"Error adding face encoding for student {student.name}: {str(e)}")
             return False
     
-    def process_pending_attendance(self):
-        """Process all pending attendance records"""
+    def process_pending_attendance(self, batch_size: Optional[int] = None) -> Dict:
+        """Process all pending attendance records in bounded chunks.
+        
+        Captures in each chunk are decoded and encoded in parallel worker
+        processes, matched against their course roster, and written back with
+        one bulk UPDATE and one commit. Returns throughput and backlog figures.
+        """
+        if not self.gallery_ready.is_set():
+            logger.info("Face gallery is still loading; pending attendance will be processed later")
+            return None
+        
+        batch_size = batch_size or self.app.config.get('PENDING_BATCH_SIZE', 32)
+        started = time.perf_counter()
+        report = {'processed': 0, 'present': 0, 'unknown': 0}
+        
         with self.app.app_context():
-            pending_records = Attendance.query.filter_by(status='pending').all()
+            pending = Attendance.query.filter(
+                Attendance.status == 'pending',
+                Attendance.capture_path.isnot(None)
+            )
+            report['backlog'] = pending.count()
+            if report['backlog'] == 0:
+                report.update(remaining=0, seconds=0.0, per_second=0.0)
+                return report
             
-            for record in pending_records:
-                if not record.capture_path:
-                    continue
-                
-                # Get full path to captured image
-                capture_path = os.path.join(self.app.static_folder, record.capture_path)
-                
-                # Process the capture and get all matches
-                matches = self._match_faces(capture_path)
-                
-                if matches:
-                    # Take the match with highest confidence
-                    student_id, confidence = max(matches, key=lambda x: x[1])
-                    # Update attendance record
-                    record.student_id = student_id
-                    record.status = 'present'
-                    record.confidence = confidence
-                else:
-                    # Mark as unknown if no match found
-                    record.status = 'unknown'
-                    record.confidence = 0.0
-                
-                db.session.commit()
-    
-    def _match_faces(self, image_path: str) -> List[Tuple[int, float]]:
-        """Match all faces in captured image against known faces"""
-        try:
-            # Load the captured image
-            image = face_recognition.load_image_file(image_path)
-            
-            # Detect faces in the image
-            face_locations = face_recognition.face_locations(image, model="hog")
-            if not face_locations:
-                return []
-            
-            # Get encodings for all detected faces
-            face_encodings = face_recognition.face_encodings(image, face_locations)
-            
-            matches = []
-            for face_encoding in face_encodings:
-                # Compare with all known faces
-                face_matches = []
-                
-                for student_id, known_encoding in self.known_face_encodings.items():
-                    # Calculate face distance
-                    face_distances = face_recognition.face_distance([known_encoding], face_encoding)
+            self.sync_gallery()
+            rosters = {}  # course_id: [student_id, ...]
+            last_id = 0
+            workers = min(self.encoding_workers, batch_size)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=process_context()) as pool:
+                while True:
+                    # Keyset pagination keeps each chunk bounded
+                    chunk = db.session.query(
+                        Attendance.id, Attendance.course_id, Attendance.capture_path
+                    ).filter(
+                        Attendance.status == 'pending',
+                        Attendance.capture_path.isnot(None),
+                        Attendance.id > last_id
+                    ).order_by(Attendance.id).limit(batch_size).all()
+                    if not chunk:
+                        break
+                    last_id = chunk[-1].id
                     
-                    if len(face_distances) == 0:
-                        continue
+                    capture_paths = [os.path.join(self.app.static_folder, row.capture_path) for row in chunk]
+                    results = pool.map(partial(encode_capture_faces,
+                                               scale=self.detection_scale,
+                                               upsample=self.detection_upsample),
+                                       capture_paths)
                     
-                    # Convert distance to confidence (0-1 range)
-                    confidence = 1 - face_distances[0]
+                    for row in chunk:
+                        if row.course_id not in rosters:
+                            rosters[row.course_id] = [
+                                student_id for (student_id,) in db.session.query(Student.student_id)
+                                .join(Student.courses).filter_by(id=row.course_id)
+                            ]
                     
-                    # Add to matches if above threshold
-                    if confidence > self.min_confidence_threshold:
-                        face_matches.append((student_id, confidence))
-                
-                # Sort matches by confidence and get the best match for this face
-                if face_matches:
-                    best_match = max(face_matches, key=lambda x: x[1])
-                    matches.append(best_match)
-            
-            return matches
+                    best_matches = {}
+                    for row, (face_encodings, error) in zip(chunk, results):
+                        if error:
+                            logger.warning(f"Could not process capture {row.capture_path}: {error}")
+                        scores = self._score_encodings(face_encodings, top_k=1,
+                                                       candidate_ids=rosters[row.course_id],
+                                                       course_id=row.course_id)
+                        matches = [face_matches[0] for face_matches in scores if face_matches]
+                        if matches:
+                            # Take the match with highest confidence
+                            best_matches[row.id] = max(matches, key=lambda x: x[1])
+                    
+                    # Resolve matched student codes to Student primary keys in one query
+                    codes = {student_id for student_id, _ in best_matches.values()}
+                    student_pks = dict(
+                        db.session.query(Student.student_id, Student.id)
+                        .filter(Student.student_id.in_(codes)).all()
+                    ) if codes else {}
+                    
+                    updates = []
+                    for row in chunk:
+                        match = best_matches.get(row.id)
+                        if match and match[0] in student_pks:
+                            updates.append({'id': row.id, 'student_id': student_pks[match[0]],
+                                            'status': 'present', 'confidence': match[1]})
+                            report['present'] += 1
+                        else:
+                            # Mark as unknown if no match found
+                            updates.append({'id': row.id, 'status': 'unknown', 'confidence': 0.0})
+                            report['unknown'] += 1
+                    
+                    try:
+                        db.session.bulk_update_mappings(Attendance, updates)
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.error(f"Error saving pending attendance chunk: {str(e)}")
+                        continue
+                    report['processed'] += len(updates)
             
+            report['remaining'] = pending.count()
+        
+        report['seconds'] = time.perf_counter() - started
+        report['per_second'] = report['processed'] / report['seconds'] if report['seconds'] else 0.0
+        logger.info(f"Processed {report['processed']}/{report['backlog']} pending captures "
+                    f"in {report['seconds']:.1f}s ({report['per_second']:.1f}/s), "
+                    f"{report['remaining']} remaining")
+        return report
+    
+    def match_image(self, image: np.ndarray, face_locations=None, candidate_ids=None,
+                    course_id: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Match the faces in an in-memory RGB image.
+        
+        ``face_locations`` are (top, right, bottom, left) boxes from an earlier
+        detection pass; HOG detection only runs when none are given. Detection
+        and encoding run on the recognition pool; only the gallery matching
+        happens in this process. Raises RecognitionPoolBusy if the pool is full.
+        """
+        try:
+            face_encodings = self._offload(encode_image_faces, image, face_locations or None,
+                                           self.detection_scale, self.detection_upsample)
+        except RecognitionPoolBusy:
+            raise
         except Exception as e:
             logger.error(f"Error matching faces: {str(e)}")
             return []
+        
+        return self._best_matches(face_encodings, candidate_ids, course_id)
+    
+    def identify_faces(self, image: np.ndarray, face_locations, candidate_ids=None,
+                       course_id: Optional[int] = None) -> List[Optional[Tuple[str, float]]]:
+        """Match each given face box in an RGB image.
+        
+        Unlike ``match_image`` the result lines up with ``face_locations``:
+        one (student_id, confidence) per box, or None where no student matched.
+        """
+        if not face_locations:
+            return []
+        try:
+            face_encodings = self._offload(encode_image_faces, image, face_locations)
+        except RecognitionPoolBusy:
+            raise
+        except Exception as e:
+            logger.error(f"Error identifying faces: {str(e)}")
+            return [None] * len(face_locations)
+        
+        self.sync_gallery()
+        return [
+            face_matches[0] if face_matches else None
+            for face_matches in self._score_encodings(face_encodings, top_k=1,
+                                                      candidate_ids=candidate_ids,
+                                                      course_id=course_id)
+        ]
+    
+    def _best_matches(self, face_encodings, candidate_ids=None,
+                      course_id: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Take the best scoring student for each encoded face"""
+        self.sync_gallery()
+        matches = []
+        for face_matches in self._score_encodings(face_encodings, top_k=1,
+                                                  candidate_ids=candidate_ids,
+                                                  course_id=course_id):
+            if face_matches:
+                matches.append(face_matches[0])
+        
+        return matches
+    
+    def _gallery_slice(self, candidate_ids, course_id: Optional[int] = None):
+        """Return the (matrix, ids) of the gallery rows for candidate_ids.
+        
+        Slices keyed by course_id are cached until the roster or the gallery changes.
+        """
+        roster = frozenset(candidate_ids)
+        generation = (self._gallery_generation, self.face_index.version)
+        if course_id is not None:
+            cached = self._course_galleries.get(course_id)
+            if cached and cached[0] == roster and cached[1] == generation:
+                return cached[2], cached[3]
+        
+        ids = [sid for sid in roster if self.face_index.get(sid) is not None]
+        if ids:
+            matrix = np.stack([self.face_index.get(sid) for sid in ids]).astype(np.float32)
+        else:
+            matrix = np.empty((0, 128), dtype=np.float32)
+        
+        if course_id is not None:
+            self._course_galleries[course_id] = (roster, generation, matrix, ids)
+        return matrix, ids
+    
+    def invalidate_course_gallery(self, course_id: Optional[int] = None):
+        """Drop cached course slices, e.g. after enrollment changes"""
+        if course_id is None:
+            self._course_galleries.clear()
+        else:
+            self._course_galleries.pop(course_id, None)
+    
+    def _score_encodings(self, face_encodings, top_k: int = 1, candidate_ids=None,
+                         course_id: Optional[int] = None) -> List[List[Tuple[str, float]]]:
+        """Score every face against the gallery in one batched distance call.
+        
+        Returns, for each face, up to ``top_k`` (student_id, confidence) pairs above
+        the confidence threshold, best first.
+        """
+        faces = np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        
+        if candidate_ids is None:
+            # Whole gallery: delegate to the configured index
+            with self._gallery_lock:
+                nearest = self.face_index.search(faces, top_k) if len(faces) else []
+        else:
+            # Small roster slice: exact batched scan
+            with self._gallery_lock:
+                gallery, gallery_ids = self._gallery_slice(candidate_ids, course_id)
+            if len(gallery_ids) == 0:
+                return [[] for _ in range(len(faces))]
+            distances = pairwise_distances(faces, gallery)
+            nearest = [
+                [(gallery_ids[col], float(distances[i, col])) for col in cols]
+                for i, cols in enumerate(top_k_rows(distances, top_k))
+            ]
+        
+        # Convert distance to confidence and apply the threshold
+        return [
+            [(student_id, 1.0 - distance) for student_id, distance in face_matches
+             if 1.0 - distance > self.min_confidence_threshold]
+            for face_matches in nearest
+        ]
+    
+    def remove_student_encoding(self, student_id: str) -> bool:
+        """Drop a student's encoding from the gallery; the caller commits the change log"""
+        self._record_change(student_id, 'delete')
+        if not self._drop_encoding(student_id):
+            return False
+        self.encoding_cache.remove(student_id)
+        self.encoding_cache.save()
+        return True
+    
+    def _drop_encoding(self, student_id: str) -> bool:
+        """Remove an encoding from the in-memory gallery"""
+        with self._gallery_lock:
+            if self.face_index.get(student_id) is None:
+                return False
+            self.face_index.remove(student_id)
+            self._gallery_generation += 1
+        return True
+    
+    def _record_change(self, student_id: str, action: str):
+        """Log a gallery change in the current session for other workers to replay"""
+        db.session.add(GalleryChange(student_id=student_id, action=action, version=GalleryVersion.bump()))
+    
+    def sync_gallery(self) -> int:
+        """Apply gallery changes committed by other workers since the last sync.
+        
+        Costs one primary-key lookup of the GalleryVersion counter when nothing
+        changed; otherwise only the changed students' encodings are fetched.
+        Returns the number applied.
+        """
+        try:
+            with self.app.app_context():
+                latest = GalleryVersion.current()
+                if latest <= self._gallery_version:
+                    return 0
+                
+                changes = GalleryChange.query.filter(
+                    GalleryChange.version > self._gallery_version,
+                    GalleryChange.version <= latest
+                ).order_by(GalleryChange.version).all()
+                
+                # The last change per student wins
+                actions = {change.student_id: change.action for change in changes}
+                upserts = [sid for sid, action in actions.items() if action == 'upsert']
+                rows = db.session.query(
+                    Student.student_id, Student.face_encoding
+                ).filter(
+                    Student.student_id.in_(upserts), Student.encoding_is_current()
+                ).all() if upserts else []
+                
+                with self._gallery_lock, self.face_index.batch():
+                    for sid, action in actions.items():
+                        if action == 'delete':
+                            self._drop_encoding(sid)
+                    for row in rows:
+                        encoding = np.frombuffer(row.face_encoding, dtype=np.float32)
+                        current = self.face_index.get(row.student_id)
+                        if current is None or not np.array_equal(current, encoding):
+                            self._store_encoding(row.student_id, encoding)
+                
+                self._gallery_version = latest
+                logger.info(f"Synced {len(actions)} gallery changes up to version {latest}")
+                return len(actions)
+                
+        except Exception as e:
+            logger.error(f"Error syncing face gallery: {str(e)}")
+            return 0
     
     def update_student_encoding(self, student_id: str) -> bool:
         """Update face encoding for a specific student"""
@@ -149,40 +752,26 @@ class FaceRecognitionService:
     
     def verify_photo(self, photo_path: str) -> Dict:
         """Verify if a photo is suitable for face recognition"""
+        return self.verify_and_encode(photo_path, encode=False)
+    
+    def verify_and_encode(self, photo_path: str, encode: bool = True) -> Dict:
+        """Validate a student photo and encode its face in a single pass.
+        
+        When the photo is valid, the result's ``encoding`` is ready to pass
+        to ``_add_student_encoding``. See verify_face_photo().
+        """
         try:
-            image = face_recognition.load_image_file(photo_path)
-            face_locations = face_recognition.face_locations(image, model="hog")
-            
-            result = {
-                "is_valid": False,
-                "message": "",
-                "face_count": len(face_locations)
-            }
-            
-            if len(face_locations) == 0:
-                result["message"] = "No face detected in the photo"
-            elif len(face_locations) > 1:
-                result["message"] = "Multiple faces detected in the photo"
-            else:
-                # Check if face is large enough
-                top, right, bottom, left = face_locations[0]
-                face_height = bottom - top
-                face_width = right - left
-                image_height, image_width = image.shape[:2]
-                
-                min_face_size_ratio = 0.2  # Face should be at least 20% of image height
-                if face_height < image_height * min_face_size_ratio:
-                    result["message"] = "Face is too small in the photo"
-                else:
-                    result["is_valid"] = True
-                    result["message"] = "Photo is suitable for face recognition"
-            
-            return result
-            
+            return self._offload(verify_face_photo, photo_path, self.detection_scale,
+                                 self.detection_upsample, encode)
+        except RecognitionPoolBusy:
+            message = "The server is busy recognizing faces. Please try again shortly."
         except Exception as e:
+            # The worker process itself failed (verify_face_photo reports photo errors)
             logger.error(f"Error verifying photo: {str(e)}")
-            return {
-                "is_valid": False,
-                "message": f"Error processing photo: {str(e)}",
-                "face_count": 0
-            } 
\ No newline at end of file
+            message = f"Error processing photo: {str(e)}"
+        return {
+            "is_valid": False,
+            "message": message,
+            "face_count": 0,
+            "encoding": None
+        }
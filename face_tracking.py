@@ -0,0 +1,152 @@
+import math
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]  # (x, y, w, h) in full-resolution pixels
+
+def box_iou(a, b) -> float:
+    """Intersection over union of two (x, y, w, h) boxes"""
+    left, top = max(a[0], b[0]), max(a[1], b[1])
+    right, bottom = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    intersection = (right - left) * (bottom - top)
+    return intersection / float(a[2] * a[3] + b[2] * b[3] - intersection)
+
+def haar_faces(image, cascade):
+    """Full-resolution Haar face boxes (x, y, w, h) on a BGR image"""
+    import cv2
+
+    # Convert to grayscale for face detection
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    # Detect faces
+    return cascade.detectMultiScale(
+        gray,
+        scaleFactor=1.1,
+        minNeighbors=5,
+        minSize=(30, 30)
+    )
+
+_cascade = None  # per process, for detect_frame_faces
+
+def detect_frame_faces(image) -> List[Box]:
+    """Full-resolution Haar face boxes on a BGR frame.
+
+    Module-level so it can run on the recognition pool; each worker process
+    loads the cascade once.
+    """
+    global _cascade
+    import cv2
+    if _cascade is None:
+        _cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return [tuple(int(v) for v in face) for face in haar_faces(image, _cascade)]
+
+class PreviewFaceDetector:
+    """Face boxes for the live preview at a bounded cost per frame.
+
+    Every ``interval`` frames the Haar cascade runs on a downscaled
+    grayscale copy; in between, each face is followed by template matching
+    in a small window around its last position. The interval adapts to the
+    measured cost of detection and tracking frames so that the whole
+    per-frame pipeline fits the budget for ``target_fps``.
+    """
+
+    def __init__(self, cascade, scale: float = 0.5, target_fps: float = 15.0,
+                 max_interval: int = 10, min_match: float = 0.5):
+        self.cascade = cascade
+        self.scale = scale
+        self.budget = 1.0 / target_fps
+        self.max_interval = max_interval
+        self.min_match = min_match
+        self.interval = 1
+        self._since_detection = 0
+        self._tracks = []          # (box in small-frame pixels, template)
+        self._last_detected = False
+        self._detect_cost = None   # smoothed seconds per frame with detection
+        self._track_cost = None    # smoothed seconds per frame with tracking only
+
+    def update(self, image) -> List[Box]:
+        """Return the face boxes for a BGR frame, detecting or tracking as scheduled"""
+        import cv2
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if self.scale != 1.0:
+            gray = cv2.resize(gray, (0, 0), fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+        self._last_detected = self._since_detection == 0
+        if self._last_detected:
+            self._detect(gray)
+        else:
+            self._track(gray)
+        self._since_detection = (self._since_detection + 1) % self.interval
+
+        return [
+            (int(x / self.scale), int(y / self.scale), int(w / self.scale), int(h / self.scale))
+            for (x, y, w, h), _ in self._tracks
+        ]
+
+    @property
+    def last_detected(self) -> bool:
+        """True if the last ``update()`` ran detection rather than tracking"""
+        return self._last_detected
+
+    def frame_finished(self, seconds: float):
+        """Record the full cost of the last frame and re-plan the detection interval"""
+        if self._last_detected:
+            self._detect_cost = self._smooth(self._detect_cost, seconds)
+        else:
+            self._track_cost = self._smooth(self._track_cost, seconds)
+        if self._detect_cost is None:
+            return
+
+        # Average cost over an interval of n frames is (D + (n - 1) * T) / n,
+        # which fits the budget once n >= (D - T) / (budget - T)
+        track_cost = self._track_cost if self._track_cost is not None else 0.0
+        if self._detect_cost <= self.budget:
+            interval = 1
+        elif track_cost >= self.budget:
+            interval = self.max_interval
+        else:
+            interval = math.ceil((self._detect_cost - track_cost) / (self.budget - track_cost))
+        interval = max(1, min(self.max_interval, interval))
+        if interval != self.interval:
+            logger.debug(f"Preview detection interval {self.interval} -> {interval}")
+            self.interval = interval
+            self._since_detection %= interval
+
+    @staticmethod
+    def _smooth(current, sample: float, weight: float = 0.2) -> float:
+        return sample if current is None else current + weight * (sample - current)
+
+    def _detect(self, gray):
+        min_size = max(8, int(round(30 * self.scale)))
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5,
+                                              minSize=(min_size, min_size))
+        self._tracks = []
+        for (x, y, w, h) in faces:
+            box = (int(x), int(y), int(w), int(h))
+            self._tracks.append((box, gray[box[1]:box[1] + box[3], box[0]:box[0] + box[2]].copy()))
+
+    def _track(self, gray):
+        import cv2
+
+        height, width = gray.shape[:2]
+        tracks = []
+        for (x, y, w, h), template in self._tracks:
+            # Search a window half a face larger than the box on every side
+            margin_x, margin_y = w // 2, h // 2
+            left, top = max(0, x - margin_x), max(0, y - margin_y)
+            right, bottom = min(width, x + w + margin_x), min(height, y + h + margin_y)
+            window = gray[top:bottom, left:right]
+            if window.shape[0] < h or window.shape[1] < w:
+                continue
+            scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (dx, dy) = cv2.minMaxLoc(scores)
+            if score < self.min_match:
+                continue  # lost; the next detection picks the face up again
+            box = (left + dx, top + dy, w, h)
+            tracks.append((box, gray[box[1]:box[1] + h, box[0]:box[0] + w].copy()))
+        self._tracks = tracks
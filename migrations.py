@@ -1,12 +1,15 @@
 from flask_migrate import Migrate, MigrateCommand
 from flask_script import Manager
-from app import app, db
+from app import create_app, db
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Migrations only need the database; no face gallery, schedulers or email
+app = create_app(services=())
+
 # Initialize Flask-Migrate
 migrate = Migrate(app, db)
 manager = Manager(app)
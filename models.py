@@ -1,8 +1,14 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+import numpy as np
 
 db = SQLAlchemy()
 
+# Face encodings stored on Student rows are only reused when they were
+# produced by the same model/version as the running recognition service
+FACE_ENCODING_MODEL = 'dlib_resnet_v1'
+FACE_ENCODING_VERSION = 1
+
 # Association table for student-course relationship
 student_courses = db.Table('student_courses',
     db.Column('student_id', db.Integer, db.ForeignKey('student.id'), primary_key=True),
@@ -36,6 +42,39 @@ class Student(db.Model):
     email = db.Column(db.String(120))
     photo_path = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    face_encoding = db.Column(db.LargeBinary, nullable=True)  # float32 x 128
+    encoding_model = db.Column(db.String(50), nullable=True)
+    encoding_version = db.Column(db.Integer, nullable=True)
+    encoding_updated_at = db.Column(db.DateTime, nullable=True)
+    
+    def set_face_encoding(self, encoding):
+        """Store a face encoding on the row as packed float32 bytes"""
+        self.face_encoding = np.asarray(encoding, dtype=np.float32).tobytes()
+        self.encoding_model = FACE_ENCODING_MODEL
+        self.encoding_version = FACE_ENCODING_VERSION
+        self.encoding_updated_at = datetime.utcnow()
+    
+    def get_face_encoding(self):
+        """Return the stored face encoding, or None if missing or stale"""
+        return decode_face_encoding(self.face_encoding, self.encoding_model, self.encoding_version)
+    
+    @classmethod
+    def encoding_is_current(cls):
+        """Filter expression matching rows with a usable stored encoding"""
+        return db.and_(
+            cls.face_encoding.isnot(None),
+            cls.encoding_model == FACE_ENCODING_MODEL,
+            cls.encoding_version == FACE_ENCODING_VERSION
+        )
+    
+    @classmethod
+    def load_encoded_gallery(cls):
+        """Load (student_id, encoding) for every student with a current encoding in one SELECT"""
+        rows = db.session.query(
+            cls.student_id, cls.face_encoding
+        ).filter(cls.encoding_is_current()).all()
+        return [(row.student_id, np.frombuffer(row.face_encoding, dtype=np.float32))
+                for row in rows]
     
     def to_dict(self):
         return {
@@ -47,6 +86,12 @@ class Student(db.Model):
             'courses': [course.name for course in self.courses]
         }
 
+def decode_face_encoding(data, model, version):
+    """Unpack encoding bytes written by Student.set_face_encoding"""
+    if not data or model != FACE_ENCODING_MODEL or version != FACE_ENCODING_VERSION:
+        return None
+    return np.frombuffer(data, dtype=np.float32)
+
 class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=True)
@@ -62,4 +107,89 @@ class Attendance(db.Model):
     student = db.relationship('Student', backref=db.backref('attendances', lazy=True))
     
     def __repr__(self):
-        return f'<Attendance {self.date} {self.time} {self.status}>' 
\ No newline at end of file
+        return f'<Attendance {self.date} {self.time} {self.status}>'
+
+class RecognitionJob(db.Model):
+    """State of a background recognition job, shared by all worker processes.
+    
+    The job runs on the worker that queued it, but a client may poll any
+    worker for its status and result.
+    """
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    name = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='queued', index=True)  # queued, running, done, failed
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    submitted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'submitted_at': self.submitted_at.isoformat() if self.submitted_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<RecognitionJob {self.id} {self.status}>'
+
+class GalleryVersion(db.Model):
+    """Single-row counter that numbers gallery changes in commit order.
+    
+    Autoincrement ids can become visible out of order on PostgreSQL/MySQL,
+    so a worker tracking the highest id it has seen could skip a change that
+    commits late. Bumping this row with an UPDATE in the same transaction as
+    the change takes the row's write lock, so writers are serialised until
+    they commit and no two changes share a version.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def bump(cls) -> int:
+        """Increment the counter in the database and return the new version (commit with the change)"""
+        updated = cls.query.filter_by(id=1).update({cls.version: cls.version + 1}, synchronize_session=False)
+        if not updated:
+            db.session.add(cls(id=1, version=1))
+            db.session.flush()
+            return 1
+        # Reads this transaction's own write; the row stays locked until commit
+        return db.session.query(cls.version).filter_by(id=1).scalar()
+    
+    @classmethod
+    def current(cls) -> int:
+        """The latest committed gallery version"""
+        return db.session.query(cls.version).filter_by(id=1).scalar() or 0
+
+class GalleryChange(db.Model):
+    """Log of face gallery edits; workers replay entries newer than the last version they applied"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, index=True)  # GalleryVersion assigned when the change was logged
+    student_id = db.Column(db.String(20), nullable=False)  # Student.student_id code
+    action = db.Column(db.String(10), nullable=False)  # upsert, delete
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<GalleryChange {self.version} {self.action} {self.student_id}>'
+
+class UploadSession(db.Model):
+    """An upload-fed capture session, shared by every worker.
+    
+    Frames are stored under LIVE_FRAMES_DIR/<token>, so any worker can take
+    uploads for the room or read its frames; deleting the row ends the
+    session everywhere. A new token per start keeps a restarted session from
+    reading the previous one's frames.
+    """
+    room = db.Column(db.String(50), primary_key=True)
+    token = db.Column(db.String(32), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UploadSession {self.room} {self.token}>'
@@ -0,0 +1,121 @@
+import uuid
+import queue
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from models import db, RecognitionJob
+
+logger = logging.getLogger(__name__)
+
+class JobQueueFull(Exception):
+    """Raised by RecognitionJobQueue.submit() when too many jobs are waiting"""
+
+class RecognitionJobQueue:
+    """Runs attendance recognition outside the request that asked for it.
+
+    ``submit()`` queues a job and returns its ID at once. A few worker
+    threads take jobs in order and run them inside an app context; the
+    CPU-bound face encoding they do is handed to the local RecognitionPool,
+    so no external broker is needed. Job state lives in the RecognitionJob
+    table, so ``get()`` answers on any worker process, not just the one
+    running the job. Finished jobs are kept for ``result_ttl`` seconds.
+    """
+
+    def __init__(self, app, workers: int = 2, max_pending: int = 32, result_ttl: float = 600.0):
+        self.app = app
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads"""
+        if self._threads:
+            return
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'recognition-job-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Recognition job queue started with {self.workers} workers")
+
+    def stop(self):
+        """Let queued jobs finish, then stop the workers"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=30)
+        self._threads = []
+
+    def submit(self, name: str, func, *args, **kwargs) -> str:
+        """Queue ``func(*args, **kwargs)`` and return the job ID"""
+        if self._queue.full():
+            raise JobQueueFull(f"{self._queue.maxsize} recognition jobs already waiting")
+
+        job_id = uuid.uuid4().hex
+        # A fresh app context gets its own session, leaving the caller's untouched
+        with self.app.app_context():
+            self._prune()
+            db.session.add(RecognitionJob(id=job_id, name=name, status='queued'))
+            db.session.commit()
+        try:
+            self._queue.put_nowait((job_id, name, func, args, kwargs))
+        except queue.Full:
+            self._finish(job_id, 'failed', error='Job queue was full')
+            raise JobQueueFull(f"{self._queue.maxsize} recognition jobs already waiting")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return the job's record, or None if it is unknown or expired"""
+        with self.app.app_context():
+            job = db.session.get(RecognitionJob, job_id)
+            if job is None:
+                return None
+            record = job.to_dict()
+            # Rough place in line, from jobs submitted earlier that are still waiting
+            record['position'] = RecognitionJob.query.filter(
+                RecognitionJob.status == 'queued',
+                RecognitionJob.submitted_at < job.submitted_at
+            ).count() if job.status == 'queued' else None
+        return record
+
+    def _prune(self):
+        # Drop expired results; jobs left unfinished that long were lost with their worker
+        expired = datetime.utcnow() - timedelta(seconds=self.result_ttl)
+        RecognitionJob.query.filter(RecognitionJob.finished_at < expired).delete(synchronize_session=False)
+        RecognitionJob.query.filter(
+            RecognitionJob.finished_at.is_(None), RecognitionJob.submitted_at < expired
+        ).update({RecognitionJob.status: 'failed', RecognitionJob.error: 'Job was lost by its worker',
+                  RecognitionJob.finished_at: datetime.utcnow()}, synchronize_session=False)
+
+    def _finish(self, job_id: str, status: str, result=None, error: Optional[str] = None):
+        with self.app.app_context():
+            try:
+                RecognitionJob.query.filter_by(id=job_id).update({
+                    RecognitionJob.status: status,
+                    RecognitionJob.result: result,
+                    RecognitionJob.error: error,
+                    RecognitionJob.finished_at: datetime.utcnow()
+                }, synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error saving recognition job {job_id}: {str(e)}")
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job_id, name, func, args, kwargs = item
+            try:
+                with self.app.app_context():
+                    RecognitionJob.query.filter_by(id=job_id).update({
+                        RecognitionJob.status: 'running', RecognitionJob.started_at: datetime.utcnow()
+                    }, synchronize_session=False)
+                    db.session.commit()
+                    result = func(*args, **kwargs)
+                self._finish(job_id, 'done', result=result)
+            except Exception as e:
+                logger.error(f"Recognition job {name} {job_id} failed: {str(e)}")
+                self._finish(job_id, 'failed', error=str(e))
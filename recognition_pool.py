@@ -0,0 +1,124 @@
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+def process_context():
+    """Start method for recognition worker processes.
+
+    Forking a gunicorn/gevent worker would copy its monkey-patched locks,
+    hub and open database connections into the child, so workers come from
+    a clean forkserver instead (spawn where forkserver is unavailable).
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
+
+class RecognitionPoolBusy(Exception):
+    """Raised when the recognition pool has no free slot within the wait time"""
+
+class RecognitionPool:
+    """A dedicated process pool for dlib and OpenCV work.
+
+    dlib and OpenCV never yield to gevent, so detection, encoding and photo
+    verification run in these processes while the calling greenlet (or
+    thread) just waits on the result. At most ``processes + max_queued``
+    tasks are admitted at once; a caller waits up to ``wait`` seconds for a
+    slot and then gets ``RecognitionPoolBusy``, so a burst of captures is
+    pushed back to the client instead of piling up behind the workers.
+    If a worker process dies (e.g. dlib crashes), the broken executor is
+    discarded and the next task starts a fresh one.
+    """
+
+    def __init__(self, processes: int = 2, max_queued: int = 8, wait: float = 5.0):
+        self.processes = processes
+        self.max_queued = max_queued
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(processes + max_queued)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.latency_seconds = 0.0
+
+    def start(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=process_context())
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        """Drop a broken executor so the next task gets a new one"""
+        with self._lock:
+            if self._executor is not executor:
+                return  # another thread already replaced it
+            self._executor = None
+            self.restarts += 1
+        logger.warning("Recognition pool lost a worker process; starting a new pool")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn, *args, timeout: Optional[float] = None, **kwargs) -> Future:
+        """Run ``fn(*args, **kwargs)`` in a worker process once a slot is free.
+
+        ``timeout`` overrides how long to wait for a slot (0 = don't wait).
+        """
+        wait = self.wait if timeout is None else timeout
+        acquired = self._slots.acquire(timeout=wait) if wait > 0 else self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            raise RecognitionPoolBusy(f"Recognition pool is full ({self.processes + self.max_queued} tasks)")
+
+        submitted = time.perf_counter()
+        try:
+            executor = self.start()
+            try:
+                future = executor.submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                self._discard(executor)
+                executor = self.start()
+                future = executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_flight += 1
+        future.add_done_callback(lambda done: self._finished(submitted, done, executor))
+        return future
+
+    def run(self, fn, *args, timeout: Optional[float] = None, **kwargs):
+        """Submit a task and wait for its result"""
+        return self.submit(fn, *args, timeout=timeout, **kwargs).result()
+
+    def _finished(self, submitted: float, future: Future, executor: ProcessPoolExecutor):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._discard(executor)
+        self._slots.release()
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.latency_seconds += time.perf_counter() - submitted
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                'processes': self.processes,
+                'capacity': self.processes + self.max_queued,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'restarts': self.restarts,
+                'avg_latency_ms': round(self.latency_seconds / self.completed * 1000, 1) if self.completed else None
+            }
@@ -0,0 +1,387 @@
+import os
+import mmap
+import time
+import struct
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+import numpy as np
+from typing import List, Optional, Tuple
+
+from face_index import FaceIndex, ENCODING_SIZE, pairwise_distances, top_k_rows
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines run a single process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Header: magic, format, gallery version, row count, dimension, id width,
+# publisher parent pid, row capacity, write sequence (odd while a patch is in progress)
+HEADER_FORMAT = '<4sIQQIIQQQ'
+HEADER_SIZE = 64
+VERSION_OFFSET = 8
+SEQUENCE_OFFSET = struct.calcsize('<4sIQQIIQQ')
+MAGIC = b'FGAL'
+FORMAT_VERSION = 2
+ID_WIDTH = 80  # bytes: Student.student_id is String(20), up to 4 UTF-8 bytes per character
+MIN_CAPACITY = 1024
+READ_ATTEMPTS = 100
+
+def _align(offset: int) -> int:
+    return (offset + 63) // 64 * 64
+
+def _matrix_offset(capacity: int) -> int:
+    return _align(HEADER_SIZE + capacity * ID_WIDTH)
+
+def encode_student_id(student_id: str) -> bytes:
+    """Encode a student ID for the fixed-width ID slots, refusing to truncate it"""
+    encoded = student_id.encode('utf-8')
+    if not encoded or len(encoded) > ID_WIDTH:
+        raise ValueError(f"Student ID {student_id!r} must encode to 1-{ID_WIDTH} UTF-8 bytes")
+    return encoded
+
+def publish_gallery(path: str, student_ids: List[str], matrix: np.ndarray, version: int,
+                    capacity: int = 0):
+    """Atomically write a gallery file that workers can memory-map.
+
+    Room is left for ``capacity`` rows (at least MIN_CAPACITY) so later
+    changes can be patched in place.
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    ids = np.array([encode_student_id(sid) for sid in student_ids], dtype=f'S{ID_WIDTH}')
+    capacity = max(capacity, len(student_ids), MIN_CAPACITY)
+    header = struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, version, len(student_ids),
+                         ENCODING_SIZE, ID_WIDTH, os.getppid(), capacity, 0)
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.gallery')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(header.ljust(HEADER_SIZE, b'\0'))
+        f.write(ids.tobytes())
+        f.seek(_matrix_offset(capacity))
+        f.write(matrix.tobytes())
+        # The unused rows stay sparse until they are patched in
+        f.truncate(_matrix_offset(capacity) + capacity * ENCODING_SIZE * 4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class SharedGallery:
+    """Read-only, memory-mapped view of a published gallery file.
+
+    Every worker maps the same file, so the encodings are held once in the
+    page cache. The file is replaced only when it has to grow and is
+    otherwise patched in place; ``refresh()`` is a stat call plus a header
+    read, and after a patch only the ID slots that changed are decoded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version = 0
+        self.sequence = 0
+        self.capacity = 0
+        self.publisher_ppid = 0
+        self.ids = []
+        self.rows = {}
+        self.matrix = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        self._mmap = None
+        self._inode = None
+        self._id_slots = None
+        self._matrix_slots = None
+        self._id_bytes = np.empty(0, dtype=f'S{ID_WIDTH}')  # copy of the synced IDs to diff against
+
+    def current_sequence(self) -> int:
+        """The write sequence in the mapped file right now"""
+        if self._mmap is None:
+            return 0
+        return struct.unpack_from('<Q', self._mmap, SEQUENCE_OFFSET)[0]
+
+    def refresh(self) -> bool:
+        """Pick up a replaced or patched file, returning True if anything changed"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        if stat.st_ino != self._inode:
+            return self._map(stat.st_ino)
+        sequence = self.current_sequence()
+        if sequence == self.sequence or sequence % 2:
+            # Unchanged, or a writer is mid-patch and the reader will retry
+            return False
+        self._sync()
+        return True
+
+    def _map(self, inode: int) -> bool:
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, _, _, dim, id_width, publisher_ppid, capacity, _ = struct.unpack_from(HEADER_FORMAT, mapped)
+        if magic != MAGIC or fmt != FORMAT_VERSION or dim != ENCODING_SIZE or id_width != ID_WIDTH:
+            logger.error(f"Ignoring incompatible gallery file {self.path}")
+            mapped.close()
+            return False
+
+        # Swap in the new mapping; the old one is released with its arrays
+        self._id_slots = np.frombuffer(mapped, dtype=f'S{ID_WIDTH}', count=capacity, offset=HEADER_SIZE)
+        self._matrix_slots = np.frombuffer(mapped, dtype=np.float32, count=capacity * dim,
+                                           offset=_matrix_offset(capacity)).reshape(capacity, dim)
+        self._mmap = mapped
+        self._inode = inode
+        self.capacity = capacity
+        self.publisher_ppid = publisher_ppid
+        self.ids, self.rows = [], {}
+        self._id_bytes = np.empty(0, dtype=f'S{ID_WIDTH}')
+        self._sync()
+        logger.info(f"Mapped shared face gallery version {self.version} ({len(self.ids)} encodings)")
+        return True
+
+    def _sync(self):
+        """Bring ids, rows and matrix up to date, decoding only the slots that changed"""
+        self.sequence = self.current_sequence()
+        version, count = struct.unpack_from('<QQ', self._mmap, VERSION_OFFSET)
+        current = self._id_slots[:count].copy()
+        previous = self._id_bytes
+        shared = min(len(previous), count)
+        changed = np.flatnonzero(previous[:shared] != current[:shared]).tolist()
+        changed.extend(range(shared, max(len(previous), count)))
+
+        for row in changed:
+            if row < len(previous) and self.rows.get(self.ids[row]) == row:
+                del self.rows[self.ids[row]]
+        ids = self.ids[:count]
+        ids.extend([''] * (count - len(ids)))
+        for row in changed:
+            if row < count:
+                ids[row] = current[row].decode('utf-8')
+                self.rows[ids[row]] = row
+
+        self.ids = ids
+        self.matrix = self._matrix_slots[:count]
+        self.version = version
+        self._id_bytes = current
+
+class SharedGalleryIndex(FaceIndex):
+    """Exact search over a gallery file shared by all workers on the host.
+
+    Searches read the memory-mapped matrix directly. Changes are written
+    under an exclusive file lock: they are patched into the file's spare
+    rows in place (deletes swap the last row into the hole), and the file
+    is only rewritten when it is reset or out of room. A patch is bracketed
+    by an odd write sequence, so readers retry a search that overlapped one.
+    """
+
+    def __init__(self, path: str):
+        self.gallery = SharedGallery(path)
+        self._lock_path = path + '.lock'
+        self._thread_lock = threading.RLock()
+        self._view_lock = threading.RLock()
+        self._lock_depth = 0
+        self._batch = None   # pending {student_id: encoding or None} inside batch()
+        self._batch_reset = False
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.gallery.refresh()
+
+    def __len__(self):
+        return self._read(lambda: len(self.gallery.ids))
+
+    @property
+    def version(self) -> int:
+        return self._read(lambda: self.gallery.version)
+
+    def _read(self, fn):
+        """Run fn against a consistent view of the file, retrying across patches"""
+        with self._view_lock:
+            for _ in range(READ_ATTEMPTS):
+                self.gallery.refresh()
+                sequence = self.gallery.sequence
+                if sequence % 2 == 0 and self.gallery.current_sequence() == sequence:
+                    result = fn()
+                    if self.gallery.current_sequence() == sequence:
+                        return result
+                time.sleep(0.001)
+        # A writer is slow or died mid-patch: wait for the lock and repair the file
+        with self.file_lock():
+            self._repair()
+            with self._view_lock:
+                return fn()
+
+    def _repair(self):
+        """Republish a file a crashed writer left mid-patch; needs the file lock"""
+        with self._view_lock:
+            self.gallery.refresh()
+            if self.gallery.current_sequence() % 2 == 0:
+                return
+            logger.warning(f"Gallery file {self.gallery.path} was left mid-update; republishing it")
+            gallery = self.gallery
+            _, count = struct.unpack_from('<QQ', gallery._mmap, VERSION_OFFSET)
+            ids = [sid.decode('utf-8') for sid in gallery._id_slots[:count]]
+            publish_gallery(gallery.path, ids, gallery._matrix_slots[:count], gallery.version + 1,
+                            gallery.capacity)
+            gallery.refresh()
+
+    @contextmanager
+    def file_lock(self):
+        """Hold an exclusive lock on the gallery across processes (re-entrant)"""
+        with self._thread_lock:
+            if fcntl is None or self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            with open(self._lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def published_by_sibling(self) -> bool:
+        """True if a worker of the same parent process already published the gallery"""
+        with self._view_lock:
+            self.gallery.refresh()
+            return self.gallery.version > 0 and self.gallery.publisher_ppid == os.getppid()
+
+    @contextmanager
+    def batch(self, reset: bool = False):
+        """Collect adds/removes and publish them as a single new version.
+
+        With ``reset`` the published gallery is rebuilt from only the
+        encodings added inside the batch.
+        """
+        with self.file_lock():
+            outer = self._batch is None
+            if outer:
+                self._batch = {}
+                self._batch_reset = reset
+            try:
+                yield
+                if outer and (self._batch or self._batch_reset):
+                    self._publish(self._batch, self._batch_reset)
+            finally:
+                if outer:
+                    self._batch = None
+                    self._batch_reset = False
+
+    def _publish(self, changes, reset: bool = False):
+        self._repair()
+        with self._view_lock:
+            rows = self.gallery.rows
+            added = sum(1 for sid, enc in changes.items() if enc is not None and sid not in rows)
+            removed = sum(1 for sid, enc in changes.items() if enc is None and sid in rows)
+            needed = len(rows) + added - removed
+            if reset or self.gallery.version == 0 or needed > self.gallery.capacity:
+                self._rewrite(changes, reset, capacity=2 * needed)
+            else:
+                self._patch(changes)
+            self.gallery.refresh()
+
+    def _rewrite(self, changes, reset: bool, capacity: int):
+        if reset:
+            ids, rows = [], {}
+            matrix = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        else:
+            ids = list(self.gallery.ids)
+            rows = dict(self.gallery.rows)
+            matrix = np.array(self.gallery.matrix, dtype=np.float32)
+
+        updates = {sid: enc for sid, enc in changes.items() if enc is not None}
+        removed = {sid for sid, enc in changes.items() if enc is None and sid in rows}
+        for sid, encoding in updates.items():
+            if sid in rows:
+                matrix[rows[sid]] = np.asarray(encoding, dtype=np.float32)
+        new_ids = [sid for sid in updates if sid not in rows]
+
+        keep = [row for row, sid in enumerate(ids) if sid not in removed]
+        ids = [ids[row] for row in keep] + new_ids
+        parts = [matrix[keep]]
+        if new_ids:
+            parts.append(np.array([updates[sid] for sid in new_ids], dtype=np.float32).reshape(-1, ENCODING_SIZE))
+        publish_gallery(self.gallery.path, ids, np.concatenate(parts), self.gallery.version + 1, capacity)
+
+    def _patch(self, changes):
+        """Write changes into the mapped file's rows, then bump the version"""
+        ids = list(self.gallery.ids)
+        rows = dict(self.gallery.rows)
+        capacity = self.gallery.capacity
+        with open(self.gallery.path, 'r+b') as f:
+            mapped = mmap.mmap(f.fileno(), 0)
+        id_slots = matrix_slots = None
+        try:
+            id_slots = np.frombuffer(mapped, dtype=f'S{ID_WIDTH}', count=capacity, offset=HEADER_SIZE)
+            matrix_slots = np.frombuffer(mapped, dtype=np.float32, count=capacity * ENCODING_SIZE,
+                                         offset=_matrix_offset(capacity)).reshape(capacity, ENCODING_SIZE)
+            sequence = self.gallery.sequence + 1
+            struct.pack_into('<Q', mapped, SEQUENCE_OFFSET, sequence)
+
+            # Deletes first, moving the last row into the hole, so adds never overflow
+            for sid, encoding in changes.items():
+                if encoding is not None or sid not in rows:
+                    continue
+                row, last = rows.pop(sid), len(ids) - 1
+                moved = ids.pop()
+                if row != last:
+                    ids[row] = moved
+                    rows[moved] = row
+                    id_slots[row] = id_slots[last]
+                    matrix_slots[row] = matrix_slots[last]
+                id_slots[last] = b''
+            for sid, encoding in changes.items():
+                if encoding is None:
+                    continue
+                row = rows.get(sid)
+                if row is None:
+                    row = rows[sid] = len(ids)
+                    ids.append(sid)
+                    id_slots[row] = encode_student_id(sid)
+                matrix_slots[row] = encoding
+
+            struct.pack_into('<QQ', mapped, VERSION_OFFSET, self.gallery.version + 1, len(ids))
+            struct.pack_into('<Q', mapped, SEQUENCE_OFFSET, sequence + 1)
+            # Only the touched pages are written back
+            mapped.flush()
+        finally:
+            del id_slots, matrix_slots
+            mapped.close()
+
+    def add(self, student_id: str, encoding: np.ndarray):
+        encode_student_id(student_id)
+        with self.batch():
+            self._batch[student_id] = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+
+    def remove(self, student_id: str) -> bool:
+        if self.get(student_id) is None:
+            return False
+        with self.batch():
+            self._batch[student_id] = None
+        return True
+
+    def get(self, student_id: str) -> Optional[np.ndarray]:
+        if self._batch is not None and (student_id in self._batch or self._batch_reset):
+            return self._batch.get(student_id)
+
+        def lookup():
+            row = self.gallery.rows.get(student_id)
+            # Copy: the mapped row can be patched in place later
+            return None if row is None else np.array(self.gallery.matrix[row])
+        return self._read(lookup)
+
+    def search(self, faces, k: int = 1) -> List[List[Tuple[str, float]]]:
+        faces = np.asarray(faces, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+
+        def scan():
+            ids, matrix = self.gallery.ids, self.gallery.matrix
+            if len(ids) == 0:
+                return [[] for _ in range(len(faces))]
+            distances = pairwise_distances(faces, matrix)
+            return [
+                [(ids[col], float(distances[i, col])) for col in cols]
+                for i, cols in enumerate(top_k_rows(distances, k))
+            ]
+        return self._read(scan)
@@ -0,0 +1,31 @@
+import pytest
+from app import create_app
+from models import db
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build apps on a throwaway SQLite file; background services are off unless asked for"""
+    apps = []
+
+    def make(services=(), **settings):
+        test_config = {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+            'ENCODING_CACHE_PATH': str(tmp_path / 'face_encodings.npz'),
+            'LIVE_FRAMES_DIR': str(tmp_path / 'live'),
+        }
+        test_config.update(settings)
+        app = create_app('testing', services=services, test_config=test_config)
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        app.extensions['services'].stop()
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+@pytest.fixture
+def app(make_app):
+    """An app with no background services"""
+    return make_app()
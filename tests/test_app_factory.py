@@ -0,0 +1,30 @@
+from app import DummyFaceRecognitionService, get_face_service
+from models import Course
+
+def test_app_without_services(app):
+    client = app.test_client()
+    assert client.get('/healthz').json == {'status': 'ok'}
+    assert client.get('/readyz').json['status'] == 'disabled'
+    services = app.extensions['services']
+    assert services.enabled == ()
+    assert not services.started
+    assert isinstance(get_face_service(app), DummyFaceRecognitionService)
+
+def test_face_routes_answer_disabled(app):
+    client = app.test_client()
+    for method, url in [('post', '/capture_attendance'), ('get', '/capture_attendance/jobs/abc'),
+                        ('get', '/recognition_pool'), ('post', '/continuous_attendance/start'),
+                        ('post', '/process-pending')]:
+        response = getattr(client, method)(url, json={})
+        assert response.status_code == 503, url
+        assert response.json['status'] == 'disabled', url
+
+def test_each_app_gets_its_own_services(make_app):
+    first, second = make_app(), make_app()
+    assert first.extensions['services'] is not second.extensions['services']
+    assert get_face_service(first).app is first
+    assert get_face_service(second).app is second
+
+def test_database_is_initialized(app):
+    with app.app_context():
+        assert Course.query.count() > 0
@@ -0,0 +1,75 @@
+import os
+from datetime import date, datetime
+import numpy as np
+import pytest
+import capture_store
+from capture_store import CaptureWriter
+from models import db, Attendance, Course
+
+def image(value):
+    return np.full((24, 32, 3), value, dtype=np.uint8)
+
+@pytest.fixture
+def attendance_ids(app):
+    with app.app_context():
+        course = Course.query.first()
+        rows = [Attendance(course_id=course.id, date=date.today(), time=datetime.now().time(), status='present')
+                for _ in range(3)]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+def capture_paths(app, ids):
+    with app.app_context():
+        return [db.session.get(Attendance, row_id).capture_path for row_id in ids]
+
+def test_identical_frames_are_written_once(app, attendance_ids, tmp_path):
+    writer = CaptureWriter(app, str(tmp_path / 'captures'))
+    writer.save(image(10), attendance_ids[:2])
+    writer.save(image(10), attendance_ids[2:])
+    writer.save(image(200), [])
+    writer.stop()
+
+    assert writer.status() == {'pending': 0, 'written': 2, 'deduplicated': 1, 'failed': 0}
+    paths = capture_paths(app, attendance_ids)
+    assert len(set(paths)) == 1
+    day = datetime.now().strftime('%Y-%m-%d')
+    assert paths[0].startswith(f'captures/{day}/') and paths[0].endswith('.jpg')
+    files = os.listdir(tmp_path / 'captures' / day)
+    assert len(files) == 2 and all(name.endswith('.jpg') for name in files)
+
+def test_failed_rename_is_retried(app, attendance_ids, tmp_path, monkeypatch):
+    replace = os.replace
+    calls = []
+
+    def flaky_replace(src, dst):
+        calls.append(src)
+        if len(calls) == 1:
+            raise OSError('disk busy')
+        replace(src, dst)
+
+    monkeypatch.setattr(capture_store.os, 'replace', flaky_replace)
+    writer = CaptureWriter(app, str(tmp_path / 'captures'), retry_delay=0)
+    writer.save(image(10), attendance_ids)
+    writer.stop()
+
+    assert writer.status()['written'] == 1 and writer.status()['failed'] == 0
+    assert calls[0] != calls[1]
+    assert all(path is not None for path in capture_paths(app, attendance_ids))
+    # The temporary file of the failed attempt was cleaned up
+    day_dir = tmp_path / 'captures' / datetime.now().strftime('%Y-%m-%d')
+    assert [name for name in os.listdir(day_dir) if not name.endswith('.jpg')] == []
+
+def test_gives_up_after_attempts(app, attendance_ids, tmp_path, monkeypatch):
+    def broken_replace(src, dst):
+        raise OSError('read-only file system')
+
+    monkeypatch.setattr(capture_store.os, 'replace', broken_replace)
+    writer = CaptureWriter(app, str(tmp_path / 'captures'), attempts=2, retry_delay=0)
+    writer.save(image(10), attendance_ids)
+    writer.stop()
+
+    assert writer.status()['failed'] == 1
+    assert capture_paths(app, attendance_ids) == [None, None, None]
+    day_dir = tmp_path / 'captures' / datetime.now().strftime('%Y-%m-%d')
+    assert os.listdir(day_dir) == []
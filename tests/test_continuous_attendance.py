@@ -0,0 +1,88 @@
+import numpy as np
+from camera import Frame
+from continuous_attendance import ContinuousAttendance
+
+class FakeFaceService:
+    """Answers identify_faces from a script, one list of matches per call"""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.calls = []
+
+    def identify_faces(self, image, face_locations, candidate_ids=None, course_id=None):
+        self.calls.append(list(face_locations))
+        return self.answers.pop(0)
+
+def make_session(answers, boxes, detect=None, **kwargs):
+    present = []
+    service = FakeFaceService(answers)
+    session = ContinuousAttendance(
+        app=None, camera=None, face_service=service, course_id=1, candidate_ids=['S1', 'S2'],
+        on_present=lambda student_id, confidence, frame: present.append((student_id, confidence)),
+        detect=detect or (lambda image: boxes[0]), **kwargs
+    )
+    return session, service, present
+
+def frame(seq):
+    return Frame(seq, float(seq), np.zeros((240, 320, 3), dtype=np.uint8))
+
+def test_student_marked_once_after_stable_votes():
+    boxes = [[(10, 10, 50, 50)]]
+    session, service, present = make_session([[('S1', 0.9)]] * 3, boxes, stable_matches=3)
+    for seq in range(1, 4):
+        session._process(frame(seq))
+    assert present == [('S1', 0.9)]
+
+    # A resolved track is not encoded again while it is in view
+    boxes[0] = [(12, 11, 50, 50)]
+    session._process(frame(4))
+    assert len(service.calls) == 3
+    status = session.status()
+    assert status['marked'] == {'S1': 0.9}
+    assert status['active_tracks'] == 0
+    assert status['faces_encoded'] == 3
+
+def test_disagreeing_votes_do_not_mark():
+    boxes = [[(10, 10, 50, 50)]]
+    answers = [[('S1', 0.9)], [('S2', 0.8)], [('S1', 0.9)], [None], [('S1', 0.9)], [('S2', 0.7)]]
+    session, service, present = make_session(answers, boxes, stable_matches=3, max_attempts=6)
+    for seq in range(1, 8):
+        session._process(frame(seq))
+    assert present == []
+    # The track is given up after max_attempts instead of being encoded forever
+    assert len(service.calls) == 6
+
+def test_separate_faces_get_separate_tracks():
+    boxes = [[(10, 10, 50, 50), (200, 100, 50, 50)]]
+    answers = [[('S1', 0.9), ('S2', 0.8)]] * 2
+    session, service, present = make_session(answers, boxes, stable_matches=2)
+    session._process(frame(1))
+    session._process(frame(2))
+    assert sorted(present) == [('S1', 0.9), ('S2', 0.8)]
+    # Locations are handed over as (top, right, bottom, left)
+    assert service.calls[0] == [(10, 60, 60, 10), (100, 250, 150, 200)]
+
+def test_box_that_jumps_starts_a_new_track():
+    boxes = [[(10, 10, 50, 50)]]
+    answers = [[('S1', 0.9)], [('S1', 0.9)], [('S1', 0.9)]]
+    session, service, present = make_session(answers, boxes, stable_matches=2)
+    session._process(frame(1))
+    boxes[0] = [(200, 150, 50, 50)]
+    session._process(frame(2))
+    assert present == []
+    session._process(frame(3))
+    assert present == [('S1', 0.9)]
+
+def test_detection_runs_on_the_recognition_pool():
+    from functools import partial
+    from face_tracking import detect_frame_faces
+    from recognition_pool import RecognitionPool
+    pool = RecognitionPool(processes=1, max_queued=1, wait=5.0)
+    try:
+        session, service, present = make_session([], None, detect=partial(pool.run, detect_frame_faces))
+        session._process(frame(1))
+        assert pool.status()['completed'] == 1
+        assert session.status()['frames_sampled'] == 1
+        assert service.calls == []  # a blank frame has no faces to identify
+    finally:
+        pool.shutdown()
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from encoding_cache import EncodingCache
+
+@pytest.fixture
+def photos(tmp_path):
+    paths = {}
+    for student_id in ('S1', 'S2', 'S3', 'S9'):
+        path = tmp_path / f'{student_id}.jpg'
+        path.write_bytes(student_id.encode())
+        paths[student_id] = str(path)
+    return paths
+
+def open_cache(tmp_path, load=True):
+    cache = EncodingCache(str(tmp_path / 'cache.npz'), 'dlib_resnet_v1', 1)
+    if load:
+        cache.load()
+    return cache
+
+def put(cache, photos, student_id, value):
+    cache.put(student_id, f'{student_id}.jpg', photos[student_id], np.full(128, value))
+
+def stored_ids(tmp_path):
+    return sorted(open_cache(tmp_path).entries)
+
+def test_round_trip(tmp_path, photos):
+    cache = open_cache(tmp_path)
+    put(cache, photos, 'S1', 0.5)
+    assert cache.save()
+
+    reloaded = open_cache(tmp_path)
+    np.testing.assert_array_equal(reloaded.get('S1', 'S1.jpg', photos['S1']), np.full(128, 0.5))
+    assert reloaded.get('S1', 'other.jpg', photos['S1']) is None
+
+def test_changed_photo_is_a_miss(tmp_path, photos):
+    cache = open_cache(tmp_path)
+    put(cache, photos, 'S1', 0.5)
+    with open(photos['S1'], 'ab') as f:
+        f.write(b'edited')
+    assert cache.get('S1', 'S1.jpg', photos['S1']) is None
+
+def test_worker_that_never_loaded_keeps_other_entries(tmp_path, photos):
+    first = open_cache(tmp_path)
+    for student_id in ('S1', 'S2', 'S3'):
+        put(first, photos, student_id, 0.1)
+    first.save()
+
+    # A worker that booted from the database never loads the cache file
+    second = open_cache(tmp_path, load=False)
+    put(second, photos, 'S9', 0.9)
+    second.save()
+    assert stored_ids(tmp_path) == ['S1', 'S2', 'S3', 'S9']
+
+def test_concurrent_workers_merge_their_changes(tmp_path, photos):
+    first, second = open_cache(tmp_path), open_cache(tmp_path)
+    put(first, photos, 'S1', 0.1)
+    put(second, photos, 'S2', 0.2)
+    first.save()
+    second.save()
+    assert stored_ids(tmp_path) == ['S1', 'S2']
+
+    second.remove('S1')
+    second.save()
+    assert stored_ids(tmp_path) == ['S2']
+    assert not second.dirty
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import numpy as np
+from app import add_column, init_db
+from encoding_cache import EncodingCache
+from face_recognition_service import FaceRecognitionService
+from models import db, GalleryVersion, Student, FACE_ENCODING_MODEL
+
+def test_init_db_adds_encoding_columns_to_old_student_table(make_app, tmp_path):
+    connection = sqlite3.connect(tmp_path / 'test.db')
+    connection.executescript('''
+        CREATE TABLE course (id INTEGER PRIMARY KEY, identifier VARCHAR(20), name VARCHAR(100), created_at DATETIME);
+        CREATE TABLE student (id INTEGER PRIMARY KEY, student_id VARCHAR(20), name VARCHAR(100),
+                              email VARCHAR(120), photo_path VARCHAR(255), created_at DATETIME);
+        CREATE TABLE student_courses (student_id INTEGER, course_id INTEGER);
+        INSERT INTO student (student_id, name, photo_path) VALUES ('S1', 'Ann', 'x.jpg');
+    ''')
+    connection.close()
+
+    app = make_app()
+    with app.app_context():
+        columns = {column['name'] for column in db.inspect(db.engine).get_columns('student')}
+        assert {'face_encoding', 'encoding_model', 'encoding_version', 'encoding_updated_at'} <= columns
+        assert Student.query.filter_by(student_id='S1').one().face_encoding is None
+
+        # A second worker starting at the same time finds everything in place
+        init_db(app)
+        assert not add_column(Student.__table__.c.face_encoding)
+        assert GalleryVersion.query.count() == 1
+
+def test_cache_ignores_entries_from_another_encoding_version(tmp_path):
+    photo = tmp_path / 'photo.jpg'
+    photo.write_bytes(b'jpeg')
+    cache_path = str(tmp_path / 'cache.npz')
+    old = EncodingCache(cache_path, FACE_ENCODING_MODEL, 1)
+    old.put('S1', 'photo.jpg', str(photo), np.ones(128))
+    old.save()
+
+    same = EncodingCache(cache_path, FACE_ENCODING_MODEL, 1)
+    same.load()
+    np.testing.assert_array_equal(same.get('S1', 'photo.jpg', str(photo)), np.ones(128))
+
+    newer = EncodingCache(cache_path, FACE_ENCODING_MODEL, 2)
+    newer.load()
+    assert newer.get('S1', 'photo.jpg', str(photo)) is None
+    other_model = EncodingCache(cache_path, 'other_model', 1)
+    other_model.load()
+    assert other_model.get('S1', 'photo.jpg', str(photo)) is None
+
+def test_gallery_load_does_not_restamp_stale_cached_encodings(app, tmp_path):
+    app.static_folder = str(tmp_path)
+    os.makedirs(tmp_path / 'uploads')
+    photo = tmp_path / 'uploads' / 'S9.jpg'
+    photo.write_bytes(b'not a face')
+    stale = EncodingCache(app.config['ENCODING_CACHE_PATH'], FACE_ENCODING_MODEL, 0)
+    stale.put('S9', 'uploads/S9.jpg', str(photo), np.ones(128))
+    stale.save()
+
+    with app.app_context():
+        student = Student(student_id='S9', name='Sam', photo_path='uploads/S9.jpg',
+                          face_encoding=np.ones(128, dtype=np.float32).tobytes(),
+                          encoding_model=FACE_ENCODING_MODEL, encoding_version=0)
+        db.session.add(student)
+        db.session.commit()
+
+        service = FaceRecognitionService(app)
+        assert service.face_index.get('S9') is None
+        assert db.session.get(Student, student.id).encoding_version == 0
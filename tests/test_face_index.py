@@ -0,0 +1,124 @@
+import numpy as np
+from face_index import (ENCODING_SIZE, FaceGallery, IVFIndex, compare_indexes, create_face_index,
+                        pairwise_distances, top_k_rows)
+
+def random_encodings(count, seed=0):
+    return np.random.default_rng(seed).random((count, ENCODING_SIZE), dtype=np.float32)
+
+def test_pairwise_distances_match_direct_computation():
+    faces = random_encodings(3, seed=1)
+    gallery = random_encodings(5, seed=2)
+    expected = np.linalg.norm(faces[:, None, :] - gallery[None, :, :], axis=2)
+    np.testing.assert_allclose(pairwise_distances(faces, gallery), expected, rtol=1e-4, atol=1e-4)
+
+def test_pairwise_distances_empty_gallery():
+    distances = pairwise_distances(random_encodings(2), np.empty((0, ENCODING_SIZE), dtype=np.float32))
+    assert distances.shape == (2, 0)
+
+def test_top_k_rows_nearest_first():
+    distances = np.array([[0.5, 0.1, 0.9, 0.3],
+                          [0.2, 0.8, 0.05, 0.6]])
+    assert top_k_rows(distances, 2).tolist() == [[1, 3], [2, 0]]
+
+def test_top_k_rows_clamps_k():
+    distances = np.array([[0.3, 0.1, 0.2]])
+    assert top_k_rows(distances, 10).tolist() == [[1, 2, 0]]
+    assert top_k_rows(distances, 0).tolist() == [[1]]
+
+def test_gallery_remove_moves_last_row_into_gap():
+    gallery = FaceGallery()
+    encodings = random_encodings(4)
+    for number, encoding in enumerate(encodings):
+        gallery.add(f'S{number}', encoding)
+
+    assert gallery.remove('S1')
+    assert not gallery.remove('S1')
+    assert len(gallery) == 3
+    assert gallery.ids == ['S0', 'S3', 'S2']
+    np.testing.assert_array_equal(gallery.matrix[1], encodings[3])
+    np.testing.assert_array_equal(gallery.get('S3'), encodings[3])
+    assert gallery.get('S1') is None
+
+    # Every remaining student is still found at its own encoding
+    for student_id in ('S0', 'S2', 'S3'):
+        number = int(student_id[1:])
+        [[(found, distance)]] = gallery.search(encodings[number])
+        assert found == student_id
+        assert distance < 0.01
+
+def test_gallery_remove_last_and_update():
+    gallery = FaceGallery()
+    encodings = random_encodings(3)
+    gallery.add('S0', encodings[0])
+    gallery.add('S1', encodings[1])
+    gallery.remove('S1')
+    gallery.add('S0', encodings[2])
+    assert gallery.ids == ['S0']
+    np.testing.assert_array_equal(gallery.get('S0'), encodings[2])
+
+def test_gallery_grows_past_capacity():
+    gallery = FaceGallery(capacity=2)
+    encodings = random_encodings(5)
+    for number, encoding in enumerate(encodings):
+        gallery.add(f'S{number}', encoding)
+    assert len(gallery) == 5
+    np.testing.assert_array_equal(gallery.matrix, encodings)
+
+def test_gallery_search_empty():
+    assert FaceGallery().search(random_encodings(2)) == [[], []]
+
+def test_ivf_recall_on_clustered_gallery():
+    rng = np.random.default_rng(3)
+    centers = rng.random((16, ENCODING_SIZE), dtype=np.float32)
+    encodings = (centers[rng.integers(0, 16, 2000)]
+                 + rng.normal(0, 0.02, (2000, ENCODING_SIZE))).astype(np.float32)
+    exact = FaceGallery()
+    ivf = IVFIndex(n_lists=16, n_probe=4, min_train_size=1000)
+    for number, encoding in enumerate(encodings):
+        exact.add(f'S{number}', encoding)
+        ivf.add(f'S{number}', encoding)
+    assert ivf.is_trained
+
+    queries = encodings[rng.choice(len(encodings), 100, replace=False)] + rng.normal(
+        0, 0.01, (100, ENCODING_SIZE)).astype(np.float32)
+    assert compare_indexes(exact, ivf, queries, k=5)['recall'] >= 0.95
+
+def test_ivf_untrained_is_exact_and_follows_removal():
+    ivf = IVFIndex(min_train_size=100)
+    encodings = random_encodings(10)
+    for number, encoding in enumerate(encodings):
+        ivf.add(f'S{number}', encoding)
+    assert not ivf.is_trained
+    assert ivf.search(encodings[4])[0][0][0] == 'S4'
+    assert ivf.remove('S4')
+    assert ivf.get('S4') is None
+    assert ivf.search(encodings[4])[0][0][0] != 'S4'
+
+def test_create_face_index_from_config():
+    assert isinstance(create_face_index({}), FaceGallery)
+    assert isinstance(create_face_index({'FACE_INDEX': 'ivf'}), IVFIndex)
+    assert isinstance(create_face_index({'FACE_INDEX': 'unknown'}), FaceGallery)
+
+def test_service_scores_faces_against_roster(app):
+    from face_recognition_service import FaceRecognitionService
+    service = FaceRecognitionService(app)
+    encodings = random_encodings(3, seed=4) * 0.1
+    for number, encoding in enumerate(encodings):
+        service._store_encoding(f'S{number}', encoding)
+
+    faces = encodings[[2, 0]] + 0.001
+    scores = service._score_encodings(faces, top_k=1)
+    assert [matches[0][0] for matches in scores] == ['S2', 'S0']
+    assert all(matches[0][1] > 0.9 for matches in scores)
+
+    # Faces are only scored against the candidates given
+    scores = service._score_encodings(faces, top_k=3, candidate_ids=['S1', 'S2'], course_id=7)
+    assert scores[0][0][0] == 'S2'
+    assert {sid for sid, _ in scores[1]} <= {'S1', 'S2'}
+
+def test_service_applies_confidence_threshold(app):
+    from face_recognition_service import FaceRecognitionService
+    service = FaceRecognitionService(app)
+    service._store_encoding('S0', np.zeros(ENCODING_SIZE, dtype=np.float32))
+    far = np.full((1, ENCODING_SIZE), 0.1, dtype=np.float32)  # distance ~1.13
+    assert service._score_encodings(far) == [[]]
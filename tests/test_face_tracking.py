@@ -0,0 +1,46 @@
+import numpy as np
+from app import detect_faces
+from camera import Frame
+from face_tracking import PreviewFaceDetector, box_iou
+
+class FakeCascade:
+    """Finds one face at a fixed (downscaled) position"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def detectMultiScale(self, gray, **kwargs):
+        self.calls += 1
+        return [(40, 30, 20, 20)]
+
+def textured_frame(seq):
+    image = np.random.default_rng(0).integers(0, 255, (240, 320, 3), dtype=np.uint8)
+    return Frame(seq, float(seq), image)
+
+def test_box_iou():
+    assert box_iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert box_iou((0, 0, 10, 10), (20, 20, 10, 10)) == 0.0
+    assert box_iou((0, 0, 10, 10), (5, 0, 10, 10)) == 50 / 150
+
+def test_only_detection_frames_are_exact():
+    cascade = FakeCascade()
+    preview = PreviewFaceDetector(cascade, scale=0.5, target_fps=10, max_interval=3)
+    frames = [textured_frame(seq) for seq in range(1, 5)]
+
+    detect_faces(frames[0], cascade, preview, timed=False)
+    # Detection took longer than the frame budget, so after the next detection
+    # two frames in three are tracked
+    preview.frame_finished(1.0)
+    assert preview.interval == 3
+    for frame in frames[1:]:
+        detect_faces(frame, cascade, preview, timed=False)
+
+    assert [frame.faces_exact for frame in frames] == [True, True, False, False]
+    assert cascade.calls == 2
+    assert all(frame.faces == [(80, 60, 40, 40)] for frame in frames)
+
+def test_frames_without_preview_are_exact():
+    frame = textured_frame(1)
+    detect_faces(frame, FakeCascade())
+    assert frame.faces_exact
+    assert frame.faces == [(40, 30, 20, 20)]
@@ -0,0 +1,57 @@
+import threading
+import numpy as np
+from face_recognition_service import FaceRecognitionService
+from models import db, GalleryChange, GalleryVersion, Student
+
+def add_student(student_id, encoding):
+    student = Student(student_id=student_id, name=student_id, photo_path=f'uploads/students/{student_id}.jpg')
+    student.set_face_encoding(encoding)
+    db.session.add(student)
+    db.session.commit()
+    return student
+
+def encoding(value):
+    return np.full(128, value, dtype=np.float32)
+
+def test_concurrent_bumps_never_share_a_version(app):
+    other_versions = []
+
+    def other_worker():
+        with app.app_context():
+            other_versions.append(GalleryVersion.bump())
+            db.session.commit()
+
+    with app.app_context():
+        start = GalleryVersion.current()
+        mine = GalleryVersion.bump()
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        # The second writer waits for this transaction instead of reading the same counter
+        thread.join(0.3)
+        assert thread.is_alive()
+        db.session.commit()
+        thread.join(10)
+        assert sorted([mine] + other_versions) == [start + 1, start + 2]
+        assert GalleryVersion.current() == start + 2
+
+def test_changes_reach_other_workers(app):
+    with app.app_context():
+        first = FaceRecognitionService(app)
+        second = FaceRecognitionService(app)
+
+        student = add_student('S1', encoding(0.1))
+        first._add_student_encoding(student, encoding=encoding(0.1))
+        db.session.commit()
+        assert second.sync_gallery() == 1
+        np.testing.assert_array_equal(second.face_index.get('S1'), encoding(0.1))
+        assert second.sync_gallery() == 0
+
+        student.set_face_encoding(encoding(0.2))
+        first._add_student_encoding(student, encoding=encoding(0.2))
+        first.remove_student_encoding('S1')
+        db.session.commit()
+        second.sync_gallery()
+        assert second.face_index.get('S1') is None
+
+        versions = [change.version for change in GalleryChange.query.order_by(GalleryChange.id)]
+        assert versions == sorted(set(versions))
@@ -0,0 +1,74 @@
+import time
+import pytest
+import app as app_module
+from app import DummyFaceRecognitionService, get_face_service
+from face_recognition_service import FaceRecognitionService
+from models import db, Student
+
+def wait_for_state(client, state, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get('/readyz')
+        if response.json['status'] == state:
+            return response
+        time.sleep(0.02)
+    raise AssertionError(f"/readyz never reported {state}: {response.json}")
+
+@pytest.fixture
+def face_app(make_app):
+    return make_app(services=('face',), GALLERY_LOAD_ATTEMPTS=2, GALLERY_RETRY_DELAY=0.01,
+                    GALLERY_RETRY_MAX_DELAY=0.05)
+
+def test_readyz_reports_failed_load_until_it_recovers(face_app, monkeypatch):
+    failing = [True]
+    real_load = FaceRecognitionService.load_known_faces
+
+    def load_known_faces(self):
+        if failing[0]:
+            raise RuntimeError('database unavailable')
+        real_load(self)
+
+    monkeypatch.setattr(FaceRecognitionService, 'load_known_faces', load_known_faces)
+    face_app.extensions['services'].face_service = FaceRecognitionService(face_app, warm_up=True)
+    client = face_app.test_client()
+
+    response = wait_for_state(client, 'failed')
+    assert response.status_code == 503
+    assert response.json['progress']['error'] == 'database unavailable'
+    gated = client.post('/capture_attendance', json={})
+    assert gated.status_code == 503 and gated.json['status'] == 'failed'
+
+    # The load keeps being retried in the background
+    failing[0] = False
+    response = wait_for_state(client, 'ready')
+    assert response.status_code == 200
+    assert response.json['progress']['error'] is None
+
+def test_readyz_warming_up_before_the_service_exists(face_app, monkeypatch):
+    monkeypatch.setattr(app_module, 'initialize_services', lambda app: None)
+    response = face_app.test_client().get('/readyz')
+    assert response.status_code == 503
+    assert response.json['status'] == 'warming_up'
+
+def test_rebuild_encodings_skips_the_gallery_load(make_app, monkeypatch):
+    app = make_app(services=('face',))
+    monkeypatch.setattr(app_module, 'FACE_RECOGNITION_AVAILABLE', True)
+    monkeypatch.setattr(FaceRecognitionService, 'load_known_faces',
+                        lambda self: pytest.fail('gallery loaded before a forced rebuild'))
+    encoded = []
+    monkeypatch.setattr(FaceRecognitionService, 'bulk_encode_students',
+                        lambda self, students, workers=None, **kwargs: encoded.append(len(students)) or
+                        {'total': len(students), 'encoded': len(students), 'failed': [], 'seconds': 0.0})
+    with app.app_context():
+        db.session.add(Student(student_id='S1', name='Ann', photo_path='uploads/students/S1.jpg'))
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['face', 'rebuild-encodings'])
+    assert result.exit_code == 0, result.output
+    assert encoded == [1]
+
+def test_demo_service_accepts_progress(app):
+    service = get_face_service(app)
+    assert isinstance(service, DummyFaceRecognitionService)
+    seen = []
+    assert service.bulk_encode_students([], progress=seen.append)['total'] == 0
@@ -0,0 +1,62 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from models import db, RecognitionJob
+from recognition_jobs import JobQueueFull, RecognitionJobQueue
+
+def wait_for(jobs, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        record = jobs.get(job_id)
+        if record['status'] in ('done', 'failed'):
+            return record
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+@pytest.fixture
+def jobs(app):
+    queue = RecognitionJobQueue(app, workers=2, max_pending=4)
+    queue.start()
+    yield queue
+    queue.stop()
+
+def test_job_result_is_stored(jobs):
+    job_id = jobs.submit('add', lambda a, b: {'sum': a + b}, 2, b=3)
+    record = wait_for(jobs, job_id)
+    assert record['status'] == 'done'
+    assert record['result'] == {'sum': 5}
+    assert record['started_at'] and record['finished_at']
+    assert record['position'] is None
+
+def test_failed_job_records_error(jobs):
+    def boom():
+        raise RuntimeError('no faces')
+    record = wait_for(jobs, jobs.submit('boom', boom))
+    assert record['status'] == 'failed'
+    assert record['error'] == 'no faces'
+
+def test_unknown_job(jobs):
+    assert jobs.get('missing') is None
+
+def test_queued_jobs_report_position_and_fill_up(app):
+    queue = RecognitionJobQueue(app, workers=1, max_pending=2)  # not started
+    first = queue.submit('a', lambda: None)
+    second = queue.submit('b', lambda: None)
+    assert queue.get(first)['position'] == 0
+    assert queue.get(second)['position'] == 1
+    with pytest.raises(JobQueueFull):
+        queue.submit('c', lambda: None)
+
+def test_expired_and_lost_jobs_are_pruned(app):
+    queue = RecognitionJobQueue(app, result_ttl=60)
+    old = datetime.utcnow() - timedelta(seconds=120)
+    with app.app_context():
+        db.session.add(RecognitionJob(id='expired', name='x', status='done', submitted_at=old, finished_at=old))
+        db.session.add(RecognitionJob(id='lost', name='x', status='running', submitted_at=old))
+        db.session.commit()
+
+    queue.submit('fresh', lambda: None)
+    assert queue.get('expired') is None
+    lost = queue.get('lost')
+    assert lost['status'] == 'failed'
+    assert lost['error'] == 'Job was lost by its worker'
@@ -0,0 +1,32 @@
+import os
+import pytest
+from recognition_pool import RecognitionPool
+
+# Set in the test process only; a forked worker would inherit it
+PARENT_STATE = {'touched': False}
+
+def read_state():
+    return PARENT_STATE['touched']
+
+def crash():
+    os._exit(1)
+
+@pytest.fixture
+def pool():
+    pool = RecognitionPool(processes=1, max_queued=1)
+    yield pool
+    pool.shutdown()
+
+def test_workers_start_clean(pool):
+    PARENT_STATE['touched'] = True
+    try:
+        assert pool.run(read_state) is False
+    finally:
+        PARENT_STATE['touched'] = False
+    assert pool.status()['completed'] == 1
+
+def test_crashed_worker_is_replaced(pool):
+    with pytest.raises(Exception):
+        pool.run(crash)
+    assert pool.run(read_state) is False
+    assert pool.status()['restarts'] == 1
@@ -0,0 +1,79 @@
+import os
+import mmap
+import struct
+import numpy as np
+import pytest
+from shared_gallery import MIN_CAPACITY, SEQUENCE_OFFSET, SharedGalleryIndex, encode_student_id
+
+def encoding(value):
+    return np.full(128, value, dtype=np.float32)
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'face_gallery.bin')
+
+def test_changes_are_visible_to_other_workers(path):
+    writer, reader = SharedGalleryIndex(path), SharedGalleryIndex(path)
+    with writer.batch(reset=True):
+        for number in range(4):
+            writer.add(f'S{number}', encoding(number / 10))
+    assert len(reader) == 4
+    assert reader.published_by_sibling()
+    inode, version = os.stat(path).st_ino, reader.version
+
+    # Later edits are patched into the same file
+    writer.add('S1', encoding(0.9))
+    assert writer.remove('S0')
+    assert not writer.remove('S0')
+    assert os.stat(path).st_ino == inode
+    assert reader.version == version + 2
+    assert len(reader) == 3
+    assert reader.get('S0') is None
+    np.testing.assert_array_equal(reader.get('S1'), encoding(0.9))
+    np.testing.assert_array_equal(reader.get('S3'), encoding(0.3))
+    assert reader.search(encoding(0.3))[0][0][0] == 'S3'
+
+def test_returned_encodings_are_copies(path):
+    index = SharedGalleryIndex(path)
+    index.add('S1', encoding(0.1))
+    found = index.get('S1')
+    index.add('S1', encoding(0.5))
+    np.testing.assert_array_equal(found, encoding(0.1))
+
+def test_reset_batch_replaces_the_gallery(path):
+    index = SharedGalleryIndex(path)
+    index.add('S1', encoding(0.1))
+    with index.batch(reset=True):
+        index.add('S2', encoding(0.2))
+        assert index.get('S1') is None
+    assert SharedGalleryIndex(path).search(encoding(0.1))[0][0][0] == 'S2'
+    assert len(SharedGalleryIndex(path)) == 1
+
+def test_gallery_grows_past_its_capacity(path):
+    index = SharedGalleryIndex(path)
+    with index.batch():
+        for number in range(MIN_CAPACITY + 10):
+            index.add(f'S{number}', encoding(number / MIN_CAPACITY))
+    index.add('extra', encoding(2.0))
+    reader = SharedGalleryIndex(path)
+    assert len(reader) == MIN_CAPACITY + 11
+    np.testing.assert_array_equal(reader.get(f'S{MIN_CAPACITY + 9}'), encoding((MIN_CAPACITY + 9) / MIN_CAPACITY))
+
+def test_reader_repairs_file_left_mid_patch(path):
+    index = SharedGalleryIndex(path)
+    index.add('S1', encoding(0.1))
+    with open(path, 'r+b') as f:
+        mapped = mmap.mmap(f.fileno(), 0)
+        sequence = struct.unpack_from('<Q', mapped, SEQUENCE_OFFSET)[0]
+        struct.pack_into('<Q', mapped, SEQUENCE_OFFSET, sequence + 1)  # a writer died mid-patch
+        mapped.close()
+
+    reader = SharedGalleryIndex(path)
+    np.testing.assert_array_equal(reader.get('S1'), encoding(0.1))
+
+def test_long_student_ids_are_refused():
+    assert encode_student_id('S1') == b'S1'
+    with pytest.raises(ValueError):
+        encode_student_id('é' * 41)
+    with pytest.raises(ValueError):
+        encode_student_id('')
@@ -0,0 +1,40 @@
+import pytest
+import capture_sessions
+from capture_sessions import UploadLimiter
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(capture_sessions.time, 'monotonic', lambda: now[0])
+    return now
+
+def test_burst_is_capped_at_one_second(clock):
+    limiter = UploadLimiter(max_fps=5)
+    assert limiter.take(8) == 5
+    assert limiter.take(1) == 0
+    assert limiter.status() == {'max_fps': 5, 'accepted': 5, 'dropped': 4, 'rejected': 0}
+
+def test_bucket_refills_at_max_fps(clock):
+    limiter = UploadLimiter(max_fps=5)
+    limiter.take(5)
+    assert limiter.retry_after() == pytest.approx(0.2)
+    clock[0] += 0.5
+    assert limiter.take(5) == 2
+    clock[0] += 60
+    assert limiter.take(10) == 5
+
+def test_slow_rate_still_allows_one_frame(clock):
+    limiter = UploadLimiter(max_fps=0.5)
+    assert limiter.take(3) == 1
+    assert limiter.retry_after() == pytest.approx(2.0)
+    clock[0] += 2.0
+    assert limiter.take(1) == 1
+
+def test_one_upload_at_a_time():
+    limiter = UploadLimiter(max_fps=5)
+    assert limiter.try_begin()
+    assert not limiter.try_begin()
+    limiter.end()
+    assert limiter.try_begin()
+    limiter.end()
+    assert limiter.status()['rejected'] == 1
@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+from app import get_capture_session
+from camera import UploadedFrameStream
+from models import db, UploadSession
+
+def jpeg(height=48, width=64):
+    return cv2.imencode('.jpg', np.zeros((height, width, 3), dtype=np.uint8))[1].tobytes()
+
+def upload(client):
+    return client.post('/upload_frames', data=jpeg(), content_type='image/jpeg')
+
+def test_stream_is_shared_through_its_directory(tmp_path):
+    writer = UploadedFrameStream(str(tmp_path / 'room'))
+    reader = UploadedFrameStream(str(tmp_path / 'room'))
+    writer.start()
+    reader.start()
+    assert reader.latest() is None
+
+    def prepare(frame):
+        frame.faces = [(1, 2, 3, 4)]
+        frame.faces_exact = True
+
+    writer.push(np.full((4, 6, 3), 7, dtype=np.uint8), prepare)
+    reader.push(np.zeros((4, 6, 3), dtype=np.uint8))
+    frame = writer.wait_for_frame(after_seq=1, timeout=1.0)
+    assert frame.seq == 2 and frame.faces is None
+    late = UploadedFrameStream(str(tmp_path / 'room'))
+
+    writer.discard()
+    assert not reader.running
+    assert reader.wait_for_frame(after_seq=2, timeout=1.0) is None
+    assert reader.push(np.zeros((4, 6, 3), dtype=np.uint8)) is None
+    assert late.latest() is None
+
+def test_upload_session_is_served_by_every_worker(make_app):
+    first, second = make_app(), make_app()
+    first_client, second_client = first.test_client(), second.test_client()
+
+    started = first_client.post('/start_capture', json={'course_id': 1, 'source': 'upload'})
+    assert started.get_json()['upload'] is True
+
+    response = upload(second_client)
+    assert response.status_code == 200
+    assert response.get_json()['accepted'] == 1
+
+    with first.app_context():
+        frame = get_capture_session('default').camera.latest()
+    assert frame.seq == 1
+    assert frame.image.shape == (48, 64, 3)
+    assert frame.faces == [] and frame.faces_exact
+
+    assert second_client.post('/stop_capture', json={}).get_json()['status'] == 'success'
+    assert upload(first_client).status_code == 404
+    assert first_client.get('/capture_sessions').get_json()['sessions'] == []
+
+def test_restarted_session_starts_without_old_frames(make_app):
+    first, second = make_app(), make_app()
+    first_client, second_client = first.test_client(), second.test_client()
+    first_client.post('/start_capture', json={'course_id': 1, 'source': 'upload'})
+    upload(first_client)
+    with second.app_context():
+        assert get_capture_session('default').camera.latest().seq == 1
+
+    second_client.post('/stop_capture', json={})
+    second_client.post('/start_capture', json={'course_id': 2, 'source': 'upload'})
+    with first.app_context():
+        session = get_capture_session('default')
+        assert session.course_id == 2
+        assert session.camera.latest() is None
+        assert db.session.get(UploadSession, 'default').course_id == 2
@@ -1,4 +1,6 @@
-from app import app as application
+from app import create_app
+
+application = create_app()
 
 # Gunicorn looks for a WSGI callable named `application` by default.
 